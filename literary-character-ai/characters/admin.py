@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import LiteraryCharacter
+from .models import LiteraryCharacter, Task
 
 admin.site.register(LiteraryCharacter)
 
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_after', 'finished_at')
+    list_filter = ('status', 'name')
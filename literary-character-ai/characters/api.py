@@ -1,50 +1,203 @@
+import json
 import logging
-import os
+from dataclasses import dataclass
 from django.conf import settings
-from django.shortcuts import get_object_or_404
-from groq import Groq, RateLimitError, APIError, APIConnectionError
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from .completion_cache import completion_cache_key, get_cached_completion, store_completion
+from .greetings import pooled_reply
+from .history import history_page
+from .llm import LLMConnectionError, LLMError, LLMRateLimitError, get_backend
+from .metrics import CHAT_ERRORS, span
 from .models import LiteraryCharacter, Conversation, ChatMessage
+from .prompts import MAX_TOKENS_RESPONSE, build_prompt, history_candidates
+from .search import MAX_SEARCH_RESULTS_LIMIT, SEARCH_RESULTS_LIMIT, search_characters
+from .summaries import schedule_summary_update
+from .transfer import export_jsonl
+from .upstream import UpstreamBusyError
 
 logger = logging.getLogger(__name__)
 
-# --- Instantiate Groq Client ---
-# Attempts to initialize the Groq client using the GROQ_API_KEY environment variable.
-try:
-    groq_client = Groq()
-    logger.info("Groq client initialized successfully.")
-except APIError as e:
-    logger.error(f"Failed to initialize Groq client (API Error): {e}", exc_info=True)
-    groq_client = None # Set to None if initialization fails due to API issues (e.g., bad key format)
-except Exception as e:
-    # Catch other potential errors during initialization
-    logger.error(f"Unexpected error initializing Groq client: {e}", exc_info=True)
-    groq_client = None
-
 # --- API Configuration ---
-GROQ_MODEL = os.getenv("GROQ_MODEL", "llama3-8b-8192")
-MAX_HISTORY_MESSAGES = 50 # Number of previous messages to include in history
-MAX_TOKENS_RESPONSE = 200
+# The model and upstream service are configured with the LLM_BACKEND setting (see llm.py)
 TEMPERATURE = 0.7
 
+FALLBACK_RESPONSE_TEXT = "[The character seems lost for words.]"
+
+
+@dataclass
+class ChatTurn:
+    """
+    A chat exchange between loading the conversation and storing the reply.
+    Nothing is written to the database until _save_chat_turn().
+    """
+    conversation: Conversation # Unsaved for the user's first chat with the character
+    user_message: ChatMessage # Unsaved
+    start_new: bool
+    messages_for_api: list
+
+
+def _get_conversation(user, character_id):
+    """
+    Returns the user's conversation with the character, loading the
+    character in the same query, or a new unsaved conversation if there is
+    none yet. Raises LiteraryCharacter.DoesNotExist for unknown characters.
+    """
+    try:
+        return Conversation.objects.select_related('character').get(user=user, character_id=character_id)
+    except Conversation.DoesNotExist:
+        character = LiteraryCharacter.objects.get(pk=character_id)
+        return Conversation(user=user, character=character)
+
+
+def _start_chat_turn(user, character_id, user_message_text, start_new):
+    """
+    Loads the conversation and builds the message payload for the LLM API.
+
+    Returns a ChatTurn.
+    """
+    with span('db_load'):
+        conversation = _get_conversation(user, character_id)
+
+        # Prepare message history for the API prompt, unless the conversation is new or being restarted
+        candidates = []
+        if conversation.pk is not None and not start_new:
+            candidates = list(history_candidates(conversation))
+
+    return _prepare_chat_turn(conversation, candidates, user_message_text, start_new)
+
+
+def _prepare_chat_turn(conversation, candidates, user_message_text, start_new):
+    """
+    Builds the prompt from the history candidates and, once
+    CHAT_SUMMARY_BATCH_MESSAGES or more of them no longer fit, schedules
+    folding them into the conversation's rolling summary.
+
+    Returns a ChatTurn.
+    """
+    with span('prompt_build'):
+        summary = '' if start_new else conversation.summary
+        messages_for_api, history_window = build_prompt(conversation.character, candidates, user_message_text, summary)
+    if len(candidates) - len(history_window) >= settings.CHAT_SUMMARY_BATCH_MESSAGES:
+        # Candidates are newest first; everything older than the window is summarized
+        window_start_id = history_window[0].id if history_window else candidates[0].id + 1
+        schedule_summary_update(conversation.id, window_start_id)
+
+    user_message = ChatMessage(conversation=conversation, message_text=user_message_text, is_user_message=True)
+    return ChatTurn(conversation, user_message, start_new, messages_for_api)
+
+
+def _save_chat_turn(turn, ai_response_text):
+    """
+    Stores the user's message and the character's reply in one transaction:
+    a single bulk INSERT for both messages, then a single UPDATE of the
+    conversation's counters and last_updated. A restarted conversation loses
+    its old messages in the same transaction.
+
+    Returns the saved conversation.
+    """
+    conversation = turn.conversation
+    with span('db_save'), transaction.atomic():
+        if conversation.pk is None:
+            # get_or_create, in case a concurrent first message created it meanwhile
+            conversation, _ = Conversation.objects.get_or_create(user=conversation.user, character=conversation.character)
+        elif turn.start_new:
+            logger.info(f"Starting new conversation {conversation.id} with Character: {conversation.character.name}. Deleting old messages.")
+            conversation.messages.all().delete()
+            conversation.archives.all().delete()
+
+        turn.user_message.conversation = conversation
+        ai_message = ChatMessage(conversation=conversation, message_text=ai_response_text, is_user_message=False)
+        # Both messages may get the same timestamp; their IDs keep them in order
+        ChatMessage.objects.bulk_create([turn.user_message, ai_message])
+        conversation.messages_added(turn.user_message, ai_message, restarted=turn.start_new)
+    return conversation
+
+
+def _local_reply(character, messages_for_api, cache_key):
+    """
+    Returns a reply that needs no upstream call, or None: the greeting pool's
+    reply to a common first message (see greetings.py), else a completion
+    cache hit for cache_key.
+    """
+    text = pooled_reply(character, messages_for_api)
+    if text is not None:
+        return text
+    return get_cached_completion(cache_key)
+
+
+def _get_llm_backend():
+    """
+    Returns the configured LLM backend, or None if it cannot be initialized
+    (e.g. a missing API key). Initialization is retried on the next request.
+    """
+    try:
+        return get_backend()
+    except Exception as e:
+        logger.error(f"Failed to initialize LLM backend: {e}", exc_info=True)
+        return None
+
+
+def _service_unavailable_details():
+    logger.error("LLM backend is not available. Cannot process chat request.")
+    return {'error': 'Chat service configuration error. Please contact support.'}, status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def _error_class(e):
+    """Label of an LLMError in the inkpersona_chat_errors_total metric."""
+    if isinstance(e, UpstreamBusyError):
+        return 'busy' # Rejected by our own limiter, not the upstream
+    if isinstance(e, LLMRateLimitError):
+        return 'rate_limit'
+    if isinstance(e, LLMConnectionError):
+        return 'connection'
+    if e.status_code == 401:
+        return 'auth'
+    return 'upstream'
+
+
+def _upstream_error_details(e):
+    """
+    Maps an LLMError to the error payload and HTTP status code returned to
+    the frontend, counting it by error class.
+    """
+    CHAT_ERRORS.inc(error=_error_class(e))
+    if isinstance(e, LLMRateLimitError):
+        logger.error(f"LLM Rate Limit Error: {e}", exc_info=True)
+        return {'error': 'Chat service is busy. Please try again later.'}, status.HTTP_429_TOO_MANY_REQUESTS
+    if isinstance(e, LLMConnectionError):
+        logger.error(f"LLM API Connection Error: {e}", exc_info=True)
+        return {'error': 'Could not connect to the chat service. Please check your connection and try again.'}, status.HTTP_504_GATEWAY_TIMEOUT
+    logger.error(f"LLM API Error: {e}", exc_info=True)
+    if e.status_code == 401:
+         return {'error': 'Chat service authentication failed. Please contact support.'}, status.HTTP_401_UNAUTHORIZED
+    return {'error': f'Chat service API error: {e.message}'}, status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def _upstream_error_response(e):
+    """Wraps _upstream_error_details in a DRF Response."""
+    error_payload, status_code = _upstream_error_details(e)
+    return Response(error_payload, status=status_code)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def chat_with_character(request):
     """
-    Handles chat requests by sending the prompt and history to the Groq API
-    and returning the character's response.
+    Handles chat requests by sending the prompt and history to the configured
+    LLM backend and returning the character's response.
     """
-    # Check if Groq client was initialized successfully
-    if groq_client is None:
-        logger.error("Groq client is not available. Cannot process chat request.")
-        return Response(
-            {'error': 'Chat service configuration error. Please contact support.'},
-            status=status.HTTP_503_SERVICE_UNAVAILABLE
-        )
+    # Check if the LLM backend could be initialized
+    backend = _get_llm_backend()
+    if backend is None:
+        return Response(*_service_unavailable_details())
 
     try:
         data = request.data
@@ -59,95 +212,44 @@ def chat_with_character(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        character = get_object_or_404(LiteraryCharacter, pk=character_id)
-
-        # Get or create the conversation object
-        conversation, created = Conversation.objects.get_or_create(user=user, character=character)
+        turn = _start_chat_turn(user, character_id, user_message_text, start_new)
+        character, messages_for_api = turn.conversation.character, turn.messages_for_api
 
-        # Handle request to start a new conversation by deleting old messages
-        if start_new and not created:
-            logger.info(f"Starting new conversation for User: {user.email}, Character: {character.name}. Deleting old messages.")
-            conversation.messages.all().delete()
-            # Ensure 'created' reflects the state after potential deletion for history fetching
-            created = True # Treat as created for history logic below
-
-        # Save the user's current message *after* potential deletion
-        ChatMessage.objects.create(
-            conversation=conversation,
-            message_text=user_message_text,
-            is_user_message=True
-        )
-
-        # Prepare message history for the API prompt
-        history_for_prompt = []
-        if not created: # Only fetch history if it wasn't a newly created or cleared conversation
-            # Fetch up to MAX_HISTORY_MESSAGES previous messages, excluding the one just saved
-            history_messages = conversation.messages.order_by('-timestamp')[1:MAX_HISTORY_MESSAGES + 1]
-            # Reverse to maintain chronological order for the prompt
-            for msg in reversed(history_messages):
-                role = "user" if msg.is_user_message else "assistant"
-                history_for_prompt.append({"role": role, "content": msg.message_text})
-
-        # Define the system prompt for the character persona
-        system_message = f"""\
-You are embodying the character {character.name} from the book "{character.book}" by {character.author}.
-Your task is to speak, act, and think *only* as {character.name}, fully adopting their personality, speech patterns, knowledge, and mannerisms as described below. Do not break character. Do not act as an AI assistant.
-
-Character Background: {character.description}
-
-Respond concisely (1-2 paragraphs) based on this persona. If asked about events beyond the book's narrative, you may speculate based on the character's personality, but clarify that this is outside the original story."""
+        ai_response_text = ""
 
-        # Construct the messages payload for the Groq API
-        messages_for_api = [
-            {"role": "system", "content": system_message},
-            *history_for_prompt,
-            {"role": "user", "content": user_message_text}
-        ]
+        # Serve repeated prompts from the completion cache when the character allows it
+        cache_key = completion_cache_key(character, backend.model, messages_for_api, TEMPERATURE)
+        cached_response_text = _local_reply(character, messages_for_api, cache_key)
+        if cached_response_text is not None:
+            logger.info(f"Reply for character {character_id} served without an upstream call")
+            ai_response_text = cached_response_text
+        else:
+            # Call the LLM backend
+            logger.info(f"Calling LLM API (model: {backend.model}) for character {character_id} (User: {user.email})...")
+            try:
+                with span('upstream'):
+                    completion = backend.complete(messages_for_api, temperature=TEMPERATURE, max_tokens=MAX_TOKENS_RESPONSE)
+                # Extract the response content
+                if completion.text:
+                    ai_response_text = completion.text
+                    store_completion(cache_key, ai_response_text)
+                    logger.info(f"LLM API response received for character {character_id}")
+                else:
+                    logger.warning(f"LLM API returned no content for character {character_id}")
+                    ai_response_text = FALLBACK_RESPONSE_TEXT # Fallback message
 
-        ai_response_text = ""
+            # Handle specific upstream API errors
+            except LLMError as e:
+                return _upstream_error_response(e)
+            # Handle any other unexpected errors during the API call
+            except Exception as e:
+                logger.error(f"Unexpected error during LLM API call: {e}", exc_info=True)
+                CHAT_ERRORS.inc(error='unexpected')
+                return Response({'error': 'An unexpected error occurred while communicating with the chat service.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        # Call the Groq API
-        logger.info(f"Calling Groq API (model: {GROQ_MODEL}) for character {character_id} (User: {user.email})...")
-        try:
-            chat_completion = groq_client.chat.completions.create(
-                messages=messages_for_api,
-                model=GROQ_MODEL,
-                temperature=TEMPERATURE,
-                max_tokens=MAX_TOKENS_RESPONSE,
-            )
-            # Extract the response content
-            if chat_completion.choices:
-                ai_response_text = chat_completion.choices[0].message.content.strip()
-                logger.info(f"Groq API response received for character {character_id}")
-            else:
-                logger.warning(f"Groq API returned no choices for character {character_id}")
-                ai_response_text = "[The character seems lost for words.]" # Fallback message
-
-        # Handle specific Groq API errors
-        except RateLimitError as e:
-            logger.error(f"Groq Rate Limit Error: {e}", exc_info=True)
-            return Response({'error': 'Chat service is busy. Please try again later.'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
-        except APIConnectionError as e:
-            logger.error(f"Groq API Connection Error: {e}", exc_info=True)
-            return Response({'error': 'Could not connect to the chat service. Please check your connection and try again.'}, status=status.HTTP_504_GATEWAY_TIMEOUT)
-        except APIError as e:
-            logger.error(f"Groq API Error: {e}", exc_info=True)
-            if hasattr(e, 'status_code') and e.status_code == 401:
-                 return Response({'error': 'Chat service authentication failed. Please contact support.'}, status=status.HTTP_401_UNAUTHORIZED)
-            error_message = getattr(e, 'message', str(e))
-            return Response({'error': f'Chat service API error: {error_message}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-        # Handle any other unexpected errors during the API call
-        except Exception as e:
-            logger.error(f"Unexpected error during Groq API call: {e}", exc_info=True)
-            return Response({'error': 'An unexpected error occurred while communicating with the chat service.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # Save the AI's response to the database if received
+        # Save the user's message and the AI's response to the database if received
         if ai_response_text:
-            ChatMessage.objects.create(
-                conversation=conversation,
-                message_text=ai_response_text,
-                is_user_message=False
-            )
+            _save_chat_turn(turn, ai_response_text)
             logger.info(f"Saved AI response for character {character_id} (User: {user.email})")
         else:
              # Log if no text was generated or extracted
@@ -166,3 +268,220 @@ Respond concisely (1-2 paragraphs) based on this persona. If asked about events
         logger.error(f"General error in chat processing for character ID {character_id_for_log} (User: {request.user.email}): {e}", exc_info=True)
         return Response({'error': 'An internal server error occurred.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+class EventStreamRenderer(JSONRenderer):
+    """
+    Lets chat_with_character_stream accept `Accept: text/event-stream`, as
+    the chat page and other SSE clients send. The reply itself is a
+    StreamingHttpResponse that bypasses renderers; errors returned before
+    the stream starts keep their JSON body.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+
+def _sse_event(event, data):
+    """Formats a single Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _cached_token_stream(text):
+    """Replays a cached reply as a single-chunk token stream."""
+    yield text
+
+
+def _stream_completion(token_stream, turn, character_id, user, cache_key=None):
+    """
+    Relays streamed completion chunks to the client as SSE frames.
+
+    The chat turn is saved once the stream ends, and the reply cached under
+    cache_key if one is given. If the client disconnects mid-stream the server
+    closes this generator, and whatever was received so far is still saved
+    (but not cached) so the conversation history stays consistent.
+    """
+    received_chunks = []
+    finished = False
+    try:
+        with span('upstream_stream'):
+            for token in token_stream:
+                received_chunks.append(token)
+                yield _sse_event('token', {'text': token})
+
+        finished = True
+        if not ''.join(received_chunks).strip():
+            logger.warning(f"LLM API stream returned no content for character {character_id}")
+            received_chunks = [FALLBACK_RESPONSE_TEXT]
+            yield _sse_event('token', {'text': FALLBACK_RESPONSE_TEXT})
+        else:
+            store_completion(cache_key, ''.join(received_chunks).strip())
+        logger.info(f"LLM API stream completed for character {character_id}")
+        yield _sse_event('done', {'response': ''.join(received_chunks).strip()})
+
+    # Errors after the response has started can only be reported in-band
+    except LLMError as e:
+        error_payload, _ = _upstream_error_details(e)
+        yield _sse_event('error', error_payload)
+    except Exception as e:
+        logger.error(f"Unexpected error while streaming LLM response: {e}", exc_info=True)
+        CHAT_ERRORS.inc(error='unexpected')
+        yield _sse_event('error', {'error': 'An unexpected error occurred while communicating with the chat service.'})
+
+    finally:
+        token_stream.close()
+        ai_response_text = ''.join(received_chunks).strip()
+        if ai_response_text:
+            _save_chat_turn(turn, ai_response_text)
+            if finished:
+                logger.info(f"Saved streamed AI response for character {character_id} (User: {user.email})")
+            else:
+                logger.info(f"Saved partial streamed AI response for character {character_id} (User: {user.email})")
+        else:
+            logger.warning(f"No AI response text streamed for character {character_id} (User: {user.email}); chat turn not saved")
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer])
+def chat_with_character_stream(request):
+    """
+    Streaming variant of chat_with_character.
+
+    Forwards the character's response token by token as Server-Sent Events
+    ('token' frames, then a final 'done' or 'error' frame) so the frontend can
+    render the reply while it is still being generated.
+    """
+    backend = _get_llm_backend()
+    if backend is None:
+        return Response(*_service_unavailable_details())
+
+    try:
+        data = request.data
+        character_id = data.get('character_id')
+        user_message_text = data.get('message')
+        start_new = data.get('start_new', False)
+        user = request.user
+
+        if not character_id or not user_message_text:
+            return Response(
+                {'error': 'Missing required fields: character_id or message'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        turn = _start_chat_turn(user, character_id, user_message_text, start_new)
+        character, messages_for_api = turn.conversation.character, turn.messages_for_api
+
+        cache_key = completion_cache_key(character, backend.model, messages_for_api, TEMPERATURE)
+        cached_response_text = _local_reply(character, messages_for_api, cache_key)
+        if cached_response_text is not None:
+            logger.info(f"Reply for character {character_id} served without an upstream call")
+            token_stream = _cached_token_stream(cached_response_text)
+            cache_key = None # Already cached
+        else:
+            # Open the stream before responding so connection and auth errors still
+            # map to a regular HTTP error status
+            logger.info(f"Calling LLM API with streaming (model: {backend.model}) for character {character_id} (User: {user.email})...")
+            try:
+                with span('upstream'):
+                    token_stream = backend.stream(messages_for_api, temperature=TEMPERATURE, max_tokens=MAX_TOKENS_RESPONSE)
+            except LLMError as e:
+                return _upstream_error_response(e)
+            except Exception as e:
+                logger.error(f"Unexpected error during LLM API call: {e}", exc_info=True)
+                CHAT_ERRORS.inc(error='unexpected')
+                return Response({'error': 'An unexpected error occurred while communicating with the chat service.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        response = StreamingHttpResponse(
+            _stream_completion(token_stream, turn, character_id, user, cache_key),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no' # Disable proxy buffering (e.g. nginx) so tokens flush immediately
+        return response
+
+    except LiteraryCharacter.DoesNotExist:
+        logger.warning(f"Character not found for ID: {request.data.get('character_id')} requested by user {request.user.email}")
+        return Response({'error': 'Character not found'}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        character_id_for_log = request.data.get('character_id', 'Unknown')
+        logger.error(f"General error in chat processing for character ID {character_id_for_log} (User: {request.user.email}): {e}", exc_info=True)
+        return Response({'error': 'An internal server error occurred.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def chat_history(request, character_id):
+    """
+    Returns a page of the user's conversation with a character, oldest
+    message first, for loading older messages on the chat page.
+
+    Pass the next_cursor of a page as ?before= to get the page preceding
+    it; next_cursor is null once the start of the conversation is reached.
+    """
+    conversation = Conversation.objects.filter(user=request.user, character_id=character_id).first()
+    if conversation is None:
+        return Response({'messages': [], 'next_cursor': None}, status=status.HTTP_200_OK)
+
+    try:
+        messages, next_cursor = history_page(conversation, before=request.query_params.get('before'))
+    except ValueError:
+        return Response({'error': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'messages': [
+            {
+                'id': message.id,
+                'text': message.message_text,
+                'is_user_message': message.is_user_message,
+                'timestamp': message.timestamp,
+            }
+            for message in messages
+        ],
+        'next_cursor': next_cursor,
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_conversations(request):
+    """
+    Downloads all of the user's conversations as JSON Lines (see transfer.py),
+    streamed as they are read so large histories don't build up in memory.
+    """
+    response = StreamingHttpResponse(export_jsonl(user=request.user), content_type='application/x-ndjson; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="inkpersona-conversations.jsonl"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search(request):
+    """
+    Searches the character catalog, best match first.
+
+    ?q= matches every word against name, book, author, description and tags
+    (as prefixes), ?tag= keeps only characters with that tag, and ?limit=
+    caps the number of results.
+    """
+    try:
+        limit = min(int(request.query_params.get('limit', SEARCH_RESULTS_LIMIT)), MAX_SEARCH_RESULTS_LIMIT)
+    except ValueError:
+        return Response({'error': 'Invalid limit.'}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1:
+        return Response({'error': 'Invalid limit.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    characters = search_characters(request.query_params.get('q', ''), tag=request.query_params.get('tag'), limit=limit)
+    return Response({
+        'results': [
+            {
+                'id': character.id,
+                'name': character.name,
+                'book': character.book,
+                'author': character.author,
+                'tags': character.tags,
+                'image': character.image.url if character.image else None,
+                'rank': character.rank,
+            }
+            for character in characters
+        ],
+    }, status=status.HTTP_200_OK)
@@ -14,10 +14,11 @@ class CharactersConfig(AppConfig):
     def ready(self):
         """
         Called once when Django starts.
-        Currently skips local model loading as an external API (Groq) is used.
+        Skips local model loading as an external API (Groq) is used, and
+        registers the app's signal handlers.
         """
         # Log that local model loading is skipped
         logger.info("Skipping local model loading (using Groq´s external API).")
-        # No other startup actions needed here for now
-        pass
+        # Connect signal handlers that keep derived caches in sync with the models
+        from . import signals  # noqa: F401
 
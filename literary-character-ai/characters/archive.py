@@ -0,0 +1,187 @@
+"""
+Archive tier and retention for chat messages.
+
+Only the newest messages of a conversation are read when chatting: the
+prompt takes at most MAX_HISTORY_MESSAGES, and older ones are folded into
+the rolling summary (summaries.py). `manage.py archive_messages` moves
+messages that are already part of the summary and older than
+CHAT_ARCHIVE_AFTER_DAYS out of ChatMessage into MessageArchive rows, each a
+zlib-compressed JSON blob of up to ARCHIVE_CHUNK_MESSAGES consecutive
+messages. Only the oldest messages of a conversation are archived, so the
+archive always precedes what is left in ChatMessage. Archived messages keep
+their IDs and timestamps, and history_page() reads them back when scrolling
+past the oldest message left in ChatMessage, so pages and cursors are
+unchanged.
+
+`manage.py purge_messages` deletes messages older than CHAT_RETENTION_DAYS
+from both tiers, then conversations idle since before then. It works in
+batches of a bounded number of rows, one short transaction each, so chat
+traffic is never blocked for long.
+"""
+import json
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+
+from .models import Conversation, ChatMessage, MessageArchive
+
+ARCHIVE_CHUNK_MESSAGES = 500
+ARCHIVE_COMPRESSION_LEVEL = 6
+PURGE_BATCH_SIZE = 1000
+
+
+def encode_messages(messages):
+    """Compresses messages (oldest first) into a MessageArchive.data blob."""
+    records = [[m.id, m.is_user_message, m.timestamp.isoformat(), m.message_text] for m in messages]
+    return zlib.compress(json.dumps(records, ensure_ascii=False, separators=(',', ':')).encode(), ARCHIVE_COMPRESSION_LEVEL)
+
+
+def decode_messages(archive):
+    """The unsaved ChatMessages stored in archive, oldest first."""
+    return [
+        ChatMessage(
+            id=message_id, conversation_id=archive.conversation_id, message_text=text,
+            is_user_message=is_user_message, timestamp=datetime.fromisoformat(timestamp),
+        )
+        for message_id, is_user_message, timestamp, text in json.loads(zlib.decompress(archive.data))
+    ]
+
+
+def archived_messages(conversation, before=None, limit=None):
+    """
+    Up to limit archived messages of conversation preceding the (timestamp,
+    id) position before, or the newest ones if before is None, newest first.
+    Blobs are loaded one at a time, only as far back as needed.
+    """
+    if not conversation.archived_messages:
+        return []
+    archives = conversation.archives.order_by('-last_timestamp', '-last_message_id')
+    if before is not None:
+        timestamp, message_id = before
+        archives = archives.filter(Q(first_timestamp__lt=timestamp) | Q(first_timestamp=timestamp, first_message_id__lt=message_id))
+
+    found = []
+    for archive in archives.iterator(chunk_size=1):
+        for message in reversed(decode_messages(archive)):
+            if before is None or (message.timestamp, message.id) < before:
+                found.append(message)
+                if len(found) == limit:
+                    return found
+    return found
+
+
+def archive_conversation(conversation_id, cutoff, chunk_size=ARCHIVE_CHUNK_MESSAGES):
+    """
+    Moves the oldest messages of a conversation that were sent before cutoff
+    and folded into its summary to MessageArchive blobs, one transaction per
+    blob. Returns (messages archived, blobs written, bytes before compression,
+    bytes after).
+    """
+    stats = [0, 0, 0, 0]
+    while True:
+        with transaction.atomic():
+            summarized_up_to = (
+                Conversation.objects.filter(pk=conversation_id).values_list('summarized_up_to', flat=True).first()
+            )
+            if summarized_up_to is None:
+                return tuple(stats)
+            messages = ChatMessage.objects.filter(conversation_id=conversation_id).order_by('timestamp', 'id')
+            # The first message that has to stay; everything before it can go
+            boundary = messages.filter(Q(timestamp__gte=cutoff) | Q(id__gt=summarized_up_to)).values_list('timestamp', 'id').first()
+            if boundary is not None:
+                messages = messages.filter(Q(timestamp__lt=boundary[0]) | Q(timestamp=boundary[0], id__lt=boundary[1]))
+            chunk = list(messages[:chunk_size])
+            if not chunk:
+                return tuple(stats)
+
+            deleted, _ = ChatMessage.objects.filter(id__in=[message.id for message in chunk]).delete()
+            if deleted != len(chunk):
+                # The conversation was restarted meanwhile; its messages are gone already
+                transaction.set_rollback(True)
+                return tuple(stats)
+            data = encode_messages(chunk)
+            MessageArchive.objects.create(
+                conversation_id=conversation_id,
+                first_timestamp=chunk[0].timestamp, first_message_id=chunk[0].id,
+                last_timestamp=chunk[-1].timestamp, last_message_id=chunk[-1].id,
+                message_count=len(chunk), data=data,
+            )
+            Conversation.objects.filter(pk=conversation_id).update(archived_messages=F('archived_messages') + len(chunk))
+
+        stats[0] += len(chunk)
+        stats[1] += 1
+        stats[2] += sum(len(message.message_text.encode()) for message in chunk)
+        stats[3] += len(data)
+
+
+def _subtract_counts(counts, archived=False):
+    """Lowers message_count (and archived_messages) of conversations by the given numbers, in one UPDATE."""
+    if not counts:
+        return
+    update = {'message_count': Case(*(When(pk=pk, then=F('message_count') - count) for pk, count in counts.items()))}
+    if archived:
+        update['archived_messages'] = Case(
+            *(When(pk=pk, then=F('archived_messages') - count) for pk, count in counts.items())
+        )
+    Conversation.objects.filter(pk__in=counts).update(**update)
+
+
+def purge_before(cutoff, batch_size=PURGE_BATCH_SIZE, pause=0):
+    """
+    Deletes messages sent before cutoff, in ChatMessage and in the archive,
+    then conversations last updated before cutoff, at most batch_size rows
+    per transaction, sleeping pause seconds between transactions. An archive
+    blob is deleted once its newest message is past the cutoff. Returns the
+    number of messages, archive blobs and conversations deleted.
+    """
+    stats = {'messages': 0, 'archives': 0, 'conversations': 0}
+
+    while True:
+        with transaction.atomic():
+            # In ID order, which follows time: each batch reads little beyond the rows it deletes
+            # Locked so a concurrent restart can't delete them (and reset the counts) first
+            rows = list(
+                ChatMessage.objects.select_for_update().filter(timestamp__lt=cutoff).order_by('id')
+                .values_list('id', 'conversation_id')[:batch_size]
+            )
+            if not rows:
+                break
+            ChatMessage.objects.filter(id__in=[message_id for message_id, _ in rows]).delete()
+            _subtract_counts(Counter(conversation_id for _, conversation_id in rows))
+        stats['messages'] += len(rows)
+        time.sleep(pause)
+
+    # Blobs hold up to ARCHIVE_CHUNK_MESSAGES messages each
+    archive_batch = max(1, batch_size // ARCHIVE_CHUNK_MESSAGES)
+    while True:
+        with transaction.atomic():
+            rows = list(
+                MessageArchive.objects.select_for_update().filter(last_timestamp__lt=cutoff).order_by('id')
+                .values_list('id', 'conversation_id', 'message_count')[:archive_batch]
+            )
+            if not rows:
+                break
+            MessageArchive.objects.filter(id__in=[archive_id for archive_id, _, _ in rows]).delete()
+            counts = Counter()
+            for _, conversation_id, message_count in rows:
+                counts[conversation_id] += message_count
+            _subtract_counts(counts, archived=True)
+        stats['archives'] += len(rows)
+        stats['messages'] += sum(counts.values())
+        time.sleep(pause)
+
+    while True:
+        with transaction.atomic():
+            # Their messages are all older than last_updated, so already deleted above
+            ids = list(Conversation.objects.filter(last_updated__lt=cutoff).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            Conversation.objects.filter(id__in=ids, last_updated__lt=cutoff).delete() # Unless a message just arrived
+        stats['conversations'] += len(ids)
+        time.sleep(pause)
+
+    return stats
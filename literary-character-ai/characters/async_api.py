@@ -0,0 +1,260 @@
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from rest_framework import status
+
+from .api import (
+    TEMPERATURE, FALLBACK_RESPONSE_TEXT,
+    _get_llm_backend, _prepare_chat_turn, _save_chat_turn, _service_unavailable_details, _sse_event,
+    _upstream_error_details,
+)
+from .completion_cache import aget_cached_completion, astore_completion, completion_cache_key
+from .greetings import pooled_reply
+from .llm import LLMError
+from .metrics import CHAT_ERRORS, span
+from .models import LiteraryCharacter, Conversation
+from .prompts import MAX_TOKENS_RESPONSE, history_candidates
+
+logger = logging.getLogger(__name__)
+
+# Async counterparts of the views in api.py. When the project is served through
+# asgi.py, these await the upstream call and the database instead of holding a
+# worker thread, so a single process can keep many conversations in flight.
+
+
+def _service_unavailable_response():
+    error_payload, status_code = _service_unavailable_details()
+    return JsonResponse(error_payload, status=status_code)
+
+
+async def _alocal_reply(character, messages_for_api, cache_key):
+    """Async version of api._local_reply."""
+    text = pooled_reply(character, messages_for_api)
+    if text is not None:
+        return text
+    return await aget_cached_completion(cache_key)
+
+
+def _parse_chat_request(request):
+    """
+    Reads the chat payload from a JSON or form-encoded body, mirroring what
+    DRF's request.data accepts for the sync views.
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+async def _astart_chat_turn(user, character_id, user_message_text, start_new):
+    """
+    Async version of api._start_chat_turn using Django's async ORM interface.
+
+    Returns a ChatTurn.
+    """
+    with span('db_load'):
+        try:
+            conversation = await Conversation.objects.select_related('character').aget(user=user, character_id=character_id)
+        except Conversation.DoesNotExist:
+            character = await LiteraryCharacter.objects.aget(pk=character_id)
+            conversation = Conversation(user=user, character=character)
+
+        candidates = []
+        if conversation.pk is not None and not start_new:
+            candidates = [msg async for msg in history_candidates(conversation)]
+
+    # The system prompt cache lookup may hit a shared cache backend synchronously
+    return await sync_to_async(_prepare_chat_turn)(conversation, candidates, user_message_text, start_new)
+
+
+async def _aprepare_chat(request):
+    """
+    Shared request handling for the async views: authentication, payload
+    validation and the database work before the upstream call.
+
+    Returns (user, chat_turn, None) on success or a tuple ending in an error
+    response when the request cannot be processed.
+    The returned user must be used instead of request.user, whose lazy loading
+    would hit the database synchronously.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        # Same status and body DRF's IsAuthenticated produces for session auth
+        return user, None, JsonResponse(
+            {'detail': 'Authentication credentials were not provided.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    data = _parse_chat_request(request)
+    if data is None:
+        return user, None, JsonResponse({'error': 'Malformed request body.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    character_id = data.get('character_id')
+    user_message_text = data.get('message')
+    start_new = data.get('start_new', False)
+
+    if not character_id or not user_message_text:
+        return user, None, JsonResponse(
+            {'error': 'Missing required fields: character_id or message'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        turn = await _astart_chat_turn(user, character_id, user_message_text, start_new)
+    except (LiteraryCharacter.DoesNotExist, ValueError):
+        logger.warning(f"Character not found for ID: {character_id} requested by user {user.email}")
+        return user, None, JsonResponse({'error': 'Character not found'}, status=status.HTTP_404_NOT_FOUND)
+    return user, turn, None
+
+
+@require_POST
+async def achat_with_character(request):
+    """
+    Async version of api.chat_with_character: same payload, same responses.
+    """
+    backend = _get_llm_backend()
+    if backend is None:
+        return _service_unavailable_response()
+
+    try:
+        user, turn, error_response = await _aprepare_chat(request)
+        if error_response is not None:
+            return error_response
+        character, messages_for_api = turn.conversation.character, turn.messages_for_api
+
+        cache_key = completion_cache_key(character, backend.model, messages_for_api, TEMPERATURE)
+        ai_response_text = await _alocal_reply(character, messages_for_api, cache_key)
+        if ai_response_text is not None:
+            logger.info(f"Reply for character {character.id} served without an upstream call")
+        else:
+            logger.info(f"Calling LLM API asynchronously (model: {backend.model}) for character {character.id} (User: {user.email})...")
+            try:
+                with span('upstream'):
+                    completion = await backend.acomplete(messages_for_api, temperature=TEMPERATURE, max_tokens=MAX_TOKENS_RESPONSE)
+                if completion.text:
+                    ai_response_text = completion.text
+                    await astore_completion(cache_key, ai_response_text)
+                    logger.info(f"LLM API response received for character {character.id}")
+                else:
+                    logger.warning(f"LLM API returned no content for character {character.id}")
+                    ai_response_text = FALLBACK_RESPONSE_TEXT
+            except LLMError as e:
+                error_payload, status_code = _upstream_error_details(e)
+                return JsonResponse(error_payload, status=status_code)
+            except Exception as e:
+                logger.error(f"Unexpected error during LLM API call: {e}", exc_info=True)
+                CHAT_ERRORS.inc(error='unexpected')
+                return JsonResponse({'error': 'An unexpected error occurred while communicating with the chat service.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if ai_response_text:
+            # transaction.atomic() has no async interface yet
+            await sync_to_async(_save_chat_turn)(turn, ai_response_text)
+            logger.info(f"Saved AI response for character {character.id} (User: {user.email})")
+        else:
+            logger.warning(f"No valid AI response text received or generated for character {character.id} (User: {user.email})")
+
+        return JsonResponse({'response': ai_response_text}, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.error(f"General error in async chat processing: {e}", exc_info=True)
+        return JsonResponse({'error': 'An internal server error occurred.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def _acached_token_stream(text):
+    yield text
+
+
+async def _astream_completion(token_stream, turn, character_id, user, cache_key=None):
+    """
+    Async version of api._stream_completion. Under ASGI a client disconnect
+    cancels this generator, and the partial reply is saved in the same way.
+    """
+    received_chunks = []
+    finished = False
+    try:
+        with span('upstream_stream'):
+            async for token in token_stream:
+                received_chunks.append(token)
+                yield _sse_event('token', {'text': token})
+
+        finished = True
+        if not ''.join(received_chunks).strip():
+            logger.warning(f"LLM API stream returned no content for character {character_id}")
+            received_chunks = [FALLBACK_RESPONSE_TEXT]
+            yield _sse_event('token', {'text': FALLBACK_RESPONSE_TEXT})
+        else:
+            await astore_completion(cache_key, ''.join(received_chunks).strip())
+        logger.info(f"LLM API stream completed for character {character_id}")
+        yield _sse_event('done', {'response': ''.join(received_chunks).strip()})
+
+    except LLMError as e:
+        error_payload, _ = _upstream_error_details(e)
+        yield _sse_event('error', error_payload)
+    except Exception as e:
+        logger.error(f"Unexpected error while streaming LLM response: {e}", exc_info=True)
+        CHAT_ERRORS.inc(error='unexpected')
+        yield _sse_event('error', {'error': 'An unexpected error occurred while communicating with the chat service.'})
+
+    finally:
+        await token_stream.aclose()
+        ai_response_text = ''.join(received_chunks).strip()
+        if ai_response_text:
+            await sync_to_async(_save_chat_turn)(turn, ai_response_text)
+            if finished:
+                logger.info(f"Saved streamed AI response for character {character_id} (User: {user.email})")
+            else:
+                logger.info(f"Saved partial streamed AI response for character {character_id} (User: {user.email})")
+        else:
+            logger.warning(f"No AI response text streamed for character {character_id} (User: {user.email}); chat turn not saved")
+
+
+@require_POST
+async def achat_with_character_stream(request):
+    """
+    Async version of api.chat_with_character_stream.
+    """
+    backend = _get_llm_backend()
+    if backend is None:
+        return _service_unavailable_response()
+
+    try:
+        user, turn, error_response = await _aprepare_chat(request)
+        if error_response is not None:
+            return error_response
+        character, messages_for_api = turn.conversation.character, turn.messages_for_api
+
+        cache_key = completion_cache_key(character, backend.model, messages_for_api, TEMPERATURE)
+        cached_response_text = await _alocal_reply(character, messages_for_api, cache_key)
+        if cached_response_text is not None:
+            logger.info(f"Reply for character {character.id} served without an upstream call")
+            token_stream = _acached_token_stream(cached_response_text)
+            cache_key = None
+        else:
+            logger.info(f"Calling LLM API asynchronously with streaming (model: {backend.model}) for character {character.id} (User: {user.email})...")
+            try:
+                with span('upstream'):
+                    token_stream = await backend.astream(messages_for_api, temperature=TEMPERATURE, max_tokens=MAX_TOKENS_RESPONSE)
+            except LLMError as e:
+                error_payload, status_code = _upstream_error_details(e)
+                return JsonResponse(error_payload, status=status_code)
+            except Exception as e:
+                logger.error(f"Unexpected error during LLM API call: {e}", exc_info=True)
+                CHAT_ERRORS.inc(error='unexpected')
+                return JsonResponse({'error': 'An unexpected error occurred while communicating with the chat service.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        response = StreamingHttpResponse(
+            _astream_completion(token_stream, turn, character.id, user, cache_key),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        logger.error(f"General error in async chat processing: {e}", exc_info=True)
+        return JsonResponse({'error': 'An internal server error occurred.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
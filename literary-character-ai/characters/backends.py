@@ -1,11 +1,34 @@
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Value
+from django.db.models.functions import Lower
 import logging
 
 UserModel = get_user_model()
 
 logger = logging.getLogger(__name__)
 
+
+def users_with_email(email):
+    """
+    Users whose email matches case-insensitively. Compares LOWER(email) on
+    both sides so the lookup uses the auth_user_email_lower_idx index
+    (migration 0011) instead of scanning the table like email__iexact.
+    """
+    return UserModel.objects.alias(email_lower=Lower('email')).filter(email_lower=Lower(Value(email)))
+
+
+def _user_cache_key(user_id):
+    return f"characters:user:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    """Drops a user from the get_user cache, e.g. after the user was saved."""
+    cache.delete(_user_cache_key(user_id))
+
+
 class EmailBackend(ModelBackend):
     """
     Custom authentication backend.
@@ -35,7 +58,7 @@ class EmailBackend(ModelBackend):
 
         try:
             # Case-insensitive lookup for the user by email
-            user = UserModel.objects.get(email__iexact=email)
+            user = users_with_email(email).get()
         except UserModel.DoesNotExist:
             # Run the default password hasher once to reduce timing attacks
             UserModel().set_password(password)
@@ -44,7 +67,7 @@ class EmailBackend(ModelBackend):
             # If multiple users have the same email (shouldn't happen with unique=True),
             # return the first one based on ID. Log this occurrence if necessary.
             logger.warning(f"Multiple users found with email: {email}")
-            user = UserModel.objects.filter(email__iexact=email).order_by('id').first()
+            user = users_with_email(email).order_by('id').first()
 
         # Check password and if the user is allowed to authenticate
         if user and user.check_password(password) and self.user_can_authenticate(user):
@@ -56,8 +79,19 @@ class EmailBackend(ModelBackend):
         """
         Overrides the get_user method to retrieve a user by their primary key.
         Required by the authentication framework.
+
+        Called on every authenticated request, so users are cached for
+        AUTH_USER_CACHE_TIMEOUT seconds; signals.py drops a user from the
+        cache whenever it is saved or deleted.
         """
-        try:
-            return UserModel.objects.get(pk=user_id)
-        except UserModel.DoesNotExist:
-            return None
+        timeout = settings.AUTH_USER_CACHE_TIMEOUT
+        key = _user_cache_key(user_id)
+        user = cache.get(key) if timeout else None
+        if user is None:
+            try:
+                user = UserModel.objects.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            if timeout:
+                cache.set(key, user, timeout)
+        return user
@@ -0,0 +1,53 @@
+"""
+Helpers shared by the benchmark and load-test management commands.
+
+Benchmarks never touch the project's real database: they run against a
+throwaway test database created the same way `manage.py test` does.
+"""
+import importlib
+import math
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import clear_url_caches
+
+
+@contextmanager
+def isolated_database():
+    """Creates a fresh test database for the duration of the block."""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+@contextmanager
+def chat_api_routing(use_async):
+    """Re-imports the URLconf so /app/api/chat/ points at the sync or async view."""
+    with override_settings(CHAT_ASYNC_API=use_async):
+        _reload_urlconfs()
+        try:
+            yield
+        finally:
+            clear_url_caches()
+    _reload_urlconfs()
+
+
+def _reload_urlconfs():
+    importlib.reload(importlib.import_module('characters.urls'))
+    importlib.reload(importlib.import_module('literary_character_project.urls'))
+    clear_url_caches()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
@@ -0,0 +1,62 @@
+"""
+Cached character catalog for the public pages.
+
+The catalog changes only when a character is saved or deleted, so the
+landing, character list and logout pages are served from cache entries keyed
+on a catalog version that signals.py bumps on every change; stale entries are
+never read again and simply expire. List views load only the card fields,
+never the long description.
+"""
+import random
+import time
+
+from django.core.cache import cache
+
+from .models import LiteraryCharacter
+
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOG_VERSION_KEY = "characters:catalog:version"
+CARD_FIELDS = ('id', 'name', 'book', 'author', 'image', 'image_renditions')
+SLIDE_FIELDS = ('id', 'name', 'image', 'image_renditions')
+
+
+def catalog_version():
+    """Returns the current catalog version, used to key catalog cache entries and template fragments."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seeded from the clock so that a lost version key never revives entries of an older catalog
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidates every cached catalog entry."""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError: # Version not cached yet, or evicted
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def character_cards():
+    """Returns a lazy queryset of the characters shown on the character list, without their descriptions."""
+    return LiteraryCharacter.objects.only(*CARD_FIELDS).order_by('id')
+
+
+def characters_with_images():
+    """Returns the characters that have an image, for the background slideshows. Cached per catalog version."""
+    key = f"characters:catalog:{catalog_version()}:with-images"
+    characters = cache.get(key)
+    if characters is None:
+        characters = list(
+            LiteraryCharacter.objects.only(*SLIDE_FIELDS)
+            .exclude(image__isnull=True).exclude(image__exact='').order_by('id')
+        )
+        cache.set(key, characters, CATALOG_CACHE_TIMEOUT)
+    return characters
+
+
+def random_characters_with_images(count):
+    """Returns up to count randomly chosen characters with an image, sampled from the cached list."""
+    characters = characters_with_images()
+    return random.sample(characters, min(count, len(characters)))
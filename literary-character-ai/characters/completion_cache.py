@@ -0,0 +1,127 @@
+"""
+Completion cache for the chat API.
+
+Characters with cache_responses enabled have their replies cached per
+prompt, so a repeated prompt (typically a conversation opener such as "Who
+are you?") is answered without an upstream call. Entries live in the
+CHAT_COMPLETION_CACHE_ALIAS cache, whose TIMEOUT and MAX_ENTRIES options
+provide expiry and eviction; LocMemCache evicts least recently used entries
+first.
+
+The key covers the model, the character, the temperature, the system
+messages (persona and rolling summary, so editing a character's description
+changes every key) and the conversation. Conversations of at most
+CHAT_COMPLETION_CACHE_TURNS messages are keyed after normalizing case,
+punctuation and whitespace; longer ones on their exact messages, so a reply
+is never reused for a conversation whose older turns differ.
+"""
+import hashlib
+import json
+import re
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import register_collector
+
+HITS_KEY = "characters:completion-cache:hits"
+MISSES_KEY = "characters:completion-cache:misses"
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s']")
+
+
+def _completion_cache():
+    return caches[settings.CHAT_COMPLETION_CACHE_ALIAS]
+
+
+def normalize_turn(text):
+    """Case-folds text and drops punctuation and repeated whitespace."""
+    return " ".join(_PUNCTUATION_RE.sub(" ", text.casefold()).split())
+
+
+def completion_cache_key(character, model, messages_for_api, temperature):
+    """
+    Returns the cache key for a completion of messages_for_api, or None if
+    the character does not use the completion cache.
+    """
+    if not character.cache_responses or character.pk is None:
+        return None
+
+    system_messages = [m["content"] for m in messages_for_api if m["role"] == "system"]
+    turns = [m for m in messages_for_api if m["role"] != "system"]
+    if len(turns) <= settings.CHAT_COMPLETION_CACHE_TURNS:
+        conversation = [(m["role"], normalize_turn(m["content"])) for m in turns]
+    else: # Only an identical prompt may share the reply
+        conversation = hashlib.sha256(json.dumps(messages_for_api).encode()).hexdigest()
+    key_material = json.dumps([
+        model,
+        character.pk,
+        temperature,
+        hashlib.sha256("\n".join(system_messages).encode()).hexdigest(),
+        conversation,
+    ])
+    return f"characters:completion:{hashlib.sha256(key_material.encode()).hexdigest()}"
+
+
+def _count(cache, counter_key):
+    # add() is a no-op once the counter exists; counters never expire, and
+    # since they are touched on every lookup LRU eviction never picks them
+    cache.add(counter_key, 0, timeout=None)
+    try:
+        cache.incr(counter_key)
+    except ValueError: # Evicted between add() and incr()
+        cache.set(counter_key, 1, timeout=None)
+
+
+async def _acount(cache, counter_key):
+    await cache.aadd(counter_key, 0, timeout=None)
+    try:
+        await cache.aincr(counter_key)
+    except ValueError:
+        await cache.aset(counter_key, 1, timeout=None)
+
+
+def get_cached_completion(key):
+    """Returns the cached reply text for key, or None. Counts hits and misses."""
+    if key is None:
+        return None
+    cache = _completion_cache()
+    text = cache.get(key)
+    _count(cache, MISSES_KEY if text is None else HITS_KEY)
+    return text
+
+
+async def aget_cached_completion(key):
+    """Async version of get_cached_completion."""
+    if key is None:
+        return None
+    cache = _completion_cache()
+    text = await cache.aget(key)
+    await _acount(cache, MISSES_KEY if text is None else HITS_KEY)
+    return text
+
+
+def store_completion(key, text):
+    """Caches a complete reply under key (from completion_cache_key)."""
+    if key is not None and text:
+        _completion_cache().set(key, text)
+
+
+async def astore_completion(key, text):
+    """Async version of store_completion."""
+    if key is not None and text:
+        await _completion_cache().aset(key, text)
+
+
+def completion_cache_stats():
+    """Returns the hit and miss counts of this cache (per process for LocMemCache)."""
+    counts = _completion_cache().get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': counts.get(HITS_KEY, 0), 'misses': counts.get(MISSES_KEY, 0)}
+
+
+@register_collector
+def _completion_cache_metrics():
+    stats = completion_cache_stats()
+    return [
+        ('inkpersona_completion_cache_hits_total', 'counter', "Chat turns answered from the completion cache.", stats['hits']),
+        ('inkpersona_completion_cache_misses_total', 'counter', "Cacheable chat turns that called the upstream.", stats['misses']),
+    ]
@@ -3,6 +3,8 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 
+from .backends import users_with_email
+
 # Get the currently active user model
 UserModel = get_user_model()
 
@@ -26,8 +28,8 @@ class CustomUserCreationForm(UserCreationForm):
         Validate that the email is not already in use.
         """
         email = self.cleaned_data.get('email')
-        if email and UserModel.objects.filter(email__iexact=email).exists():
-            # Use iexact for case-insensitive comparison
+        if email and users_with_email(email).exists():
+            # Case-insensitive comparison, using the index on LOWER(email)
             raise ValidationError("An account with this email address already exists.")
         return email
 
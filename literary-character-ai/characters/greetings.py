@@ -0,0 +1,127 @@
+"""
+Pre-generated greetings and first replies.
+
+A new conversation otherwise waits for a full upstream round trip before
+the character says anything. Each character can carry a greeting pool:
+a few opening lines, shown on the chat page of a new conversation, and
+replies to the most common first messages (COMMON_OPENERS), which the chat
+API serves without calling the upstream.
+
+Pools are generated by `manage.py generate_greetings`, for characters whose
+pool is missing or stale. A pool records a hash of the system prompt it was
+generated with; once the character's name, book, author or description
+changes it is no longer served, and saving the character queues regenerating
+it on the task queue (see signals.py).
+"""
+import hashlib
+import logging
+import random
+
+from .completion_cache import normalize_turn
+from .llm import get_backend
+from .models import LiteraryCharacter
+from .prompts import MAX_TOKENS_RESPONSE, build_prompt, get_system_prompt
+from .tasks import enqueue, task
+
+logger = logging.getLogger(__name__)
+
+GREETINGS_PER_CHARACTER = 3
+GREETING_TEMPERATURE = 0.9 # Varied openings across the pool
+REPLY_TEMPERATURE = 0.7 # Same as the chat API
+# First messages answered from the pool, compared after normalize_turn()
+COMMON_OPENERS = (
+    "Hello", "Hi", "Hey", "Hello there", "Good morning", "Good evening",
+    "Who are you?", "Tell me about yourself", "What is your story?", "How are you?",
+)
+GREETING_INSTRUCTION = (
+    "A reader has just opened a conversation with you. Greet them in character, "
+    "in one or two sentences, and invite them to talk."
+)
+
+
+def _prompt_hash(system_prompt):
+    return hashlib.sha256(system_prompt.encode()).hexdigest()[:16]
+
+
+def generate_greeting_pool(character, backend):
+    """
+    Asks the backend for GREETINGS_PER_CHARACTER greetings and a reply to
+    each of COMMON_OPENERS, and returns the greeting_pool value holding them.
+    Raises LLMError if an upstream call fails.
+    """
+    system_prompt, _ = get_system_prompt(character)
+    greetings = []
+    for _ in range(GREETINGS_PER_CHARACTER):
+        completion = backend.complete(
+            [{"role": "system", "content": system_prompt}, {"role": "user", "content": GREETING_INSTRUCTION}],
+            temperature=GREETING_TEMPERATURE,
+            max_tokens=MAX_TOKENS_RESPONSE,
+        )
+        if completion.text:
+            greetings.append(completion.text.strip())
+
+    replies = {}
+    for opener in COMMON_OPENERS:
+        # The exact prompt the chat API builds for this first message
+        messages_for_api, _ = build_prompt(character, [], opener)
+        completion = backend.complete(messages_for_api, temperature=REPLY_TEMPERATURE, max_tokens=MAX_TOKENS_RESPONSE)
+        if completion.text:
+            replies[normalize_turn(opener)] = completion.text.strip()
+
+    return {'source': _prompt_hash(system_prompt), 'greetings': greetings, 'replies': replies}
+
+
+def schedule_greeting_pool_update(character_id):
+    """
+    Queues regenerating a character's greeting pool as a background task. At
+    most one regeneration per character is queued at a time.
+    """
+    enqueue(regenerate_greeting_pool, dedupe_key=f'greetings:{character_id}', character_id=character_id)
+
+
+@task(max_attempts=3) # Upstream errors are retried by the queue
+def regenerate_greeting_pool(character_id):
+    """Regenerates a character's greeting pool unless it is current by now."""
+    try:
+        character = LiteraryCharacter.objects.get(pk=character_id)
+    except LiteraryCharacter.DoesNotExist:
+        return
+    if greeting_pool_is_current(character):
+        return
+
+    pool = generate_greeting_pool(character, get_backend())
+    character.refresh_from_db(fields=['name', 'book', 'author', 'description'])
+    if pool['source'] != _prompt_hash(get_system_prompt(character)[0]):
+        # Edited again meanwhile; that save queued another regeneration
+        logger.info(f"Character {character_id} changed during greeting pool generation; discarding result.")
+        return
+    # update() skips the save signals: nothing derived from the character changes
+    LiteraryCharacter.objects.filter(pk=character_id).update(greeting_pool=pool)
+    logger.info(f"Regenerated the greeting pool of character {character_id}")
+
+
+def greeting_pool_is_current(character):
+    """Whether character.greeting_pool was generated from the character's current persona."""
+    pool = character.greeting_pool
+    return bool(pool) and pool.get('source') == _prompt_hash(get_system_prompt(character)[0])
+
+
+def pooled_greeting(character):
+    """A random greeting from the character's current pool, or None."""
+    if not greeting_pool_is_current(character) or not character.greeting_pool['greetings']:
+        return None
+    return random.choice(character.greeting_pool['greetings'])
+
+
+def pooled_reply(character, messages_for_api):
+    """
+    The pooled reply to a conversation's first message, or None. Only
+    prompts made of the system prompt and one user message qualify: with any
+    history or summary in the prompt, the pooled reply wouldn't fit.
+    """
+    pool = character.greeting_pool
+    if not pool or len(messages_for_api) != 2 or messages_for_api[0]["role"] != "system":
+        return None
+    if pool.get('source') != _prompt_hash(messages_for_api[0]["content"]):
+        return None
+    return pool['replies'].get(normalize_turn(messages_for_api[1]["content"]))
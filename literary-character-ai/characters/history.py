@@ -0,0 +1,56 @@
+"""
+Keyset pagination of conversation history.
+
+Pages are read newest first with a (timestamp, id) cursor, which the
+ChatMessage(conversation, timestamp, id) index serves directly, so fetching
+an old page costs the same as fetching the latest one, unlike OFFSET. Past
+the oldest message left in ChatMessage, pages continue into the archive
+(see archive.py) with the same cursors.
+"""
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .archive import archived_messages
+
+HISTORY_PAGE_SIZE = 50
+
+
+def encode_cursor(message):
+    """Returns an opaque cursor pointing just before message."""
+    return urlsafe_base64_encode(f"{message.timestamp.isoformat()}|{message.id}".encode())
+
+
+def decode_cursor(cursor):
+    """Returns the (timestamp, id) pair of a cursor. Raises ValueError if it is malformed."""
+    try:
+        timestamp, message_id = force_str(urlsafe_base64_decode(cursor)).split("|")
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (TypeError, UnicodeDecodeError) as e: # Undecodable base64 or bytes
+        raise ValueError(f"Invalid history cursor: {cursor!r}") from e
+
+
+def history_page(conversation, before=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    Returns (messages, next_cursor): the page_size messages preceding the
+    before cursor (the newest ones if before is None) in chronological order,
+    and the cursor of the page before them, or None if this is the first page.
+    """
+    messages = conversation.messages.order_by('-timestamp', '-id')
+    position = None
+    if before is not None:
+        position = timestamp, message_id = decode_cursor(before)
+        messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+
+    page = list(messages[:page_size + 1]) # One extra row tells whether older messages exist
+    if len(page) <= page_size:
+        # No older messages left in ChatMessage; the rest, if any, are archived
+        if page:
+            position = (page[-1].timestamp, page[-1].id)
+        page += archived_messages(conversation, before=position, limit=page_size + 1 - len(page))
+    has_older = len(page) > page_size
+    page = page[:page_size]
+    page.reverse()
+    return page, encode_cursor(page[0]) if has_older else None
@@ -0,0 +1,387 @@
+"""
+Pluggable LLM backends for the chat API.
+
+The backend is selected with the LLM_BACKEND setting, following the same
+shape as Django's CACHES entries:
+
+    LLM_BACKEND = {
+        'BACKEND': 'characters.llm.GroqBackend',
+        'MODEL': 'llama3-8b-8192',
+        'OPTIONS': {},
+    }
+
+Every backend offers blocking, async and streaming calls and raises the
+LLMError hierarchy below, so views never depend on a vendor SDK's exceptions.
+"""
+import asyncio
+import functools
+import hashlib
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .metrics import record_usage
+
+logger = logging.getLogger(__name__)
+
+
+# --- Errors ---
+
+class LLMError(Exception):
+    """An upstream LLM call failed. status_code is the upstream HTTP status, if any."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class LLMRateLimitError(LLMError):
+    """The upstream rejected the call for rate limiting (HTTP 429)."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message, status_code=429)
+        self.retry_after = retry_after # Seconds, from the Retry-After header when present
+
+
+class LLMConnectionError(LLMError):
+    """The upstream could not be reached or timed out."""
+
+
+@dataclass
+class Completion:
+    """Result of a non-streaming completion call."""
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+# --- Backends ---
+
+class BaseLLMBackend:
+    """
+    Interface for chat completion backends.
+
+    messages use the OpenAI-style [{"role": ..., "content": ...}] format.
+    stream() and astream() open the upstream call eagerly, so errors that
+    happen before the first token are raised by the call itself, and return
+    an iterator of text chunks that releases the upstream connection when
+    closed.
+    """
+
+    def __init__(self, model, **options):
+        self.model = model
+        self.options = options
+
+    def complete(self, messages, temperature, max_tokens):
+        raise NotImplementedError
+
+    async def acomplete(self, messages, temperature, max_tokens):
+        raise NotImplementedError
+
+    def stream(self, messages, temperature, max_tokens):
+        raise NotImplementedError
+
+    async def astream(self, messages, temperature, max_tokens):
+        raise NotImplementedError
+
+
+class GroqBackend(BaseLLMBackend):
+    """
+    Backend for the Groq API, reading GROQ_API_KEY from the environment.
+
+    The SDK is imported when the backend is built, on the first chat request,
+    rather than with this module: the URLconf imports it in every process and
+    the SDK takes longer to import than the rest of the project. Each client
+    keeps one pool of keep-alive connections, shared by all requests of the
+    process; the async client is built on first use. Options other than these
+    are passed to the SDK clients (e.g. api_key, base_url):
+
+        timeout                     Seconds to wait for a response (default 60).
+        connect_timeout             Seconds to wait for a connection (default 5).
+        max_connections             Open connections per client (default 100).
+        max_keepalive_connections   Idle connections kept for reuse (default 20).
+        keepalive_expiry            Seconds an idle connection is kept (default 30).
+    """
+
+    def __init__(self, model, timeout=60.0, connect_timeout=5.0, max_connections=100,
+                 max_keepalive_connections=20, keepalive_expiry=30.0, **options):
+        super().__init__(model, **options)
+        import groq
+        import httpx
+
+        self.groq = groq
+        self.timeout = httpx.Timeout(float(timeout), connect=float(connect_timeout))
+        self.limits = httpx.Limits(
+            max_connections=int(max_connections),
+            max_keepalive_connections=int(max_keepalive_connections),
+            keepalive_expiry=float(keepalive_expiry),
+        )
+        self.client = groq.Groq(
+            timeout=self.timeout,
+            http_client=groq.DefaultHttpxClient(timeout=self.timeout, limits=self.limits),
+            **options,
+        )
+
+    @functools.cached_property
+    def async_client(self):
+        return self.groq.AsyncGroq(
+            timeout=self.timeout,
+            http_client=self.groq.DefaultAsyncHttpxClient(timeout=self.timeout, limits=self.limits),
+            **self.options,
+        )
+
+    def _translate_error(self, e):
+        """Converts a Groq SDK exception into the matching LLMError."""
+        if isinstance(e, self.groq.RateLimitError):
+            retry_after = e.response.headers.get('retry-after')
+            try:
+                retry_after = float(retry_after) if retry_after is not None else None
+            except ValueError:
+                retry_after = None
+            return LLMRateLimitError(str(e), retry_after=retry_after)
+        if isinstance(e, self.groq.APIConnectionError): # Includes APITimeoutError
+            return LLMConnectionError(str(e))
+        return LLMError(getattr(e, 'message', str(e)), status_code=getattr(e, 'status_code', None))
+
+    @staticmethod
+    def _to_completion(chat_completion):
+        text = ""
+        if chat_completion.choices:
+            text = (chat_completion.choices[0].message.content or "").strip()
+        usage = getattr(chat_completion, 'usage', None)
+        completion = Completion(
+            text=text,
+            prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+            completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+        )
+        record_usage(completion.prompt_tokens, completion.completion_tokens)
+        return completion
+
+    @staticmethod
+    def _record_stream_usage(chunk):
+        # Groq reports the usage of a streamed completion in its last chunk
+        usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+        if usage is not None:
+            record_usage(getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0)
+
+    def complete(self, messages, temperature, max_tokens):
+        try:
+            chat_completion = self.client.chat.completions.create(
+                messages=messages, model=self.model, temperature=temperature, max_tokens=max_tokens,
+            )
+        except self.groq.APIError as e:
+            raise self._translate_error(e) from e
+        return self._to_completion(chat_completion)
+
+    async def acomplete(self, messages, temperature, max_tokens):
+        try:
+            chat_completion = await self.async_client.chat.completions.create(
+                messages=messages, model=self.model, temperature=temperature, max_tokens=max_tokens,
+            )
+        except self.groq.APIError as e:
+            raise self._translate_error(e) from e
+        return self._to_completion(chat_completion)
+
+    def stream(self, messages, temperature, max_tokens):
+        try:
+            upstream = self.client.chat.completions.create(
+                messages=messages, model=self.model, temperature=temperature, max_tokens=max_tokens, stream=True,
+            )
+        except self.groq.APIError as e:
+            raise self._translate_error(e) from e
+        return self._iter_stream(upstream)
+
+    def _iter_stream(self, upstream):
+        try:
+            for chunk in upstream:
+                self._record_stream_usage(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except self.groq.APIError as e:
+            raise self._translate_error(e) from e
+        finally:
+            upstream.close()
+
+    async def astream(self, messages, temperature, max_tokens):
+        try:
+            upstream = await self.async_client.chat.completions.create(
+                messages=messages, model=self.model, temperature=temperature, max_tokens=max_tokens, stream=True,
+            )
+        except self.groq.APIError as e:
+            raise self._translate_error(e) from e
+        return self._aiter_stream(upstream)
+
+    async def _aiter_stream(self, upstream):
+        try:
+            async for chunk in upstream:
+                self._record_stream_usage(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except self.groq.APIError as e:
+            raise self._translate_error(e) from e
+        finally:
+            await upstream.close()
+
+
+FAKE_VOCABULARY = (
+    "indeed", "the", "road", "was", "long", "and", "my", "heart", "remembers", "every", "page",
+    "of", "that", "story", "you", "ask", "about", "a", "curious", "thing", "friend", "perhaps",
+    "once", "I", "believed", "otherwise", "but", "time", "teaches", "us", "all",
+)
+
+
+class FakeBackend(BaseLLMBackend):
+    """
+    Local stand-in for load testing the Django side without network access.
+
+    Replies are deterministic for a given user message. Options:
+
+        latency             Seconds before the first token (default 0.5).
+        tokens_per_second   Generation speed after the first token (default 50).
+        reply_tokens        Words per reply (default 60).
+        rate_limit_rate     Fraction of calls failing with a 429 (default 0).
+        server_error_rate   Fraction of calls failing with a 503 (default 0).
+        retry_after         Retry-After seconds reported with simulated 429s (default 1).
+        seed                Seed for the error sequence (default 0).
+
+    in_flight and peak_in_flight count concurrent calls, for load-test reports.
+    """
+
+    def __init__(self, model, latency=0.5, tokens_per_second=50.0, reply_tokens=60,
+                 rate_limit_rate=0.0, server_error_rate=0.0, retry_after=1.0, seed=0, **options):
+        super().__init__(model, **options)
+        self.latency = float(latency)
+        self.tokens_per_second = float(tokens_per_second)
+        self.reply_tokens = int(reply_tokens)
+        self.rate_limit_rate = float(rate_limit_rate)
+        self.server_error_rate = float(server_error_rate)
+        self.retry_after = float(retry_after)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def _maybe_fail(self):
+        """Raises a simulated upstream error at the configured rates."""
+        with self._lock:
+            draw = self._random.random()
+        if draw < self.rate_limit_rate:
+            raise LLMRateLimitError("Simulated rate limit.", retry_after=self.retry_after)
+        if draw < self.rate_limit_rate + self.server_error_rate:
+            raise LLMError("Simulated upstream failure.", status_code=503)
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _reply_words(self, messages):
+        last_user_message = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        digest = hashlib.sha256(last_user_message.encode()).digest()
+        words = [FAKE_VOCABULARY[digest[i % len(digest)] % len(FAKE_VOCABULARY)] for i in range(self.reply_tokens)]
+        words[0] = words[0].capitalize()
+        return words
+
+    def _completion(self, messages, words):
+        from .prompts import count_tokens
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        record_usage(prompt_tokens, len(words))
+        return Completion(text=" ".join(words) + ".", prompt_tokens=prompt_tokens, completion_tokens=len(words))
+
+    def _generation_time(self, words):
+        return self.latency + max(len(words) - 1, 0) / self.tokens_per_second
+
+    def complete(self, messages, temperature, max_tokens):
+        self._maybe_fail()
+        self._enter()
+        try:
+            words = self._reply_words(messages)[:max_tokens]
+            time.sleep(self._generation_time(words))
+            return self._completion(messages, words)
+        finally:
+            self._leave()
+
+    async def acomplete(self, messages, temperature, max_tokens):
+        self._maybe_fail()
+        self._enter()
+        try:
+            words = self._reply_words(messages)[:max_tokens]
+            await asyncio.sleep(self._generation_time(words))
+            return self._completion(messages, words)
+        finally:
+            self._leave()
+
+    def stream(self, messages, temperature, max_tokens):
+        self._maybe_fail()
+        return self._iter_stream(messages, self._reply_words(messages)[:max_tokens])
+
+    def _iter_stream(self, messages, words):
+        self._enter()
+        try:
+            time.sleep(self.latency)
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(1 / self.tokens_per_second)
+                yield word if i == 0 else f" {word}"
+            yield "."
+            self._completion(messages, words) # Counts the usage, like the last chunk of a Groq stream
+        finally:
+            self._leave()
+
+    async def astream(self, messages, temperature, max_tokens):
+        self._maybe_fail()
+        return self._aiter_stream(messages, self._reply_words(messages)[:max_tokens])
+
+    async def _aiter_stream(self, messages, words):
+        self._enter()
+        try:
+            await asyncio.sleep(self.latency)
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+                yield word if i == 0 else f" {word}"
+            yield "."
+            self._completion(messages, words) # Counts the usage, like the last chunk of a Groq stream
+        finally:
+            self._leave()
+
+
+# --- Backend Selection ---
+
+@functools.lru_cache(maxsize=None)
+def get_backend():
+    """
+    Returns the process-wide backend configured by LLM_BACKEND, wrapped in
+    the admission control configured by LLM_UPSTREAM_LIMITS (see upstream.py).
+
+    Construction errors propagate to the caller and are not cached, so a
+    transient failure is retried on the next call.
+    """
+    from .upstream import LimitedBackend
+
+    config = settings.LLM_BACKEND
+    backend_class = import_string(config['BACKEND'])
+    backend = backend_class(config['MODEL'], **config.get('OPTIONS', {}))
+    logger.info(f"LLM backend initialized: {config['BACKEND']} (model: {config['MODEL']})")
+    if settings.LLM_UPSTREAM_LIMITS:
+        backend = LimitedBackend.from_settings(backend, settings.LLM_UPSTREAM_LIMITS)
+    return backend
+
+
+@receiver(setting_changed)
+def _reset_backend(setting, **kwargs):
+    """Rebuilds the backend after its settings are overridden (e.g. in tests and benchmarks)."""
+    if setting in ('LLM_BACKEND', 'LLM_UPSTREAM_LIMITS'):
+        get_backend.cache_clear()
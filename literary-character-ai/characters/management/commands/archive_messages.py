@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from characters.archive import ARCHIVE_CHUNK_MESSAGES, archive_conversation
+from characters.models import Conversation
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves messages older than CHAT_ARCHIVE_AFTER_DAYS that are already folded into "
+        "their conversation's summary to compressed archive blobs, one short transaction "
+        "per blob. Archived messages are still shown when scrolling back through a chat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None, help="Days (default: CHAT_ARCHIVE_AFTER_DAYS).")
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_MESSAGES, help="Messages per archive blob.")
+
+    def handle(self, *args, **options):
+        days = settings.CHAT_ARCHIVE_AFTER_DAYS if options['older_than'] is None else options['older_than']
+        cutoff = timezone.now() - timedelta(days=days)
+        # Only summarized conversations have messages that may be archived
+        conversation_ids = Conversation.objects.filter(summarized_up_to__isnull=False).order_by('id').values_list('id', flat=True)
+
+        totals = [0, 0, 0, 0]
+        for conversation_id in conversation_ids.iterator():
+            stats = archive_conversation(conversation_id, cutoff, chunk_size=options['chunk_size'])
+            totals = [total + value for total, value in zip(totals, stats)]
+
+        messages, archives, raw_bytes, compressed_bytes = totals
+        ratio = f", {raw_bytes / compressed_bytes:.1f}x smaller" if compressed_bytes else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {messages} messages older than {days} days into {archives} blobs "
+            f"({raw_bytes / 1024:.0f} KB of text stored in {compressed_bytes / 1024:.0f} KB{ratio})."
+        ))
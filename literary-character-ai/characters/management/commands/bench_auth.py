@@ -0,0 +1,109 @@
+import importlib
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from characters.backends import EmailBackend, users_with_email
+from characters.benchmarking import isolated_database, percentile
+
+# The migration that creates the index on LOWER(email), dropped and recreated to compare
+email_index = importlib.import_module('characters.migrations.0011_user_email_lower_index')
+
+SEED_BATCH_SIZE = 20_000
+PASSWORD = "correct horse battery staple"
+# The default PBKDF2 hasher takes ~0.5s per login by design and would hide the
+# lookup cost; the benchmark hashes with MD5 to measure everything else
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database with many users and measures the authentication hot "
+        "paths: finding a user by email with email__iexact vs. the LOWER(email) index, "
+        "EmailBackend.authenticate, and loading the session's user with and without "
+        "the get_user cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000, help="Users to seed.")
+        parser.add_argument('--repeat', type=int, default=500, help="Timed runs per measurement.")
+
+    def handle(self, *args, **options):
+        with isolated_database(), override_settings(PASSWORD_HASHERS=FAST_HASHERS):
+            self._seed(options['users'])
+            rng = random.Random(0)
+            samples = [rng.randrange(options['users']) for _ in range(options['repeat'])]
+            # Users type their address in any case
+            emails = [f"Reader{i}@Example.com" for i in samples]
+            user_ids = list(
+                get_user_model().objects.filter(username__in=[f'reader{i}' for i in samples]).values_list('id', flat=True)
+            )
+            backend = EmailBackend()
+
+            with connection.cursor() as cursor:
+                cursor.execute(email_index.DROP_INDEX)
+            self._analyze()
+            timings = {
+                'email__iexact (no index)': self._time(lambda email: get_user_model().objects.get(email__iexact=email), emails),
+            }
+            with connection.cursor() as cursor:
+                cursor.execute(email_index.CREATE_INDEX)
+            self._analyze()
+            self.stdout.write(f"users_with_email plan:\n{users_with_email(emails[0]).explain()}\n")
+            timings['LOWER(email) index'] = self._time(lambda email: users_with_email(email).get(), emails)
+            timings['authenticate()'] = self._time(
+                lambda email: backend.authenticate(None, username=email, password=PASSWORD), emails
+            )
+
+            with override_settings(AUTH_USER_CACHE_TIMEOUT=0):
+                timings['get_user, uncached'] = self._time(backend.get_user, user_ids)
+            cache.clear()
+            for user_id in user_ids: # Warm the cache, as earlier requests of each session would
+                backend.get_user(user_id)
+            timings['get_user, cached'] = self._time(backend.get_user, user_ids)
+
+        self.stdout.write(f"\n{options['users']} users, {options['repeat']} runs each")
+        self.stdout.write(f"{'measurement':<28}{'p50 (ms)':>10}{'p95 (ms)':>10}{'mean (ms)':>11}")
+        for name, values in timings.items():
+            self.stdout.write(
+                f"{name:<28}{percentile(values, 50):>10.3f}{percentile(values, 95):>10.3f}{statistics.mean(values):>11.3f}"
+            )
+
+    def _seed(self, user_count):
+        """Bulk-inserts users, bypassing the ORM."""
+        started = time.perf_counter()
+        user_model = get_user_model()
+        table = user_model._meta.db_table
+        insert = (
+            f'INSERT INTO {table} (password, is_superuser, username, first_name, last_name, email, is_staff, is_active, date_joined) '
+            f'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)'
+        )
+        password, joined = make_password(PASSWORD), timezone.now()
+        with connection.cursor() as cursor:
+            for batch_start in range(0, user_count, SEED_BATCH_SIZE):
+                cursor.executemany(insert, [
+                    (password, False, f'reader{i}', '', '', f'reader{i}@example.com', False, True, joined)
+                    for i in range(batch_start, min(batch_start + SEED_BATCH_SIZE, user_count))
+                ])
+        self.stdout.write(f"Seeded {user_count} users in {time.perf_counter() - started:.1f}s")
+
+    def _analyze(self):
+        """Refreshes planner statistics after bulk changes."""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def _time(self, call, arguments):
+        timings = []
+        for argument in arguments:
+            started = time.perf_counter()
+            call(argument)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
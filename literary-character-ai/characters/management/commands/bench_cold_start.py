@@ -0,0 +1,145 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from characters.benchmarking import percentile
+
+# Runs in a fresh interpreter per measurement: loads Django and the URLconf
+# as a worker does when it starts, then sends completions through the
+# configured backend and prints its timings as JSON
+CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+if sys.argv[2] == 'eager':
+    import groq  # Imported with the project's modules, as before the SDK import was deferred
+import django
+django.setup()
+from importlib import import_module
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+import_module(settings.ROOT_URLCONF)
+ready = time.perf_counter()
+sdk_imported = 'groq' in sys.modules
+from characters.llm import get_backend
+calls = []
+for _ in range(int(sys.argv[1])):
+    call_started = time.perf_counter()
+    get_backend().complete([{"role": "user", "content": "Hello"}], temperature=0.7, max_tokens=16)
+    calls.append(time.perf_counter() - call_started)
+print(json.dumps({'startup': ready - started, 'sdk_imported': sdk_imported, 'calls': calls}))
+"""
+
+COMPLETION = {
+    'id': 'chatcmpl-bench', 'object': 'chat.completion', 'created': 0, 'model': 'bench-model',
+    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': "Good day to you."}, 'finish_reason': 'stop'}],
+    'usage': {'prompt_tokens': 5, 'completion_tokens': 5, 'total_tokens': 10},
+}
+
+
+class _StubUpstream(BaseHTTPRequestHandler):
+    """Answers every POST with the same chat completion over HTTP/1.1 keep-alive."""
+    protocol_version = 'HTTP/1.1'
+    # One segment per response: separate header and body writes would hit the
+    # delayed-ACK stall on a reused connection
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        body = json.dumps(COMPLETION).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Starts fresh processes that load the project as a worker does, then send "
+        "completions through the Groq backend to a local stub of the API. Reports the "
+        "start-up time, the latency of the first completion (SDK import and client "
+        "construction included) and of later ones, and the connections each process "
+        "opened: with the SDK imported eagerly (as before it was deferred), as configured, "
+        "and without keep-alive. No network access or API key is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10, help="Processes started per configuration.")
+        parser.add_argument('--calls', type=int, default=20, help="Completions sent by each process.")
+        parser.add_argument('--latency', type=float, default=0.02, help="Simulated upstream latency in seconds.")
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _StubUpstream)
+        server.daemon_threads = True
+        server.lock, server.connections, server.latency = threading.Lock(), 0, options['latency']
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        configurations = [
+            ('eager SDK import', 'eager', {}),
+            ('deferred SDK import', 'lazy', {}),
+            ('deferred, no keep-alive', 'lazy', {'max_keepalive_connections': 0}),
+        ]
+
+        try:
+            results = {}
+            for name, mode, pool_options in configurations:
+                runs = []
+                for _ in range(options['runs']):
+                    before = server.connections
+                    run = self._run_child(mode, options['calls'], {'api_key': 'bench', 'base_url': base_url, **pool_options})
+                    run['connections'] = server.connections - before
+                    runs.append(run)
+                results[name] = runs
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(f"\n{options['runs']} processes per configuration, {options['calls']} completions each")
+        self.stdout.write(
+            f"{'configuration':<26}{'start-up (ms)':>15}{'SDK at start':>14}{'first call (ms)':>17}"
+            f"{'later p50 (ms)':>16}{'later p95 (ms)':>16}{'connections':>13}"
+        )
+        for name, runs in results.items():
+            later = [call * 1000 for run in runs for call in run['calls'][1:]]
+            self.stdout.write(
+                f"{name:<26}{statistics.median(run['startup'] for run in runs) * 1000:>15.1f}"
+                f"{'yes' if runs[0]['sdk_imported'] else 'no':>14}"
+                f"{statistics.median(run['calls'][0] for run in runs) * 1000:>17.1f}"
+                f"{percentile(later, 50):>16.2f}{percentile(later, 95):>16.2f}"
+                f"{statistics.mean(run['connections'] for run in runs):>13.1f}"
+            )
+
+    def _run_child(self, mode, calls, backend_options):
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'literary_character_project.settings'),
+            'LLM_BACKEND': 'characters.llm.GroqBackend',
+            'GROQ_MODEL': 'bench-model',
+            'LLM_BACKEND_OPTIONS': json.dumps(backend_options),
+        }
+        completed = subprocess.run(
+            [sys.executable, '-c', CHILD_SCRIPT, str(calls), mode],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            raise CommandError(f"Benchmark process failed:\n{completed.stderr}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
@@ -0,0 +1,142 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from characters.benchmarking import isolated_database
+from characters.models import LiteraryCharacter, Conversation, ChatMessage
+
+CHARACTERS = 10
+SEED_BATCH_SIZE = 20_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database with many chat messages and compares the query plans "
+        "and latency of the hot conversation queries without and with the composite "
+        "indexes on ChatMessage(conversation, timestamp, id) and Conversation(user, "
+        "last_updated), and counting messages against the denormalized message_count."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000, help="ChatMessage rows to seed.")
+        parser.add_argument('--users', type=int, default=1000, help="Users to spread them over.")
+        parser.add_argument('--repeat', type=int, default=200, help="Timed runs per query.")
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            self._seed(options['messages'], options['users'])
+            conversation_ids = list(Conversation.objects.values_list('id', flat=True))
+            user_ids = list(get_user_model().objects.values_list('id', flat=True))
+            rng = random.Random(0)
+            samples = [(rng.choice(conversation_ids), rng.choice(user_ids)) for _ in range(options['repeat'])]
+
+            queries = {
+                'recent messages': lambda conversation_id, user_id: list(
+                    ChatMessage.objects.filter(conversation_id=conversation_id).order_by('-timestamp', '-id')[:50]
+                ),
+                'user conversations': lambda conversation_id, user_id: list(
+                    Conversation.objects.filter(user_id=user_id).order_by('-last_updated')
+                ),
+                'count(messages)': lambda conversation_id, user_id: (
+                    ChatMessage.objects.filter(conversation_id=conversation_id).count()
+                ),
+                'message_count field': lambda conversation_id, user_id: (
+                    Conversation.objects.filter(pk=conversation_id).values_list('message_count', flat=True).get()
+                ),
+            }
+            plans = {
+                'recent messages': ChatMessage.objects.filter(conversation_id=samples[0][0]).order_by('-timestamp', '-id')[:50],
+                'user conversations': Conversation.objects.filter(user_id=samples[0][1]).order_by('-last_updated'),
+            }
+
+            indexes = [(ChatMessage, index) for index in ChatMessage._meta.indexes]
+            indexes += [(Conversation, index) for index in Conversation._meta.indexes]
+            with connection.schema_editor() as schema_editor:
+                for model, index in indexes:
+                    schema_editor.remove_index(model, index)
+            self._analyze()
+            before = self._run(queries, plans, samples, "without composite indexes")
+
+            with connection.schema_editor() as schema_editor:
+                for model, index in indexes:
+                    schema_editor.add_index(model, index)
+            self._analyze()
+            after = self._run(queries, plans, samples, "with composite indexes")
+
+        self.stdout.write(f"\n{'query':<22}{'before p50 (ms)':>17}{'after p50 (ms)':>16}{'before max (ms)':>17}{'after max (ms)':>16}")
+        for name in queries:
+            self.stdout.write(
+                f"{name:<22}{statistics.median(before[name]):>17.3f}{statistics.median(after[name]):>16.3f}"
+                f"{max(before[name]):>17.3f}{max(after[name]):>16.3f}"
+            )
+
+    def _seed(self, message_count, user_count):
+        """Bulk-inserts users, conversations and messages, bypassing the ORM for the messages."""
+        started = time.perf_counter()
+        user_model = get_user_model()
+        user_model.objects.bulk_create(
+            user_model(username=f'bench{i}', email=f'bench{i}@example.com') for i in range(user_count)
+        )
+        LiteraryCharacter.objects.bulk_create(
+            LiteraryCharacter(name=f"Character {i}", book="Benchmarks", author="Anonymous", description="A patient character.")
+            for i in range(CHARACTERS)
+        )
+        users = list(user_model.objects.values_list('id', flat=True))
+        characters = list(LiteraryCharacter.objects.values_list('id', flat=True))
+        Conversation.objects.bulk_create(
+            Conversation(user_id=user_id, character_id=character_id) for user_id in users for character_id in characters
+        )
+        conversations = list(Conversation.objects.values_list('id', flat=True))
+
+        # Messages of all conversations interleaved in time, like real traffic
+        rng = random.Random(0)
+        start = timezone.now() - timedelta(days=365)
+        table = ChatMessage._meta.db_table
+        insert = (
+            f'INSERT INTO {table} (conversation_id, message_text, is_user_message, "timestamp") '
+            f'VALUES (%s, %s, %s, %s)'
+        )
+        counts = dict.fromkeys(conversations, 0)
+        with connection.cursor() as cursor:
+            for batch_start in range(0, message_count, SEED_BATCH_SIZE):
+                rows = []
+                for i in range(batch_start, min(batch_start + SEED_BATCH_SIZE, message_count)):
+                    conversation_id = rng.choice(conversations)
+                    counts[conversation_id] += 1
+                    rows.append((
+                        conversation_id, f"Seeded message number {i} about the book.", i % 2 == 0,
+                        start + timedelta(seconds=i * 10),
+                    ))
+                cursor.executemany(insert, rows)
+
+        for conversation_id, count in counts.items():
+            Conversation.objects.filter(pk=conversation_id).update(message_count=count)
+        self.stdout.write(
+            f"Seeded {message_count} messages in {len(conversations)} conversations of {user_count} users "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+    def _analyze(self):
+        """Refreshes planner statistics after bulk changes."""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def _run(self, queries, plans, samples, label):
+        self.stdout.write(f"\n--- {label} ---")
+        for name, queryset in plans.items():
+            self.stdout.write(f"{name}:\n{queryset.explain()}")
+
+        timings = {}
+        for name, query in queries.items():
+            timings[name] = []
+            for conversation_id, user_id in samples:
+                started = time.perf_counter()
+                query(conversation_id, user_id)
+                timings[name].append((time.perf_counter() - started) * 1000)
+        return timings
@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from characters.models import LiteraryCharacter, ChatMessage
+from characters.prompts import build_prompt, count_tokens
+
+SAMPLE_SENTENCES = [
+    "Tell me about the windmills you fought on the plains of La Mancha.",
+    "I have read of knights in the books of chivalry, and it is my duty to follow their example!",
+    "What did Sancho think when you first asked him to be your squire?",
+    "The enchanters who persecute me have turned the giants into windmills to rob me of the glory of victory.",
+]
+
+
+def _synthetic_history(size):
+    """Unsaved messages, newest first, as prompts.history_candidates returns them."""
+    return [
+        ChatMessage(
+            id=size - i,
+            message_text=f"{SAMPLE_SENTENCES[i % len(SAMPLE_SENTENCES)]} ({size - i})",
+            is_user_message=i % 2 == 0,
+        )
+        for i in range(size)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmarks prompt assembly (system prompt lookup, token counting and "
+        "newest-first history packing) for histories of different lengths. No database "
+        "or network access is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help="History lengths to benchmark.")
+        parser.add_argument('--repeat', type=int, default=200, help="Timed runs per history length.")
+
+    def handle(self, *args, **options):
+        # pk=None bypasses the system prompt cache so every run renders it from scratch
+        character = LiteraryCharacter(
+            name="Don Quixote", book="Don Quixote", author="Miguel de Cervantes",
+            description="An aging hidalgo who reads so many chivalric romances that he sets out to revive knighthood. " * 5,
+        )
+
+        self.stdout.write(f"{'messages':>10}{'packed':>8}{'cold (ms)':>12}{'warm p50 (ms)':>16}{'warm max (ms)':>16}")
+        for size in options['sizes']:
+            history = _synthetic_history(size)
+
+            # Cold: every message is tokenized for the first time
+            count_tokens.cache_clear()
+            started = time.perf_counter()
+            _, window = build_prompt(character, history, "What would you do next?", max_messages=size)
+            cold_ms = (time.perf_counter() - started) * 1000
+
+            # Warm: steady state of a conversation, messages already tokenized on earlier turns
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                build_prompt(character, history, "What would you do next?", max_messages=size)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            self.stdout.write(
+                f"{size:>10}{len(window):>8}{cold_ms:>12.3f}{statistics.median(timings):>16.3f}{max(timings):>16.3f}"
+            )
@@ -0,0 +1,128 @@
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from characters.benchmarking import isolated_database, percentile
+from characters.models import LiteraryCharacter
+
+SEED_BATCH_SIZE = 20_000
+WARMUP_REQUESTS = 5
+FAKE_BACKEND = {
+    'BACKEND': 'characters.llm.FakeBackend',
+    'MODEL': 'fake-model',
+    'OPTIONS': {'latency': 0, 'reply_tokens': 40, 'tokens_per_second': 100_000},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends authenticated /app/api/chat/ requests (against the fake LLM backend) with "
+        "each session engine and session cache backend, on a throwaway database seeded "
+        "with other users' sessions. Reports latency and queries per request, split into "
+        "session and user SELECTs, with the user cache on and off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Timed requests per configuration.")
+        parser.add_argument('--sessions', type=int, default=100_000, help="Other sessions seeded in django_session.")
+        parser.add_argument('--redis-url', help="Also measure a Redis session cache at this URL (requires the redis package).")
+
+    def handle(self, *args, **options):
+        cache_directory = tempfile.mkdtemp()
+        backends = {
+            'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-sessions'},
+            'file': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_directory},
+        }
+        if options['redis_url']:
+            backends['redis'] = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': options['redis_url']}
+        # (name, session store, session cache backend, user cache timeout)
+        configurations = [('db, no user cache', 'db', 'locmem', 0), ('db', 'db', 'locmem', None)]
+        for store in ('cached_db', 'cache'):
+            configurations += [(f'{store}, {backend}', store, backend, None) for backend in backends]
+
+        rows = []
+        try:
+            with isolated_database(), override_settings(LLM_BACKEND=FAKE_BACKEND, LLM_UPSTREAM_LIMITS={}):
+                self._seed_sessions(options['sessions'])
+                character = LiteraryCharacter.objects.create(
+                    name="Elizabeth Bennet", book="Pride and Prejudice", author="Jane Austen", description="A witty young woman."
+                )
+                for number, (name, store, backend, user_cache_timeout) in enumerate(configurations):
+                    overrides = {
+                        'SESSION_ENGINE': f'django.contrib.sessions.backends.{store}',
+                        'CACHES': {**settings.CACHES, settings.SESSION_CACHE_ALIAS: backends[backend]},
+                    }
+                    if user_cache_timeout is not None:
+                        overrides['AUTH_USER_CACHE_TIMEOUT'] = user_cache_timeout
+                    with override_settings(**overrides):
+                        for alias in caches:
+                            caches[alias].clear()
+                        # A user of its own, so every configuration chats over the same history length
+                        user = get_user_model().objects.create_user(f'reader{number}', f'reader{number}@example.com')
+                        rows.append((name, self._run(user, character, options['requests'])))
+        finally:
+            shutil.rmtree(cache_directory, ignore_errors=True)
+
+        self.stdout.write(
+            f"\n{options['requests']} chat requests per configuration, {options['sessions']} other sessions stored"
+        )
+        self.stdout.write(
+            f"{'session engine, cache':<22}{'p50 (ms)':>10}{'p95 (ms)':>10}{'mean (ms)':>11}"
+            f"{'queries':>9}{'session q':>11}{'user q':>8}{'errors':>8}"
+        )
+        for name, row in rows:
+            self.stdout.write(
+                f"{name:<22}{percentile(row['latencies'], 50):>10.2f}{percentile(row['latencies'], 95):>10.2f}"
+                f"{statistics.mean(row['latencies']):>11.2f}{row['queries']:>9.2f}{row['session_queries']:>11.2f}"
+                f"{row['user_queries']:>8.2f}{row['errors']:>8}"
+            )
+        if 'redis' not in backends:
+            self.stdout.write("(Pass --redis-url to compare a Redis session cache.)")
+
+    def _seed_sessions(self, count):
+        """Bulk-inserts unexpired sessions, so the session SELECT runs against a realistically sized table."""
+        started = time.perf_counter()
+        expire_date = timezone.now() + timedelta(days=14)
+        for batch_start in range(0, count, SEED_BATCH_SIZE):
+            Session.objects.bulk_create(
+                Session(session_key=get_random_string(32), session_data='', expire_date=expire_date)
+                for _ in range(batch_start, min(batch_start + SEED_BATCH_SIZE, count))
+            )
+        self.stdout.write(f"Seeded {count} sessions in {time.perf_counter() - started:.1f}s")
+
+    def _run(self, user, character, requests):
+        """Latencies and mean queries of chat requests from one logged-in client."""
+        client = Client() # Built under the overrides: SessionMiddleware reads SESSION_ENGINE once
+        client.force_login(user)
+        session_table, user_table = Session._meta.db_table, get_user_model()._meta.db_table
+        latencies, counts, errors = [], {'queries': 0, 'session_queries': 0, 'user_queries': 0}, 0
+        for turn in range(WARMUP_REQUESTS + requests):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.post(
+                    '/app/api/chat/', {'character_id': character.id, 'message': f"Tell me more, part {turn}."},
+                    content_type='application/json',
+                )
+                elapsed = time.perf_counter() - started
+            if turn < WARMUP_REQUESTS: # The first requests load the session and the user into the caches
+                continue
+            latencies.append(elapsed * 1000)
+            errors += response.status_code != 200
+            counts['queries'] += len(queries)
+            for query in queries:
+                counts['session_queries'] += query['sql'].startswith('SELECT') and f'"{session_table}"' in query['sql']
+                counts['user_queries'] += query['sql'].startswith('SELECT') and f'FROM "{user_table}"' in query['sql']
+        return {'latencies': latencies, 'errors': errors, **{key: value / requests for key, value in counts.items()}}
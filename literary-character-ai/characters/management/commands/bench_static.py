@@ -0,0 +1,118 @@
+import re
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.http import HttpResponseNotFound
+from django.test import Client, RequestFactory, override_settings
+from django.views.static import serve
+
+from characters.benchmarking import isolated_database
+from characters.models import LiteraryCharacter
+from characters.staticfiles import StaticFilesMiddleware, _brotli
+
+STATIC_URL_PATTERN = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+
+
+class Command(BaseCommand):
+    help = (
+        "Collects the static files into a temporary directory as a production deploy "
+        "does (content-hashed names, gzip and Brotli variants), then reports the static "
+        "bytes each page makes the browser download uncompressed and precompressed, and "
+        "the throughput of serving a stylesheet with django.views.static.serve (how DEBUG "
+        "serves files) vs. StaticFilesMiddleware."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help="Requests timed per serving method.")
+
+    def handle(self, *args, **options):
+        static_root = tempfile.mkdtemp()
+        storages = {
+            **settings.STORAGES,
+            'staticfiles': {'BACKEND': 'characters.staticfiles.CompressedManifestStaticFilesStorage'},
+        }
+        encodings = ['identity', 'gzip'] + (['br'] if _brotli() else [])
+        try:
+            with override_settings(
+                DEBUG=False, STATIC_ROOT=static_root, STORAGES=storages, SERVE_STATIC_FILES=True, ALLOWED_HOSTS=['*'],
+            ):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                with isolated_database():
+                    page_bytes = self._page_bytes(encodings)
+                throughput = self._throughput(static_root, encodings, options['requests'])
+        finally:
+            shutil.rmtree(static_root, ignore_errors=True)
+
+        self.stdout.write("\nStatic bytes downloaded per page (first visit; hashed assets are cached forever after)")
+        self.stdout.write(f"{'page':<22}{'assets':>8}" + "".join(f"{f'{encoding} (KB)':>16}" for encoding in encodings))
+        for page, (assets, sizes) in page_bytes.items():
+            self.stdout.write(f"{page:<22}{assets:>8}" + "".join(f"{sizes[encoding] / 1024:>16.1f}" for encoding in encodings))
+        if 'br' not in encodings:
+            self.stdout.write("(Install the brotli package to compare Brotli variants.)")
+
+        self.stdout.write(f"\nServing {throughput.pop('asset')}, {options['requests']} requests each")
+        self.stdout.write(f"{'method':<34}{'requests/s':>12}{'bytes/response':>16}")
+        for method, (per_second, size) in throughput.items():
+            self.stdout.write(f"{method:<34}{per_second:>12.0f}{size:>16}")
+
+    def _page_bytes(self, encodings):
+        """Page name -> (static assets referenced, bytes downloaded by Accept-Encoding)."""
+        user = get_user_model().objects.create_user('reader', 'reader@example.com', 'bench-password')
+        character = LiteraryCharacter.objects.create(
+            name="Elizabeth Bennet", book="Pride and Prejudice", author="Jane Austen", description="A witty young woman."
+        )
+        pages = {
+            'landing': '/',
+            'login': '/accounts/login/',
+            'catalog': '/app/',
+            'character detail': f'/app/{character.id}/',
+            'conversation history': '/app/history/',
+        }
+        client = Client()
+        client.force_login(user)
+        results = {}
+        for page, url in pages.items():
+            assets = sorted(set(STATIC_URL_PATTERN.findall(client.get(url).content.decode())))
+            sizes = {}
+            for encoding in encodings:
+                sizes[encoding] = 0
+                for asset in assets:
+                    response = client.get(asset, headers={'Accept-Encoding': encoding})
+                    if response.status_code == 200:
+                        sizes[encoding] += len(response.getvalue())
+            results[page] = (len(assets), sizes)
+        return results
+
+    def _throughput(self, static_root, encodings, requests):
+        """Requests per second and response size of each way of serving the main stylesheet."""
+        from django.templatetags.static import static
+
+        url = static('css/styles.css')
+        path = url[len(settings.STATIC_URL):]
+        factory = RequestFactory()
+        middleware = StaticFilesMiddleware(lambda request: HttpResponseNotFound())
+        etag = middleware(factory.get(url, headers={'Accept-Encoding': 'gzip'}))['ETag']
+
+        methods = {'views.static.serve (identity)': lambda: serve(factory.get(url), path, document_root=static_root)}
+        for encoding in encodings:
+            methods[f'middleware ({encoding})'] = (
+                lambda encoding=encoding: middleware(factory.get(url, headers={'Accept-Encoding': encoding}))
+            )
+        methods['middleware (gzip, 304)'] = lambda: middleware(
+            factory.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        )
+
+        results = {'asset': url}
+        for method, call in methods.items():
+            started = time.perf_counter()
+            for _ in range(requests):
+                response = call()
+                size = len(response.getvalue()) if response.streaming else len(response.content)
+                response.close()
+            results[method] = (requests / (time.perf_counter() - started), size)
+        return results
@@ -0,0 +1,122 @@
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from characters.benchmarking import isolated_database
+from characters.models import LiteraryCharacter, Conversation, ChatMessage
+from characters.transfer import IMPORT_BATCH_SIZE, export_jsonl, import_jsonl
+
+CHARACTERS = 2
+SEED_BATCH_SIZE = 20_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database with many chat messages, exports them as JSONL, "
+        "deletes them and imports the export again. Reports the time and peak Python "
+        "memory of each step (traced with tracemalloc, which slows both down) and checks "
+        "that every message came back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10_000_000, help="ChatMessage rows to seed.")
+        parser.add_argument('--users', type=int, default=10_000, help="Users to spread them over.")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="Rows inserted per import statement.")
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if connection.vendor == 'sqlite':
+                # The in-memory test database would count the imported rows as process memory
+                settings_dict['TEST']['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+            try:
+                with isolated_database():
+                    rows = self._run(options, os.path.join(tmpdir, 'export.jsonl'))
+            finally:
+                settings_dict['TEST']['NAME'] = None
+
+        self.stdout.write(f"\n{options['messages']} messages, export file {rows.pop():.0f} MB")
+        self.stdout.write(f"{'step':<8}{'seconds':>9}{'rows/s':>11}{'peak memory (MB)':>18}")
+        for step, seconds, peak in rows:
+            self.stdout.write(f"{step:<8}{seconds:>9.1f}{options['messages'] / seconds:>11.0f}{peak:>18.1f}")
+
+    def _run(self, options, path):
+        """Seeds, exports to path and re-imports; returns (step, seconds, peak MB) rows and the export size in MB."""
+        self._seed(options['messages'], options['users'])
+
+        started = time.perf_counter()
+        with open(path, 'w', encoding='utf-8') as output:
+            export_peak = self._traced(lambda: output.writelines(export_jsonl()))
+        export_seconds = time.perf_counter() - started
+
+        # Raw deletes: the ORM's cascade would load every message ID first
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {ChatMessage._meta.db_table}")
+            cursor.execute(f"DELETE FROM {Conversation._meta.db_table}")
+
+        started = time.perf_counter()
+        with open(path, encoding='utf-8') as lines:
+            import_peak = self._traced(lambda: import_jsonl(lines, batch_size=options['batch_size']))
+        import_seconds = time.perf_counter() - started
+
+        imported = ChatMessage.objects.count()
+        if imported != options['messages']:
+            raise CommandError(f"Imported {imported} of {options['messages']} messages")
+        return [
+            ('export', export_seconds, export_peak),
+            ('import', import_seconds, import_peak),
+            os.path.getsize(path) / 1024 / 1024,
+        ]
+
+    def _traced(self, step):
+        """Runs step and returns the peak memory it allocated, in MB."""
+        tracemalloc.start()
+        try:
+            step()
+            return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        finally:
+            tracemalloc.stop()
+
+    def _seed(self, message_count, user_count):
+        """Bulk-inserts users, conversations and messages, bypassing the ORM for the messages."""
+        started = time.perf_counter()
+        user_model = get_user_model()
+        user_model.objects.bulk_create(
+            (user_model(username=f'bench{i}', email=f'bench{i}@example.com') for i in range(user_count)), batch_size=5000
+        )
+        LiteraryCharacter.objects.bulk_create(
+            LiteraryCharacter(name=f"Character {i}", book="Benchmarks", author="Anonymous", description="A patient character.")
+            for i in range(CHARACTERS)
+        )
+        users = list(user_model.objects.values_list('id', flat=True))
+        characters = list(LiteraryCharacter.objects.values_list('id', flat=True))
+        Conversation.objects.bulk_create(
+            (Conversation(user_id=user_id, character_id=character_id) for user_id in users for character_id in characters),
+            batch_size=5000,
+        )
+        conversations = list(Conversation.objects.values_list('id', flat=True))
+
+        rng = random.Random(0)
+        start = timezone.now() - timedelta(days=365)
+        insert = (
+            f'INSERT INTO {ChatMessage._meta.db_table} (conversation_id, message_text, is_user_message, "timestamp") '
+            f'VALUES (%s, %s, %s, %s)'
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            for batch_start in range(0, message_count, SEED_BATCH_SIZE):
+                cursor.executemany(insert, [
+                    (rng.choice(conversations), f"Seeded message number {i} about the book.", i % 2 == 0,
+                     start + timedelta(seconds=i))
+                    for i in range(batch_start, min(batch_start + SEED_BATCH_SIZE, message_count))
+                ])
+        self.stdout.write(
+            f"Seeded {message_count} messages in {len(conversations)} conversations in {time.perf_counter() - started:.1f}s"
+        )
@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from characters.backends import users_with_email
+from characters.transfer import export_jsonl
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports conversations and their messages as JSON Lines, streamed in constant "
+        "memory. Writes to stdout unless --output is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help="File to write the export to.")
+        parser.add_argument('--user', help="Only export the conversations of the user with this email.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = users_with_email(options['user']).order_by('id').first()
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}")
+
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            lines = 0
+            for line in export_jsonl(user=user):
+                output.write(line)
+                lines += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Exported {lines - 1} records to {options['output']}."))
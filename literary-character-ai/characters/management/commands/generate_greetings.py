@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from characters.greetings import generate_greeting_pool, greeting_pool_is_current
+from characters.llm import LLMError, get_backend
+from characters.models import LiteraryCharacter
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the greeting pools (opening lines and replies to common first "
+        "messages) of characters that have none or whose persona changed since, "
+        "calling the LLM for several characters at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('character_ids', nargs='*', type=int, help="Only these characters (default: all).")
+        parser.add_argument('--workers', type=int, default=4, help="Characters generated concurrently.")
+        parser.add_argument('--force', action='store_true', help="Regenerate current pools too.")
+
+    def handle(self, *args, **options):
+        characters = LiteraryCharacter.objects.order_by('id')
+        if options['character_ids']:
+            characters = characters.filter(pk__in=options['character_ids'])
+        pending = [
+            character for character in characters
+            if options['force'] or not greeting_pool_is_current(character)
+        ]
+        if not pending:
+            self.stdout.write("All greeting pools are current.")
+            return
+
+        # The upstream calls run in threads (the LLM_UPSTREAM_LIMITS limiter still
+        # applies); only this thread touches the database
+        backend = get_backend()
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(generate_greeting_pool, character, backend): character for character in pending}
+            for future in as_completed(futures):
+                character = futures[future]
+                try:
+                    pool = future.result()
+                except LLMError as e:
+                    failed += 1
+                    self.stderr.write(f"{character.name}: {e}")
+                    continue
+                # update() skips the save signals: nothing derived from the character changes
+                LiteraryCharacter.objects.filter(pk=character.pk).update(greeting_pool=pool)
+                done += 1
+                self.stdout.write(f"{character.name}: {len(pool['greetings'])} greetings, {len(pool['replies'])} replies")
+
+        self.stdout.write(self.style.SUCCESS(f"Generated greeting pools for {done} characters ({failed} failed)."))
@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from characters.catalog import bump_catalog_version
+from characters.models import LiteraryCharacter
+from characters.renditions import generate_renditions, rendition_files, renditions_are_current
+
+
+def _generate(character_id, image_name):
+    # Runs in a worker process; only touches storage, the parent writes the results
+    return character_id, generate_renditions(image_name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the resized WebP/JPEG renditions of character images that don't have "
+        "current ones yet (e.g. images uploaded before renditions existed), encoding "
+        "images in parallel worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes.")
+        parser.add_argument('--force', action='store_true', help="Regenerate renditions of every image.")
+
+    def handle(self, *args, **options):
+        characters = LiteraryCharacter.objects.exclude(image__isnull=True).exclude(image__exact='')
+        pending = [
+            (character.pk, character.image.name)
+            for character in characters.only('id', 'image', 'image_renditions')
+            if options['force'] or not renditions_are_current(character)
+        ]
+        if not pending:
+            self.stdout.write("All character images have current renditions.")
+            return
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        done = failed = 0
+        # Spawned workers (the default on macOS and Windows) start without
+        # loaded apps, so django.setup() runs before _generate is unpickled;
+        # DJANGO_SETTINGS_MODULE is inherited. In forked workers it's a no-op.
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            futures = {executor.submit(_generate, *job): job for job in pending}
+            for future in as_completed(futures):
+                character_id, image_name = futures[future]
+                try:
+                    _, renditions = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{image_name}: {e}")
+                    continue
+                LiteraryCharacter.objects.filter(pk=character_id).update(image_renditions=renditions)
+                done += 1
+                self.stdout.write(f"{image_name}: {len(rendition_files(renditions))} renditions")
+
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Generated renditions for {done} images ({failed} failed)."))
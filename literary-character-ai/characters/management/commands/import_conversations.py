@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from characters.transfer import IMPORT_BATCH_SIZE, import_jsonl
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports conversations and messages from a JSON Lines export, in batches "
+        "within one transaction. Users are matched by email and characters by name "
+        "and book; conversations that already exist are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Export file to import.")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="Rows inserted per statement.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8') as lines:
+                stats = import_jsonl(lines, batch_size=options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e)) from e
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['conversations']} conversations and {stats['messages']} messages."
+        ))
+        if stats['skipped_conversations']:
+            self.stdout.write(
+                f"Skipped {stats['skipped_conversations']} conversations ({stats['skipped_messages']} messages) "
+                f"that already exist or whose user or character wasn't found."
+            )
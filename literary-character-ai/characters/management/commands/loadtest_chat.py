@@ -0,0 +1,135 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+from characters.benchmarking import chat_api_routing, isolated_database, percentile
+from characters.llm import get_backend
+from characters.models import LiteraryCharacter
+
+
+# The upstream limiter (see characters/upstream.py) is disabled so the runs
+# measure how many requests the Django side can hold in flight
+NO_UPSTREAM_LIMITS = {}
+
+
+def _fake_backend_settings(latency):
+    return {
+        'BACKEND': 'characters.llm.FakeBackend',
+        'MODEL': 'fake-model',
+        'OPTIONS': {'latency': latency, 'reply_tokens': 12, 'tokens_per_second': 1000},
+    }
+
+
+def _messages(count):
+    """Distinct chat messages, so identical concurrent prompts aren't coalesced into one upstream call."""
+    return [f"Hello there, I am visitor {i}" for i in range(count)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests /app/api/chat/ against the fake LLM backend, comparing the sync "
+        "view on a fixed number of WSGI worker threads with the async view on a single "
+        "ASGI event loop. Runs in-process against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="Concurrent chat requests to issue per run.")
+        parser.add_argument('--latency', type=float, default=0.5, help="Simulated upstream latency in seconds.")
+        parser.add_argument('--workers', type=int, default=1, help="Sync worker threads (a WSGI worker serves one request per thread).")
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            user_model = get_user_model()
+            users = [
+                user_model.objects.create(username=f'loadtest{i}', email=f'loadtest{i}@example.com')
+                for i in range(options['requests'])
+            ]
+            character = LiteraryCharacter.objects.create(
+                name="Load Test", book="Benchmarks", author="Anonymous", description="A patient character."
+            )
+
+            results = [
+                self._run_sync(users, character, options),
+                self._run_async(users, character, options),
+            ]
+
+        self.stdout.write(
+            f"\n{options['requests']} requests, simulated upstream latency {options['latency']:.2f}s\n"
+        )
+        self.stdout.write(f"{'mode':<22}{'wall (s)':>10}{'req/s':>10}{'peak in-flight':>16}{'p50 (s)':>10}{'p95 (s)':>10}{'errors':>8}")
+        for row in results:
+            self.stdout.write(
+                f"{row['mode']:<22}{row['elapsed']:>10.2f}{row['throughput']:>10.1f}{row['peak']:>16}"
+                f"{row['p50']:>10.2f}{row['p95']:>10.2f}{row['errors']:>8}"
+            )
+
+    def _summarize(self, mode, started, latencies, statuses):
+        elapsed = time.perf_counter() - started
+        return {
+            'mode': mode,
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed,
+            'peak': get_backend().peak_in_flight,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'errors': sum(1 for code in statuses if code != 200),
+        }
+
+    def _run_sync(self, users, character, options):
+        clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+
+        def send(client, message):
+            response = client.post(
+                '/app/api/chat/', {'character_id': character.id, 'message': message},
+                content_type='application/json'
+            )
+            # Latency as seen by the caller, including time queued behind busy workers
+            return time.perf_counter() - started, response.status_code
+
+        with chat_api_routing(False), override_settings(
+            LLM_BACKEND=_fake_backend_settings(options['latency']), LLM_UPSTREAM_LIMITS=NO_UPSTREAM_LIMITS
+        ):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                outcomes = list(pool.map(send, clients, _messages(len(clients))))
+            latencies, statuses = zip(*outcomes)
+            return self._summarize(f"sync, {options['workers']} thread(s)", started, list(latencies), statuses)
+
+    def _run_async(self, users, character, options):
+        async def login_all():
+            clients = []
+            for user in users:
+                client = AsyncClient()
+                await client.aforce_login(user)
+                clients.append(client)
+            return clients
+
+        async def send(client, message, started):
+            response = await client.post(
+                '/app/api/chat/', {'character_id': character.id, 'message': message},
+                content_type='application/json'
+            )
+            return time.perf_counter() - started, response.status_code
+
+        async def send_all(clients):
+            started = time.perf_counter()
+            outcomes = await asyncio.gather(
+                *(send(client, message, started) for client, message in zip(clients, _messages(len(clients))))
+            )
+            return started, outcomes
+
+        with chat_api_routing(True), override_settings(
+            LLM_BACKEND=_fake_backend_settings(options['latency']), LLM_UPSTREAM_LIMITS=NO_UPSTREAM_LIMITS
+        ):
+            clients = asyncio.run(login_all())
+            started, outcomes = asyncio.run(send_all(clients))
+            latencies, statuses = zip(*outcomes)
+            return self._summarize("async, 1 event loop", started, list(latencies), statuses)
@@ -0,0 +1,128 @@
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+
+from characters.benchmarking import isolated_database, percentile
+from characters.models import LiteraryCharacter, ChatMessage
+from literary_character_project.database import sqlite_options
+
+
+def _fake_backend_settings(latency):
+    return {
+        'BACKEND': 'characters.llm.FakeBackend',
+        'MODEL': 'fake-model',
+        'OPTIONS': {'latency': latency, 'reply_tokens': 12, 'tokens_per_second': 100_000},
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends chat turns to /app/api/chat/ from concurrent threads against the fake LLM "
+        "backend and compares database profiles: SQLite with default journaling vs. the "
+        "SQLITE_TUNED settings, or PostgreSQL without vs. with persistent connections "
+        "(as configured by DATABASE_URL). Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent clients, each in its own thread.")
+        parser.add_argument('--turns', type=int, default=25, help="Chat turns sent by each client.")
+        parser.add_argument('--latency', type=float, default=0.0, help="Simulated upstream latency in seconds.")
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        original_options, original_max_age = dict(settings_dict['OPTIONS']), settings_dict['CONN_MAX_AGE']
+
+        if connection.vendor == 'sqlite':
+            profiles = [
+                # journal_mode is stored in the database file, so switch it back explicitly
+                ("sqlite, default journaling", {'init_command': 'PRAGMA journal_mode=DELETE'}, 0),
+                ("sqlite, SQLITE_TUNED", sqlite_options(True), 0),
+            ]
+        else:
+            profiles = [
+                (f"{connection.vendor}, new connection per request", original_options, 0),
+                (f"{connection.vendor}, as configured", original_options, original_max_age),
+            ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if connection.vendor == 'sqlite':
+                # Locking only matters for a database file, not the in-memory test database
+                settings_dict['TEST']['NAME'] = str(Path(tmpdir) / 'loadtest.sqlite3')
+
+            rows = []
+            try:
+                with isolated_database(), override_settings(
+                    LLM_BACKEND=_fake_backend_settings(options['latency']), LLM_UPSTREAM_LIMITS={}
+                ):
+                    clients, character = self._setup(options['threads'])
+                    for label, db_options, max_age in profiles:
+                        connections.close_all()
+                        settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE'] = db_options, max_age
+                        rows.append(self._run(label, clients, character, options['turns']))
+            finally:
+                settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE'] = original_options, original_max_age
+                settings_dict['TEST']['NAME'] = None
+
+        self.stdout.write(f"\n{options['threads']} clients x {options['turns']} chat turns, upstream latency {options['latency']:.2f}s\n")
+        self.stdout.write(f"{'profile':<34}{'turns/s':>9}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'errors':>8}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['label']:<34}{row['throughput']:>9.1f}{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}{row['errors']:>8}"
+            )
+
+    def _setup(self, threads):
+        user_model = get_user_model()
+        character = LiteraryCharacter.objects.create(
+            name="Load Test", book="Benchmarks", author="Anonymous", description="A patient character."
+        )
+        clients = []
+        for i in range(threads):
+            client = Client()
+            client.force_login(user_model.objects.create(username=f'dbload{i}', email=f'dbload{i}@example.com'))
+            clients.append(client)
+        return clients, character
+
+    def _run(self, label, clients, character, turns):
+        ChatMessage.objects.all().delete()
+        latencies, statuses = [], []
+        lock = threading.Lock()
+        start = threading.Barrier(len(clients) + 1)
+
+        def send_turns(client):
+            start.wait()
+            try:
+                for turn in range(turns):
+                    started = time.perf_counter()
+                    response = client.post(
+                        '/app/api/chat/', {'character_id': character.id, 'message': f"Turn {turn}"},
+                        content_type='application/json'
+                    )
+                    with lock:
+                        latencies.append((time.perf_counter() - started) * 1000)
+                        statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=send_turns, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'label': label,
+            'throughput': len(latencies) / elapsed,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'errors': sum(1 for code in statuses if code != 200),
+        }
@@ -0,0 +1,227 @@
+import json
+import random
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from characters.benchmarking import isolated_database, percentile
+from characters.models import LiteraryCharacter, Conversation, ChatMessage
+
+SEED_BATCH_SIZE = 20_000
+
+
+def _fake_backend_settings(latency):
+    return {
+        'BACKEND': 'characters.llm.FakeBackend',
+        'MODEL': 'fake-model',
+        'OPTIONS': {'latency': latency, 'reply_tokens': 40, 'tokens_per_second': 100_000},
+    }
+
+
+# Scenario name -> function(client, target, turn) sending one request. target is a
+# (user_id, character_id) pair the client's user has a seeded conversation with.
+SCENARIOS = {
+    'landing': lambda client, target, turn: client.get('/'),
+    'catalog': lambda client, target, turn: client.get('/app/'),
+    'character_detail': lambda client, target, turn: client.get(f'/app/{target[1]}/'),
+    'conversation_history': lambda client, target, turn: client.get('/app/history/'),
+    'chat': lambda client, target, turn: client.post(
+        '/app/api/chat/', {'character_id': target[1], 'message': f"Tell me more, part {turn}."},
+        content_type='application/json',
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database with users, characters and conversations with long "
+        "histories, then sends requests to the landing page, the catalog, character_detail, "
+        "conversation_history and /app/api/chat/ (against the fake LLM backend) from "
+        "concurrent clients. Reports throughput, p50/p95/p99 latency and queries per request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help="Users to seed.")
+        parser.add_argument('--characters', type=int, default=300, help="Characters to seed.")
+        parser.add_argument('--conversations', type=int, default=5, help="Conversations seeded per user.")
+        parser.add_argument('--history', type=int, default=200, help="Messages seeded per conversation.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients, each in its own thread.")
+        parser.add_argument('--requests', type=int, default=400, help="Requests sent per scenario, over all clients.")
+        parser.add_argument('--latency', type=float, default=0.0, help="Simulated upstream latency in seconds.")
+        parser.add_argument(
+            '--scenarios', default=','.join(SCENARIOS),
+            help=f"Comma-separated scenarios to run, out of: {', '.join(SCENARIOS)}.",
+        )
+        parser.add_argument('--json', metavar='PATH', help="Also write the results to PATH, e.g. to compare branches.")
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        if options['concurrency'] > options['users']:
+            raise CommandError("--concurrency can't exceed --users: every client logs in as its own user.")
+
+        settings_dict = connection.settings_dict
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if connection.vendor == 'sqlite':
+                # Concurrent writers need a database file, not the in-memory test database
+                settings_dict['TEST']['NAME'] = str(Path(tmpdir) / 'loadtest.sqlite3')
+            rows = []
+            try:
+                with isolated_database(), override_settings(
+                    LLM_BACKEND=_fake_backend_settings(options['latency']), LLM_UPSTREAM_LIMITS={}
+                ):
+                    self._seed(options)
+                    clients = self._clients(options['concurrency'])
+                    for name in scenarios:
+                        for alias in caches: # Every scenario starts cold and warms up as it runs
+                            caches[alias].clear()
+                        rows.append(self._run(name, clients, options['requests']))
+            finally:
+                settings_dict['TEST']['NAME'] = None
+
+        self.stdout.write(
+            f"\n{options['concurrency']} clients x {options['requests']} requests per scenario, "
+            f"{options['history']} messages per conversation, upstream latency {options['latency']:.2f}s\n"
+        )
+        self.stdout.write(
+            f"{'scenario':<22}{'req/s':>9}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}"
+            f"{'queries':>9}{'max q':>7}{'errors':>8}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['scenario']:<22}{row['throughput']:>9.1f}{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}"
+                f"{row['queries']:>9.1f}{row['max_queries']:>7}{row['errors']:>8}"
+            )
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump({'options': {key: options[key] for key in (
+                    'users', 'characters', 'conversations', 'history', 'concurrency', 'requests', 'latency',
+                )}, 'results': rows}, output, indent=2)
+
+    def _seed(self, options):
+        """Bulk-inserts users, characters and conversations, bypassing the ORM for the messages."""
+        started = time.perf_counter()
+        user_model = get_user_model()
+        user_model.objects.bulk_create(
+            user_model(username=f'load{i}', email=f'load{i}@example.com') for i in range(options['users'])
+        )
+        LiteraryCharacter.objects.bulk_create(
+            LiteraryCharacter(
+                name=f"Character {i}", book=f"Book {i % 50}", author=f"Author {i % 20}",
+                description="A patient character who answers every question at length. " * 4,
+            )
+            for i in range(options['characters'])
+        )
+        users = list(user_model.objects.values_list('id', flat=True))
+        characters = list(LiteraryCharacter.objects.values_list('id', flat=True))
+
+        rng = random.Random(0)
+        per_user = min(options['conversations'], len(characters))
+        Conversation.objects.bulk_create(
+            Conversation(user_id=user_id, character_id=character_id)
+            for user_id in users for character_id in rng.sample(characters, per_user)
+        )
+        conversations = list(Conversation.objects.values_list('id', flat=True))
+
+        history = options['history']
+        start = timezone.now() - timedelta(days=30)
+        table = ChatMessage._meta.db_table
+        insert = (
+            f'INSERT INTO {table} (conversation_id, message_text, is_user_message, "timestamp") '
+            f'VALUES (%s, %s, %s, %s)'
+        )
+        rows = (
+            (conversation_id, f"Seeded message number {i} about the book and its chapters.", i % 2 == 0,
+             start + timedelta(seconds=i * 10))
+            for conversation_id in conversations for i in range(history)
+        )
+        with connection.cursor() as cursor:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == SEED_BATCH_SIZE:
+                    cursor.executemany(insert, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(insert, batch)
+
+        if history:
+            Conversation.objects.update(
+                message_count=history, last_message_preview="Seeded message about the book and its chapters.",
+            )
+        self.stdout.write(
+            f"Seeded {len(users)} users, {len(characters)} characters and {len(conversations)} conversations "
+            f"of {history} messages in {time.perf_counter() - started:.1f}s"
+        )
+
+    def _clients(self, count):
+        """Logged-in clients, each with the conversations of its own user."""
+        clients = []
+        for user in get_user_model().objects.order_by('id')[:count]:
+            client = Client()
+            client.force_login(user)
+            targets = list(Conversation.objects.filter(user=user).values_list('user_id', 'character_id'))
+            clients.append((client, targets))
+        return clients
+
+    def _run(self, name, clients, requests):
+        send = SCENARIOS[name]
+        latencies, query_counts, statuses = [], [], []
+        lock = threading.Lock()
+        start = threading.Barrier(len(clients) + 1)
+        remaining = iter(range(requests))
+
+        def send_requests(client, targets):
+            rng = random.Random(id(client))
+            start.wait()
+            try:
+                while True:
+                    with lock:
+                        turn = next(remaining, None)
+                    if turn is None:
+                        return
+                    # Queries are counted on this thread's own connection
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        response = send(client, rng.choice(targets), turn)
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                        elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed * 1000)
+                        query_counts.append(len(queries))
+                        statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=send_requests, args=client) for client in clients]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'scenario': name,
+            'throughput': len(latencies) / elapsed,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'queries': sum(query_counts) / len(query_counts) if query_counts else 0.0,
+            'max_queries': max(query_counts, default=0),
+            'errors': sum(1 for code in statuses if code != 200),
+        }
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from characters.benchmarking import percentile
+from characters.llm import LLMError, get_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends a burst of concurrent completions to the fake LLM backend, which fails a "
+        "share of them with simulated 429s, once without the upstream limiter and once "
+        "through it, and compares errors, latency and queue wait. No database or network "
+        "access is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Concurrent completions in the burst.")
+        parser.add_argument('--latency', type=float, default=0.2, help="Simulated upstream latency in seconds.")
+        parser.add_argument('--rate-limit-rate', type=float, default=0.2, help="Fraction of upstream calls failing with a 429.")
+        parser.add_argument('--retry-after', type=float, default=0.5, help="Retry-After seconds reported with the 429s.")
+        parser.add_argument('--max-concurrency', type=int, default=32, help="Limiter: concurrent upstream calls.")
+        parser.add_argument('--rate', type=float, default=0, help="Limiter: calls admitted per second (0 for no limit).")
+        parser.add_argument('--queue-timeout', type=float, default=15.0, help="Limiter: seconds a call may wait to start.")
+
+    def handle(self, *args, **options):
+        backend_settings = {
+            'BACKEND': 'characters.llm.FakeBackend',
+            'MODEL': 'fake-model',
+            'OPTIONS': {
+                'latency': options['latency'],
+                'reply_tokens': 12,
+                'tokens_per_second': 1000,
+                'rate_limit_rate': options['rate_limit_rate'],
+                'retry_after': options['retry_after'],
+            },
+        }
+        limits = {
+            'MAX_CONCURRENCY': options['max_concurrency'],
+            'RATE': options['rate'],
+            'BURST': max(1, options['max_concurrency']),
+            'MAX_QUEUE': options['requests'],
+            'QUEUE_TIMEOUT': options['queue_timeout'],
+            'MAX_RETRIES': 3,
+        }
+
+        rows = []
+        for mode, upstream_limits in (("no limiter", {}), ("limiter", limits)):
+            with override_settings(LLM_BACKEND=backend_settings, LLM_UPSTREAM_LIMITS=upstream_limits):
+                rows.append(self._run(mode, options['requests']))
+
+        self.stdout.write(
+            f"\n{options['requests']} concurrent completions, {options['rate_limit_rate']:.0%} simulated 429s "
+            f"(Retry-After {options['retry_after']:.2f}s)\n"
+        )
+        self.stdout.write(
+            f"{'mode':<12}{'errors':>8}{'retries':>9}{'peak in-flight':>16}{'p50 (s)':>9}{'p95 (s)':>9}"
+            f"{'wait p50 (s)':>14}{'wait p95 (s)':>14}{'wait max (s)':>14}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['mode']:<12}{row['errors']:>8}{row['retries']:>9}{row['peak']:>16}{row['p50']:>9.2f}{row['p95']:>9.2f}"
+                f"{row['queue_wait_p50']:>14.2f}{row['queue_wait_p95']:>14.2f}{row['queue_wait_max']:>14.2f}"
+            )
+
+    def _run(self, mode, requests):
+        backend = get_backend()
+
+        async def send(i, started):
+            messages = [{"role": "user", "content": f"Burst message {i}"}]
+            try:
+                await backend.acomplete(messages, temperature=0.7, max_tokens=50)
+                failed = False
+            except LLMError:
+                failed = True
+            return time.perf_counter() - started, failed
+
+        async def burst():
+            started = time.perf_counter()
+            return await asyncio.gather(*(send(i, started) for i in range(requests)))
+
+        latencies, failures = zip(*asyncio.run(burst()))
+        stats = backend.stats.snapshot() if hasattr(backend, 'stats') else {}
+        return {
+            'mode': mode,
+            'errors': sum(failures),
+            'retries': stats.get('retries', 0),
+            'peak': backend.peak_in_flight,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'queue_wait_p50': stats.get('queue_wait_p50', 0.0),
+            'queue_wait_p95': stats.get('queue_wait_p95', 0.0),
+            'queue_wait_max': stats.get('queue_wait_max', 0.0),
+        }
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from characters.archive import PURGE_BATCH_SIZE, purge_before
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes messages older than CHAT_RETENTION_DAYS, archived ones included, and "
+        "conversations idle since then, in batches of bounded size so chat traffic keeps "
+        "flowing while it runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None, help="Days (default: CHAT_RETENTION_DAYS).")
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help="Rows deleted per transaction.")
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **options):
+        days = settings.CHAT_RETENTION_DAYS if options['older_than'] is None else options['older_than']
+        if days <= 0:
+            raise CommandError("No retention period: set CHAT_RETENTION_DAYS or pass --older-than.")
+        stats = purge_before(timezone.now() - timedelta(days=days), batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {stats['messages']} messages ({stats['archives']} archive blobs) and "
+            f"{stats['conversations']} conversations older than {days} days."
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from characters.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the character search index from the characters table. Needed on SQLite "
+        "after characters are written in bulk (bulk_create, update() or raw SQL), which "
+        "bypasses the save/delete signals that keep it in sync."
+    )
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} characters."))
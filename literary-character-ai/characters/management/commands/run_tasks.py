@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from characters.tasks import MAINTENANCE_INTERVAL, maintain_queue, run_due_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs queued background tasks (e.g. conversation summaries) until stopped, "
+        "polling the task table for new ones. Use with TASK_WORKER=external; several "
+        "workers can run at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the tasks that are due, then exit.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            maintain_queue()
+            self.stdout.write(f"Ran {run_due_tasks()} tasks.")
+            return
+
+        self.stdout.write("Waiting for tasks. Quit with CONTROL-C.")
+        last_maintenance = 0.0
+        try:
+            while True:
+                if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                    maintain_queue()
+                    last_maintenance = time.monotonic()
+                ran = run_due_tasks()
+                if ran:
+                    self.stdout.write(f"Ran {ran} tasks.")
+                close_old_connections()
+                time.sleep(settings.TASK_QUEUE['POLL_INTERVAL'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,184 @@
+"""
+In-process metrics in the Prometheus text format, served at /metrics.
+
+Counters and histograms are kept per process, like the upstream limiter's
+stats: scrape every worker (or run a single one) to see all traffic.
+Collectors registered with register_collector() add values computed at
+scrape time, such as the completion cache and task queue statistics.
+
+Chat views time their phases with span(); each phase is observed in the
+inkpersona_request_phase_seconds histogram and, for the current request, sent
+back in a Server-Timing header by MetricsMiddleware.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a cached page to a slow upstream generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, optionally split by labels."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), {'count': 0})['count']
+
+    def samples(self):
+        with self._lock:
+            values = {key: {**series, 'buckets': list(series['buckets'])} for key, series in self._values.items()}
+        lines = []
+        for key, series in sorted(values.items()):
+            for bound, count in zip(self.buckets, series['buckets']):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'inkpersona_http_request_duration_seconds', "Time until a response is returned (the headers, for streamed responses), by view.", ('view', 'method', 'status'),
+)
+PHASE_LATENCY = Histogram(
+    'inkpersona_request_phase_seconds', "Time spent in each phase of a request: chat turn phases and response rendering.", ('phase',),
+)
+LLM_TOKENS = Counter(
+    'inkpersona_llm_tokens_total', "Tokens sent to and generated by the LLM, as reported by the upstream.", ('direction',),
+)
+CHAT_ERRORS = Counter(
+    'inkpersona_chat_errors_total', "Chat turns that failed because of the upstream, by error class.", ('error',),
+)
+
+_metrics = [REQUEST_LATENCY, PHASE_LATENCY, LLM_TOKENS, CHAT_ERRORS]
+_collectors = []
+
+
+def register_collector(collect):
+    """
+    Registers a function called on every scrape that returns
+    (name, kind, documentation, value) tuples, kind being 'counter' or 'gauge'.
+    """
+    _collectors.append(collect)
+    return collect
+
+
+def render_metrics():
+    """Returns all metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in _metrics:
+        lines += metric.header() + metric.samples()
+    for collect in _collectors:
+        for name, kind, documentation, value in collect():
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {_format_value(value)}"]
+    return '\n'.join(lines) + '\n'
+
+
+# --- Chat Phase Timing ---
+
+def record_span(phase, seconds):
+    """Records a phase of the current chat turn that was timed elsewhere."""
+    PHASE_LATENCY.observe(seconds, phase=phase)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans[phase] = spans.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def span(phase):
+    """Times the enclosed block as a phase of the current chat turn."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(phase, time.perf_counter() - started)
+
+
+def record_usage(prompt_tokens, completion_tokens):
+    """Counts the tokens of an upstream call."""
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, direction='prompt')
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, direction='completion')
+
+
+def start_request_spans():
+    """Starts collecting the spans of the current request; returns the dict they are collected in."""
+    spans = {}
+    _request_spans.set(spans)
+    return spans
@@ -0,0 +1,51 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import REQUEST_LATENCY, record_span, start_request_spans
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every request in the per-view histogram and
+    reports the chat phases timed during the request (see metrics.span) in a
+    Server-Timing header, which browser dev tools show next to the request.
+    Works for both sync and async views without switching threads.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started, spans = time.perf_counter(), start_request_spans()
+        response = self.get_response(request)
+        return self._finish(request, response, started, spans)
+
+    async def __acall__(self, request):
+        started, spans = time.perf_counter(), start_request_spans()
+        response = await self.get_response(request)
+        return self._finish(request, response, started, spans)
+
+    def process_template_response(self, request, response):
+        # Template and DRF responses are rendered after the view returns; time that as its own phase
+        render_started = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: record_span('render', time.perf_counter() - render_started))
+        return response
+
+    def _finish(self, request, response, started, spans):
+        match = request.resolver_match
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - started,
+            view=match.view_name if match else 'unmatched',
+            method=request.method,
+            status=f"{response.status_code // 100}xx",
+        )
+        if spans:
+            response['Server-Timing'] = ', '.join(f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in spans.items())
+        return response
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0003_conversation_chatmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='summarized_up_to',
+            field=models.BigIntegerField(blank=True, help_text='ID of the newest message folded into the summary.', null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True, default='', help_text='Rolling summary of the messages that no longer fit in the prompt history.'),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='is_user_message',
+            field=models.BooleanField(default=True, help_text='True if the message is from the user, False if from the character/AI.'),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, help_text='Timestamp when the message was created.'),
+        ),
+        migrations.AlterField(
+            model_name='conversation',
+            name='last_updated',
+            field=models.DateTimeField(auto_now=True, help_text='Timestamp of the last message in the conversation.'),
+        ),
+        migrations.AlterField(
+            model_name='literarycharacter',
+            name='description',
+            field=models.TextField(help_text="Detailed description of the character's personality, background, and speech patterns."),
+        ),
+        migrations.AlterField(
+            model_name='literarycharacter',
+            name='emoji',
+            field=models.CharField(blank=True, help_text='Optional emoji representation.', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='literarycharacter',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Optional image for the character.', null=True, upload_to='character_images/'),
+        ),
+        migrations.AlterField(
+            model_name='literarycharacter',
+            name='tags',
+            field=models.JSONField(default=list, help_text='List of keywords associated with the character.'),
+        ),
+    ]
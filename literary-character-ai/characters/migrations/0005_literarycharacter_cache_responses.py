@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0004_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='literarycharacter',
+            name='cache_responses',
+            field=models.BooleanField(default=False, help_text='Serve repeated prompts (e.g. common openers) from the completion cache.'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+
+
+def backfill_counters(apps, schema_editor):
+    """Computes message_count and last_message_preview for existing conversations."""
+    Conversation = apps.get_model('characters', 'Conversation')
+    ChatMessage = apps.get_model('characters', 'ChatMessage')
+    messages = ChatMessage.objects.filter(conversation=OuterRef('pk'))
+    Conversation.objects.update(
+        message_count=Coalesce(
+            Subquery(messages.order_by().values('conversation').annotate(count=Count('id')).values('count')),
+            Value(0),
+        ),
+        last_message_preview=Coalesce(
+            Substr(Subquery(messages.order_by('-timestamp', '-id').values('message_text')[:1]), 1, 200),
+            Value(''),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0005_literarycharacter_cache_responses'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', help_text='Beginning of the newest message.', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of messages in the conversation.'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['conversation', 'timestamp', 'id'], name='chatmsg_conv_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user', 'last_updated'], name='conversation_user_updated_idx'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
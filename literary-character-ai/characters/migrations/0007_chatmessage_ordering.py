@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0006_conversation_counters_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='chatmessage',
+            options={'ordering': ['timestamp', 'id']},
+        ),
+    ]
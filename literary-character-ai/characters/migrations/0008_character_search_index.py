@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# Kept in sync with the characters table by characters/search.py (see signals.py)
+SQLITE_CREATE = [
+    # Prefix indexes keep the prefix queries search-as-you-type sends from scanning the whole term list
+    """
+    CREATE VIRTUAL TABLE characters_search USING fts5(
+        name, book, author, description, tags, tokenize='porter unicode61', prefix='2 3 4'
+    )
+    """,
+    """
+    INSERT INTO characters_search(rowid, name, book, author, description, tags)
+    SELECT id, name, book, author, description, (SELECT group_concat(value, ' ') FROM json_each(tags))
+    FROM characters_literarycharacter
+    """,
+]
+SQLITE_DROP = [
+    "DROP TABLE IF EXISTS characters_search",
+]
+
+# Must match the expression queried in characters/search.py for the index to be used
+POSTGRES_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', name), 'A') || "
+    "setweight(to_tsvector('english', book || ' ' || author), 'B') || "
+    "setweight(jsonb_to_tsvector('english', tags, '[\"string\"]'), 'B') || "
+    "setweight(to_tsvector('english', description), 'C')"
+)
+POSTGRES_CREATE = [
+    f"CREATE INDEX characters_search_idx ON characters_literarycharacter USING gin (({POSTGRES_SEARCH_VECTOR}))",
+    "CREATE INDEX characters_tags_idx ON characters_literarycharacter USING gin (tags jsonb_path_ops)",
+]
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS characters_search_idx",
+    "DROP INDEX IF EXISTS characters_tags_idx",
+]
+
+
+def _execute(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _execute(schema_editor, SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        _execute(schema_editor, POSTGRES_CREATE)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _execute(schema_editor, SQLITE_DROP)
+    elif vendor == 'postgresql':
+        _execute(schema_editor, POSTGRES_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0007_chatmessage_ordering'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
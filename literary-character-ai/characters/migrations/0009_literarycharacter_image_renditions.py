@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0008_character_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='literarycharacter',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the image, generated when it is saved (see renditions.py).'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:33
+
+from django.db import migrations
+
+# Lets characters.backends.users_with_email find a user by email without
+# scanning auth_user. Not unique: existing databases may already contain
+# addresses that differ only in case.
+CREATE_INDEX = "CREATE INDEX auth_user_email_lower_idx ON auth_user ((LOWER(email)))"
+DROP_INDEX = "DROP INDEX auth_user_email_lower_idx"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('characters', '0010_task'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0011_user_email_lower_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='literarycharacter',
+            name='greeting_pool',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Pre-generated greetings and replies to common first messages (see greetings.py).'),
+        ),
+    ]
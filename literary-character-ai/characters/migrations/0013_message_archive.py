@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('characters', '0012_literarycharacter_greeting_pool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='archived_messages',
+            field=models.PositiveIntegerField(default=0, help_text="Number of the conversation's messages moved to the archive (see archive.py), included in message_count."),
+        ),
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_timestamp', models.DateTimeField(help_text='Timestamp of the oldest message in the blob.')),
+                ('first_message_id', models.BigIntegerField(help_text='Original ID of the oldest message in the blob.')),
+                ('last_timestamp', models.DateTimeField(help_text='Timestamp of the newest message in the blob.')),
+                ('last_message_id', models.BigIntegerField(help_text='Original ID of the newest message in the blob.')),
+                ('message_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField(help_text='zlib-compressed JSON list of the messages, oldest first.')),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='characters.conversation')),
+            ],
+            options={
+                'ordering': ['first_timestamp', 'first_message_id'],
+                'indexes': [models.Index(fields=['conversation', 'last_timestamp', 'last_message_id'], name='msgarchive_conv_last_idx')],
+            },
+        ),
+    ]
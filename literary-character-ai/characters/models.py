@@ -1,5 +1,9 @@
 from django.db import models
+from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
+
+MESSAGE_PREVIEW_LENGTH = 200
 
 class LiteraryCharacter(models.Model):
     """Represents a literary character from a book."""
@@ -17,6 +21,22 @@ class LiteraryCharacter(models.Model):
         null=True,
         help_text="Optional image for the character."
     )
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Resized copies of the image, generated when it is saved (see renditions.py)."
+    )
+    cache_responses = models.BooleanField(
+        default=False,
+        help_text="Serve repeated prompts (e.g. common openers) from the completion cache."
+    )
+    greeting_pool = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Pre-generated greetings and replies to common first messages (see greetings.py)."
+    )
 
     def __str__(self):
         """String representation of the character."""
@@ -38,12 +58,41 @@ class Conversation(models.Model):
         auto_now=True,
         help_text="Timestamp of the last message in the conversation."
     )
+    summary = models.TextField(
+        blank=True,
+        default='',
+        help_text="Rolling summary of the messages that no longer fit in the prompt history."
+    )
+    summarized_up_to = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="ID of the newest message folded into the summary."
+    )
+    # Denormalized from the conversation's messages so listings don't need to query them
+    message_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of messages in the conversation."
+    )
+    last_message_preview = models.CharField(
+        max_length=MESSAGE_PREVIEW_LENGTH,
+        blank=True,
+        default='',
+        help_text="Beginning of the newest message."
+    )
+    archived_messages = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of the conversation's messages moved to the archive (see archive.py), included in message_count."
+    )
 
     class Meta:
         # Ensures only one conversation exists per user-character pair
         unique_together = ('user', 'character')
         # Orders conversations by most recently updated first by default
         ordering = ['-last_updated']
+        indexes = [
+            # A user's conversations, most recently updated first (conversation history page)
+            models.Index(fields=['user', 'last_updated'], name='conversation_user_updated_idx'),
+        ]
 
     def __str__(self):
         """String representation of the conversation."""
@@ -51,6 +100,23 @@ class Conversation(models.Model):
         user_identifier = getattr(self.user, 'email', self.user.username)
         return f"Chat between {user_identifier} and {self.character.name}"
 
+    def messages_added(self, *messages, restarted=False):
+        """
+        Updates message_count, last_message_preview and last_updated after
+        messages (oldest first) were added, in a single UPDATE.
+
+        restarted means the messages replaced all earlier ones, so the count
+        and the rolling summary start over.
+        """
+        update = {
+            'message_count': F('message_count') + len(messages),
+            'last_message_preview': messages[-1].message_text[:MESSAGE_PREVIEW_LENGTH],
+            'last_updated': timezone.now(),
+        }
+        if restarted:
+            update.update(message_count=len(messages), archived_messages=0, summary='', summarized_up_to=None)
+        Conversation.objects.filter(pk=self.pk).update(**update)
+
 class ChatMessage(models.Model):
     """Represents a single message within a conversation."""
     conversation = models.ForeignKey(
@@ -69,11 +135,85 @@ class ChatMessage(models.Model):
     )
 
     class Meta:
-        # Orders messages chronologically within a conversation by default
-        ordering = ['timestamp']
+        # Orders messages chronologically within a conversation by default;
+        # messages saved together can share a timestamp, so ties go by ID
+        ordering = ['timestamp', 'id']
+        indexes = [
+            # A conversation's messages by time (prompt history, chat page); id breaks timestamp ties
+            models.Index(fields=['conversation', 'timestamp', 'id'], name='chatmsg_conv_timestamp_idx'),
+        ]
 
     def __str__(self):
         """String representation of the chat message."""
         sender = "User" if self.is_user_message else "Character"
         return f"{sender} message at {self.timestamp}"
 
+class MessageArchive(models.Model):
+    """
+    A run of consecutive old messages of a conversation, moved out of
+    ChatMessage and stored as one compressed blob (see archive.py).
+    """
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='archives'
+    )
+    first_timestamp = models.DateTimeField(help_text="Timestamp of the oldest message in the blob.")
+    first_message_id = models.BigIntegerField(help_text="Original ID of the oldest message in the blob.")
+    last_timestamp = models.DateTimeField(help_text="Timestamp of the newest message in the blob.")
+    last_message_id = models.BigIntegerField(help_text="Original ID of the newest message in the blob.")
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField(help_text="zlib-compressed JSON list of the messages, oldest first.")
+
+    class Meta:
+        ordering = ['first_timestamp', 'first_message_id']
+        indexes = [
+            # A conversation's blobs, newest first (scrolling back through history)
+            models.Index(fields=['conversation', 'last_timestamp', 'last_message_id'], name='msgarchive_conv_last_idx'),
+        ]
+
+    def __str__(self):
+        """String representation of the archive blob."""
+        return f"{self.message_count} archived messages up to {self.last_timestamp}"
+
+class Task(models.Model):
+    """A unit of deferred work in the background task queue (see tasks.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=200, help_text="Dotted path of the task function.")
+    kwargs = models.JSONField(default=dict, blank=True, help_text="Keyword arguments the task is called with.")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    dedupe_key = models.CharField(
+        max_length=200,
+        blank=True,
+        default='',
+        help_text="At most one queued task may have a given non-empty key."
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, help_text="The task is not run before this time.")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, help_text="Start of the latest attempt.")
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Workers look for due queued tasks
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status='queued') & ~models.Q(dedupe_key=''),
+                name='task_queued_dedupe_key_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        """String representation of the task."""
+        return f"{self.name} ({self.status})"
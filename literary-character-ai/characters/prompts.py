@@ -0,0 +1,159 @@
+"""
+Prompt assembly for the chat API.
+
+Builds the messages sent upstream (persona system prompt, rolling summary,
+history and the user's message) so that they fit the model's context window,
+counting tokens locally instead of by message count.
+"""
+import functools
+import re
+from django.conf import settings
+from django.core.cache import cache
+
+# --- Prompt Configuration ---
+MAX_HISTORY_MESSAGES = 50 # Upper bound on previous messages considered for history
+MAX_TOKENS_RESPONSE = 200 # Tokens reserved for the model's reply
+MESSAGE_OVERHEAD_TOKENS = 4 # Chat template tokens around each message (role header, end-of-turn)
+PROMPT_OVERHEAD_TOKENS = 3 # Begin-of-text and the header that opens the assistant's reply
+SYSTEM_PROMPT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Splits text the way Llama 3's tokenizer does before applying BPE merges:
+# contractions, words with one leading space or symbol, digit groups of up to
+# three, punctuation runs and whitespace.
+_PRETOKENIZE_RE = re.compile(
+    r"'(?:s|t|re|ve|m|ll|d)"
+    r"|[^\r\n\w]?[^\W\d_]+"
+    r"|\d{1,3}"
+    r"| ?[^\s\w]+[\r\n]*"
+    r"|\s*[\r\n]+|\s+(?!\S)|\s+",
+    re.IGNORECASE,
+)
+
+
+@functools.lru_cache(maxsize=8192)
+def count_tokens(text):
+    """
+    Counts tokens in text with an offline approximation of the model's BPE
+    tokenizer: each pre-tokenized piece is one token, except long words
+    (roughly one extra token per seven characters) and non-Latin text (about
+    one token per two characters), which the vocabulary splits further.
+
+    Results are memoized since the same history messages are counted on
+    every turn of a conversation.
+    """
+    tokens = 0
+    for piece in _PRETOKENIZE_RE.findall(text):
+        if piece.isascii():
+            tokens += 1 + (len(piece) - 1) // 7
+        else:
+            tokens += (len(piece) + 1) // 2
+    return tokens
+
+
+def _system_prompt_cache_key(character_id):
+    return f"characters:system-prompt:{character_id}"
+
+
+def _render_system_prompt(character):
+    return f"""\
+You are embodying the character {character.name} from the book "{character.book}" by {character.author}.
+Your task is to speak, act, and think *only* as {character.name}, fully adopting their personality, speech patterns, knowledge, and mannerisms as described below. Do not break character. Do not act as an AI assistant.
+
+Character Background: {character.description}
+
+Respond concisely (1-2 paragraphs) based on this persona. If asked about events beyond the book's narrative, you may speculate based on the character's personality, but clarify that this is outside the original story."""
+
+
+def get_system_prompt(character):
+    """
+    Returns (system_prompt, token_count) for the character's persona.
+
+    The rendered prompt and its token count are cached per character and
+    invalidated when the character is saved or deleted (see signals.py).
+    """
+    if character.pk is None:
+        system_prompt = _render_system_prompt(character)
+        return system_prompt, count_tokens(system_prompt)
+
+    key = _system_prompt_cache_key(character.pk)
+    cached = cache.get(key)
+    if cached is None:
+        system_prompt = _render_system_prompt(character)
+        cached = (system_prompt, count_tokens(system_prompt))
+        cache.set(key, cached, SYSTEM_PROMPT_CACHE_TIMEOUT)
+    return cached
+
+
+def invalidate_system_prompt(character_id):
+    """Drops the cached system prompt of a character."""
+    cache.delete(_system_prompt_cache_key(character_id))
+
+
+def history_candidates(conversation):
+    """
+    Messages that may go into the prompt history, newest first: those that
+    have not been folded into the conversation summary.
+
+    A few more than MAX_HISTORY_MESSAGES are fetched so the caller can tell
+    when enough messages have fallen out of the window to summarize.
+    """
+    candidates = conversation.messages.order_by('-timestamp', '-id')
+    if conversation.summarized_up_to is not None:
+        candidates = candidates.filter(id__gt=conversation.summarized_up_to)
+    return candidates[:MAX_HISTORY_MESSAGES + settings.CHAT_SUMMARY_BATCH_MESSAGES]
+
+
+def pack_history(candidates, budget, max_messages=MAX_HISTORY_MESSAGES):
+    """
+    Takes messages from candidates (newest first) until the next one would
+    exceed budget tokens or max_messages is reached.
+
+    Returns the selected messages in chronological order.
+    """
+    window = []
+    tokens_used = 0
+    for msg in candidates:
+        if len(window) >= max_messages:
+            break
+        message_tokens = count_tokens(msg.message_text) + MESSAGE_OVERHEAD_TOKENS
+        if tokens_used + message_tokens > budget:
+            break
+        window.append(msg)
+        tokens_used += message_tokens
+
+    # Reverse to maintain chronological order for the prompt
+    window.reverse()
+    return window
+
+
+def build_prompt(character, candidates, user_message_text, summary='', max_messages=MAX_HISTORY_MESSAGES):
+    """
+    Assembles the messages payload for the chat completion API.
+
+    History is packed newest-first into whatever the context window leaves
+    after the reply reservation, system prompt, summary and the user's
+    message, further capped by CHAT_HISTORY_TOKEN_BUDGET.
+
+    Returns a (messages_for_api, history_window) tuple; history_window holds
+    the ChatMessage objects that made it into the prompt.
+    """
+    system_prompt, system_tokens = get_system_prompt(character)
+    messages_for_api = [{"role": "system", "content": system_prompt}]
+    used_tokens = PROMPT_OVERHEAD_TOKENS + system_tokens + MESSAGE_OVERHEAD_TOKENS
+
+    if summary:
+        summary_content = f"Summary of the earlier conversation: {summary}"
+        messages_for_api.append({"role": "system", "content": summary_content})
+        used_tokens += count_tokens(summary_content) + MESSAGE_OVERHEAD_TOKENS
+
+    used_tokens += count_tokens(user_message_text) + MESSAGE_OVERHEAD_TOKENS
+    available_tokens = settings.CHAT_CONTEXT_WINDOW - MAX_TOKENS_RESPONSE - used_tokens
+    budget = max(0, min(settings.CHAT_HISTORY_TOKEN_BUDGET, available_tokens))
+
+    history_window = pack_history(candidates, budget, max_messages)
+    for msg in history_window:
+        role = "user" if msg.is_user_message else "assistant"
+        messages_for_api.append({"role": role, "content": msg.message_text})
+
+    messages_for_api.append({"role": "user", "content": user_message_text})
+    return messages_for_api, history_window
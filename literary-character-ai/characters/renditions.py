@@ -0,0 +1,102 @@
+"""
+Resized renditions of character images.
+
+Uploaded originals can be several megabytes, while the character cards and
+slideshows need a few hundred kilobytes at most. Each image is resized to
+RENDITION_WIDTHS in WebP and JPEG when it is saved (see signals.py) or by
+`manage.py generate_renditions`, and the templates pick one with srcset.
+
+Rendition filenames include a hash of the original's content, so a URL never
+changes meaning and the files can be cached by browsers and CDNs forever.
+"""
+import hashlib
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+RENDITION_WIDTHS = (320, 640, 1280)
+RENDITION_DIRECTORY = 'character_images/renditions'
+# Format name -> (file extension, Pillow save options); browsers without WebP get the JPEG
+RENDITION_FORMATS = {
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def _rendition_name(source_name, digest, width, extension):
+    stem = posixpath.splitext(posixpath.basename(source_name))[0]
+    return f"{RENDITION_DIRECTORY}/{stem}.{digest}.{width}w.{extension}"
+
+
+def _encode(image, format_name, options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format_name.upper(), **options)
+    return buffer.getvalue()
+
+
+def generate_renditions(source_name, storage=default_storage):
+    """
+    Writes the renditions of the image stored as source_name and returns the
+    image_renditions value describing them. Renditions that already exist
+    (same content hash) are not encoded again. Widths larger than the
+    original are skipped, but the original width itself is always included.
+    """
+    with storage.open(source_name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+
+    with Image.open(io.BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original) # Phone photos are often stored rotated
+        image = original.convert('RGB')
+    widths = sorted(
+        {width for width in RENDITION_WIDTHS if width < image.width} | {min(image.width, RENDITION_WIDTHS[-1])}
+    )
+
+    renditions = {'source': source_name, 'width': image.width, 'height': image.height}
+    for format_name, (extension, options) in RENDITION_FORMATS.items():
+        renditions[format_name] = []
+        for width in widths:
+            name = _rendition_name(source_name, digest, width, extension)
+            if not storage.exists(name):
+                height = round(image.height * width / image.width)
+                resized = image.resize((width, height), Image.Resampling.LANCZOS) if width < image.width else image
+                storage.save(name, ContentFile(_encode(resized, format_name, options)))
+            renditions[format_name].append([width, name])
+    return renditions
+
+
+def rendition_files(renditions):
+    """The storage names of the files listed in an image_renditions value."""
+    return {name for format_name in RENDITION_FORMATS for _, name in renditions.get(format_name, [])}
+
+
+def delete_rendition_files(names, storage=default_storage):
+    """Deletes rendition files, e.g. those of a replaced image."""
+    for name in names:
+        storage.delete(name)
+
+
+def renditions_are_current(character):
+    """Whether character.image_renditions was generated from the character's current image."""
+    return bool(character.image) and character.image_renditions.get('source') == character.image.name
+
+
+def srcset(character, format_name):
+    """The srcset attribute value of a character's renditions in one format ('' if there are none)."""
+    if not renditions_are_current(character):
+        return ''
+    return ', '.join(
+        f"{default_storage.url(name)} {width}w" for width, name in character.image_renditions[format_name]
+    )
+
+
+def rendition_url(character, format_name, min_width):
+    """URL of the smallest rendition at least min_width wide (or the largest), falling back to the original."""
+    if not renditions_are_current(character):
+        return character.image.url if character.image else ''
+    renditions = character.image_renditions[format_name]
+    width, name = next(((width, name) for width, name in renditions if width >= min_width), renditions[-1])
+    return default_storage.url(name)
@@ -0,0 +1,153 @@
+"""
+Ranked search over the character catalog.
+
+Matches name, book, author, description and tags against an index instead
+of scanning the table:
+
+- SQLite: the characters_search FTS5 table, ranked with bm25(). It is kept
+  in sync on character save/delete (see signals.py); rows written in bulk
+  (bulk_create, update(), raw SQL) need `manage.py rebuild_search_index`.
+- PostgreSQL: a GIN expression index on a weighted tsvector, ranked with
+  ts_rank(), plus a GIN index on tags for tag filters.
+
+Other databases fall back to an unranked substring scan.
+"""
+import json
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .catalog import CARD_FIELDS
+from .models import LiteraryCharacter
+
+SEARCH_RESULTS_LIMIT = 20
+MAX_SEARCH_RESULTS_LIMIT = 50
+# Relative weight of a match in name, book, author, description and tags
+SQLITE_COLUMN_WEIGHTS = (10.0, 4.0, 4.0, 1.0, 6.0)
+# Must match the expression indexed in migration 0008_character_search_index
+POSTGRES_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', name), 'A') || "
+    "setweight(to_tsvector('english', book || ' ' || author), 'B') || "
+    "setweight(jsonb_to_tsvector('english', tags, '[\"string\"]'), 'B') || "
+    "setweight(to_tsvector('english', description), 'C')"
+)
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def search_terms(query):
+    """Splits a user query into words, dropping the punctuation the index query syntaxes would interpret."""
+    return _TERM_RE.findall(query or '')
+
+
+def _sqlite_match(terms, tag):
+    # Every word must match, as a prefix so results show up while typing
+    clauses = [f'"{term}"*' for term in terms]
+    if tag:
+        clauses.append('tags : "{}"'.format(tag.replace('"', '""')))
+    return ' '.join(clauses)
+
+
+def _sqlite_search(terms, tag, limit):
+    weights = ', '.join(str(weight) for weight in SQLITE_COLUMN_WEIGHTS)
+    with connection.cursor() as cursor:
+        # bm25() is lower for better matches; negate it so higher ranks are better on every backend
+        cursor.execute(
+            f"SELECT rowid, -bm25(characters_search, {weights}) FROM characters_search "
+            f"WHERE characters_search MATCH %s ORDER BY bm25(characters_search, {weights}), rowid LIMIT %s",
+            [_sqlite_match(terms, tag), limit],
+        )
+        return cursor.fetchall()
+
+
+def _postgres_search(terms, tag, limit):
+    conditions, params = [], []
+    if terms:
+        conditions.append(f"({POSTGRES_SEARCH_VECTOR}) @@ to_tsquery('english', %s)")
+        params.append(' & '.join(f"{term}:*" for term in terms))
+    if tag:
+        conditions.append("tags @> %s::jsonb")
+        params.append(json.dumps([tag]))
+    rank = f"ts_rank({POSTGRES_SEARCH_VECTOR}, to_tsquery('english', %s))" if terms else "0"
+    rank_params = params[:1] if terms else []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id, {rank} AS rank FROM characters_literarycharacter "
+            f"WHERE {' AND '.join(conditions)} ORDER BY rank DESC, id LIMIT %s",
+            rank_params + params + [limit],
+        )
+        return cursor.fetchall()
+
+
+def scan_search(terms, tag=None, limit=SEARCH_RESULTS_LIMIT):
+    """Unranked substring search without an index, for other databases (and as the benchmark baseline)."""
+    characters = LiteraryCharacter.objects.all()
+    for term in terms:
+        characters = characters.filter(
+            Q(name__icontains=term) | Q(book__icontains=term) | Q(author__icontains=term)
+            | Q(description__icontains=term) | Q(tags__icontains=term)
+        )
+    if tag:
+        characters = characters.filter(tags__icontains=json.dumps(tag))
+    return [(pk, 0.0) for pk in characters.order_by('id').values_list('id', flat=True)[:limit]]
+
+
+def search_characters(query, tag=None, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Returns up to limit characters matching every word of query (and the tag,
+    if given), best match first, with their score as a rank attribute.
+    """
+    terms = search_terms(query)
+    if not terms and not tag:
+        return []
+
+    if connection.vendor == 'sqlite':
+        ranked = _sqlite_search(terms, tag, limit)
+    elif connection.vendor == 'postgresql':
+        ranked = _postgres_search(terms, tag, limit)
+    else:
+        ranked = scan_search(terms, tag, limit)
+
+    characters = LiteraryCharacter.objects.only(*CARD_FIELDS, 'tags').in_bulk([pk for pk, _ in ranked])
+    results = []
+    for pk, rank in ranked:
+        if pk in characters: # Deleted since the index was queried
+            characters[pk].rank = rank
+            results.append(characters[pk])
+    return results
+
+
+def index_character(character):
+    """Adds or refreshes a character's row in the SQLite search table."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM characters_search WHERE rowid = %s", [character.pk])
+        cursor.execute(
+            "INSERT INTO characters_search(rowid, name, book, author, description, tags) VALUES (%s, %s, %s, %s, %s, %s)",
+            [character.pk, character.name, character.book, character.author, character.description,
+             ' '.join(str(tag) for tag in character.tags or [])],
+        )
+
+
+def unindex_character(character_id):
+    """Removes a character from the SQLite search table."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM characters_search WHERE rowid = %s", [character_id])
+
+
+def rebuild_search_index():
+    """Re-indexes every character, after characters were written in bulk. Returns the number indexed."""
+    if connection.vendor != 'sqlite':
+        return LiteraryCharacter.objects.count() # The PostgreSQL expression index maintains itself
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM characters_search")
+        cursor.execute(
+            "INSERT INTO characters_search(rowid, name, book, author, description, tags) "
+            "SELECT id, name, book, author, description, (SELECT group_concat(value, ' ') FROM json_each(tags)) "
+            "FROM characters_literarycharacter"
+        )
+        return cursor.rowcount
@@ -0,0 +1,79 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import invalidate_cached_user
+from .catalog import bump_catalog_version
+from .greetings import greeting_pool_is_current, schedule_greeting_pool_update
+from .models import LiteraryCharacter
+from .prompts import invalidate_system_prompt
+from .renditions import delete_rendition_files, generate_renditions, rendition_files, renditions_are_current
+from .search import index_character, unindex_character
+
+logger = logging.getLogger(__name__)
+
+
+@receiver([post_save, post_delete], sender=LiteraryCharacter)
+def invalidate_character_caches(sender, instance, **kwargs):
+    """Drops cached data derived from a character when it changes."""
+    invalidate_system_prompt(instance.pk)
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Drops a changed user from the EmailBackend.get_user cache."""
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=LiteraryCharacter)
+def index_saved_character(sender, instance, **kwargs):
+    """Keeps the character search index up to date."""
+    index_character(instance)
+
+
+@receiver(post_save, sender=LiteraryCharacter)
+def update_greeting_pool(sender, instance, raw=False, **kwargs):
+    """
+    Queues regenerating a character's greeting pool once its persona changes.
+    Characters without a pool get one from `manage.py generate_greetings`.
+    """
+    if raw or not instance.greeting_pool or greeting_pool_is_current(instance):
+        return
+    schedule_greeting_pool_update(instance.pk)
+
+
+@receiver(post_delete, sender=LiteraryCharacter)
+def unindex_deleted_character(sender, instance, **kwargs):
+    """Removes a deleted character from the search index."""
+    unindex_character(instance.pk)
+
+
+@receiver(post_save, sender=LiteraryCharacter)
+def update_image_renditions(sender, instance, raw=False, **kwargs):
+    """Generates resized renditions of a character's image when the image changes."""
+    if raw or renditions_are_current(instance) or not (instance.image or instance.image_renditions):
+        return
+
+    previous = instance.image_renditions
+    try:
+        renditions = generate_renditions(instance.image.name) if instance.image else {}
+    except OSError:
+        logger.error(f"Could not generate renditions of {instance.image.name}; serving the original.", exc_info=True)
+        return
+    LiteraryCharacter.objects.filter(pk=instance.pk).update(image_renditions=renditions)
+    instance.image_renditions = renditions
+    bump_catalog_version() # Cached catalog pages were rendered before the renditions existed
+
+    stale = rendition_files(previous) - rendition_files(renditions)
+    transaction.on_commit(lambda: delete_rendition_files(stale))
+
+
+@receiver(post_delete, sender=LiteraryCharacter)
+def delete_image_renditions(sender, instance, **kwargs):
+    """Deletes the renditions of a deleted character's image."""
+    stale = rendition_files(instance.image_renditions)
+    transaction.on_commit(lambda: delete_rendition_files(stale))
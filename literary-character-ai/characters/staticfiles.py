@@ -0,0 +1,266 @@
+"""
+Production pipeline for static files, and serving of static and media files.
+
+With DEBUG off, `manage.py collectstatic` goes through
+CompressedManifestStaticFilesStorage: every file is also written under a
+name that includes a hash of its content (css/styles.3f2a9c1b7d4e.css),
+which {% static %} links to, and text assets get gzip and Brotli variants
+(the latter when the brotli package is installed), compressed once at build
+time instead of on every response.
+
+StaticFilesMiddleware serves STATIC_ROOT and MEDIA_ROOT from the Django
+process under WSGI and ASGI alike, so no separate file server is needed. It
+sends the smallest variant the client accepts, answers revalidations with a
+304 and lets browsers and CDNs cache content-hashed files forever. Files are
+indexed at start-up, so restart the workers after running collectstatic.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+from dataclasses import dataclass
+from urllib.parse import unquote
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+
+from .renditions import RENDITION_DIRECTORY
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ico'}
+MIN_COMPRESS_SIZE = 256 # Bytes; smaller files don't gain enough to be worth a variant
+# Suffix -> Content-Encoding, in order of preference
+ENCODINGS = {'.br': 'br', '.gz': 'gzip'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Unhashed static names and media uploads can change under the same URL
+SHORT_CACHE_CONTROL = 'public, max-age=300'
+
+
+# --- Build time ---
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def compress_file(path):
+    """
+    Writes gzip (and Brotli, if installed) copies of path next to it, keeping
+    only those smaller than the original. Returns the paths written.
+    """
+    with open(path, 'rb') as source:
+        data = source.read()
+    variants = {path + '.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    brotli = _brotli()
+    if brotli is not None:
+        variants[path + '.br'] = brotli.compress(data, quality=11)
+    written = []
+    for variant_path, compressed in variants.items():
+        if len(compressed) < len(data):
+            with open(variant_path, 'wb') as variant:
+                variant.write(compressed)
+            written.append(variant_path)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also precompresses the collected text assets."""
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # A template referencing a file that doesn't exist keeps the plain
+            # name and 404s, as with the default storage, instead of failing the page
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(paths) | set(self.hashed_files.values())):
+            path = self.path(name)
+            if (
+                posixpath.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS
+                and os.path.exists(path) and os.path.getsize(path) >= MIN_COMPRESS_SIZE
+            ):
+                for variant_path in compress_file(path):
+                    yield name, name + variant_path[len(path):], True
+
+
+# --- Serving ---
+
+@dataclass(frozen=True)
+class ServedFile:
+    """A file on disk as sent for one Content-Encoding (None for the original)."""
+    path: str
+    size: int
+    etag: str
+    last_modified: str
+    encoding: str = None
+
+    @classmethod
+    def from_path(cls, path, encoding=None):
+        stat = os.stat(path)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{"-" + encoding if encoding else ""}"'
+        return cls(path, stat.st_size, etag, http_date(stat.st_mtime), encoding)
+
+
+@dataclass(frozen=True)
+class Asset:
+    """A URL's file and its precompressed variants, by Content-Encoding."""
+    content_type: str
+    cache_control: str
+    original: ServedFile
+    variants: dict
+
+
+def _content_type(path):
+    content_type, _ = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type in ('application/javascript', 'image/svg+xml'):
+        content_type += '; charset=utf-8'
+    return content_type
+
+
+def _asset(path, cache_control):
+    variants = {}
+    for suffix, encoding in ENCODINGS.items():
+        if os.path.exists(path + suffix):
+            variants[encoding] = ServedFile.from_path(path + suffix, encoding)
+    return Asset(_content_type(path), cache_control, ServedFile.from_path(path), variants)
+
+
+def index_static_root(root, hashed_names=()):
+    """Maps the relative names of the files under root to Assets; names in hashed_names are cached forever."""
+    index = {}
+    hashed_names = set(hashed_names)
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if posixpath.splitext(filename)[1] in ENCODINGS:
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            index[name] = _asset(path, IMMUTABLE_CACHE_CONTROL if name in hashed_names else SHORT_CACHE_CONTROL)
+    return index
+
+
+def _hashed_names(root):
+    """The content-hashed names listed in the manifest collectstatic wrote to root, if any."""
+    return ManifestStaticFilesStorage(location=root).hashed_files.values()
+
+
+def accepted_encodings(header):
+    """The content codings an Accept-Encoding header allows (those not given q=0)."""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """
+    Serves GET and HEAD requests for STATIC_URL from an index of STATIC_ROOT
+    built at start-up, and for MEDIA_URL from MEDIA_ROOT (looked up per
+    request, as uploads change). Other requests pass through. Not used with
+    DEBUG on, where runserver and the URLconf serve these files, or when
+    SERVE_STATIC_FILES is off because a web server or CDN serves them.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.DEBUG or not settings.SERVE_STATIC_FILES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.static_prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else None
+        self.media_prefix = settings.MEDIA_URL if settings.MEDIA_URL.startswith('/') else None
+        self.static_index = {}
+        if self.static_prefix and settings.STATIC_ROOT and os.path.isdir(settings.STATIC_ROOT):
+            root = str(settings.STATIC_ROOT)
+            self.static_index = index_static_root(root, _hashed_names(root))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        asset = self.find_asset(request)
+        if asset is None:
+            return self.get_response(request)
+        return self.serve(request, asset)
+
+    async def __acall__(self, request):
+        asset = await sync_to_async(self.find_asset)(request) if request.path.startswith(self._prefixes()) else None
+        if asset is None:
+            return await self.get_response(request)
+        # ASGI would read a FileResponse in a thread chunk by chunk; read the file in one go instead
+        return await sync_to_async(self.serve)(request, asset, in_memory=True)
+
+    def _prefixes(self):
+        return tuple(prefix for prefix in (self.static_prefix, self.media_prefix) if prefix)
+
+    def find_asset(self, request):
+        """The Asset a GET or HEAD request asks for, or None."""
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        path = unquote(request.path)
+        if self.static_prefix and path.startswith(self.static_prefix):
+            return self.static_index.get(path[len(self.static_prefix):])
+        if self.media_prefix and path.startswith(self.media_prefix) and settings.MEDIA_ROOT:
+            name = path[len(self.media_prefix):]
+            try:
+                file_path = safe_join(settings.MEDIA_ROOT, name)
+            except SuspiciousFileOperation:
+                return None
+            if not os.path.isfile(file_path):
+                return None
+            # Rendition names include a hash of their source (see renditions.py)
+            immutable = name.startswith(RENDITION_DIRECTORY + '/')
+            return _asset(file_path, IMMUTABLE_CACHE_CONTROL if immutable else SHORT_CACHE_CONTROL)
+        return None
+
+    def serve(self, request, asset, in_memory=False):
+        served = asset.original
+        if asset.variants:
+            accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+            served = next((asset.variants[e] for e in ENCODINGS.values() if e in accepted and e in asset.variants), served)
+
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if served.etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=asset.content_type)
+            response['Content-Length'] = served.size
+        elif in_memory:
+            with open(served.path, 'rb') as file:
+                response = HttpResponse(file.read(), content_type=asset.content_type)
+        else:
+            response = FileResponse(open(served.path, 'rb'), content_type=asset.content_type)
+            del response['Content-Disposition']
+
+        response['ETag'] = served.etag
+        response['Last-Modified'] = served.last_modified
+        response['Cache-Control'] = asset.cache_control
+        response['X-Content-Type-Options'] = 'nosniff'
+        if asset.variants:
+            response['Vary'] = 'Accept-Encoding'
+        if served.encoding and response.status_code == 200:
+            response['Content-Encoding'] = served.encoding
+        return response
@@ -0,0 +1,99 @@
+import logging
+
+from .llm import get_backend
+from .models import Conversation
+from .tasks import enqueue, task
+
+logger = logging.getLogger(__name__)
+
+# --- Summary Configuration ---
+SUMMARY_MAX_TOKENS = 300
+SUMMARY_CHUNK_MESSAGES = 40 # Messages folded into the summary per upstream call
+SUMMARY_TEMPERATURE = 0.3
+
+
+def schedule_summary_update(conversation_id, window_start_id):
+    """
+    Queues folding the messages older than window_start_id into the
+    conversation's rolling summary as a background task, off the request path.
+
+    At most one update per conversation is queued at a time; further requests
+    are dropped since the queued update (or the next turn) will pick up the
+    same messages.
+    """
+    enqueue(
+        update_conversation_summary,
+        dedupe_key=f"conversation-summary:{conversation_id}",
+        conversation_id=conversation_id,
+        window_start_id=window_start_id,
+    )
+
+
+@task(max_attempts=3) # Upstream errors are retried by the queue
+def update_conversation_summary(conversation_id, window_start_id):
+    """
+    Folds messages with IDs below window_start_id that are not yet part of the
+    summary into it, oldest first, in chunks of SUMMARY_CHUNK_MESSAGES.
+
+    Each chunk is saved with a conditional UPDATE so a concurrent update or a
+    conversation restart (start_new) in the meantime is never overwritten.
+    """
+    backend = get_backend()
+
+    try:
+        conversation = Conversation.objects.select_related('character').get(pk=conversation_id)
+    except Conversation.DoesNotExist:
+        return
+
+    summary = conversation.summary
+    summarized_up_to = conversation.summarized_up_to
+
+    while True:
+        pending = conversation.messages.filter(id__lt=window_start_id)
+        if summarized_up_to is not None:
+            pending = pending.filter(id__gt=summarized_up_to)
+        batch = list(pending.order_by('id')[:SUMMARY_CHUNK_MESSAGES])
+        if not batch:
+            return
+
+        summary = _summarize(backend, conversation.character, summary, batch)
+        newest_id = batch[-1].id
+        updated = Conversation.objects.filter(
+            pk=conversation_id,
+            summarized_up_to=summarized_up_to,
+            messages__id=newest_id, # Messages still exist, i.e. the conversation wasn't restarted
+        ).update(summary=summary, summarized_up_to=newest_id)
+        if not updated:
+            logger.info(f"Conversation {conversation_id} changed during summary update; discarding result.")
+            return
+
+        logger.info(f"Folded {len(batch)} messages into the summary of conversation {conversation_id}")
+        summarized_up_to = newest_id
+
+
+def _summarize(backend, character, summary, messages):
+    """Asks the model to extend the running summary with the given messages."""
+    transcript = "\n".join(
+        f"{'User' if msg.is_user_message else character.name}: {msg.message_text}"
+        for msg in messages
+    )
+    completion = backend.complete(
+        [
+            {
+                "role": "system",
+                "content": (
+                    f"You maintain a running summary of a conversation between a user and {character.name} "
+                    f"from \"{character.book}\". Update the summary with the new messages. Keep facts the "
+                    "user shared about themselves, topics discussed, promises made and open questions. "
+                    "Write in the third person, in at most 8 sentences. Reply with the summary only."
+                ),
+            },
+            {
+                "role": "user",
+                "content": f"Current summary:\n{summary or '(none yet)'}\n\nNew messages:\n{transcript}",
+            },
+        ],
+        temperature=SUMMARY_TEMPERATURE,
+        max_tokens=SUMMARY_MAX_TOKENS,
+    )
+    return completion.text or summary
@@ -0,0 +1,262 @@
+"""
+Database-backed queue for work that doesn't have to finish before the
+response is sent, such as folding old messages into conversation summaries.
+
+Tasks are plain functions marked with @task and queued with enqueue(). The
+queue is the Task table, so no broker is needed and queued work survives
+restarts. Depending on settings.TASK_QUEUE['WORKER'], tasks are run by
+background threads of the web process ('thread', started by the first task
+the process queues) or by `manage.py run_tasks` ('external'). Several
+workers can share the table: a task is claimed with a conditional UPDATE,
+so each one runs once.
+
+Failed tasks are retried up to max_attempts times with exponential backoff,
+then kept with status 'failed' and the last error for inspection. A task whose
+dedupe_key was queued again while it ran is finished instead of retried.
+"""
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .metrics import register_collector
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CANDIDATES = 10 # Due tasks considered per claim, so concurrent workers rarely race for the same one
+MAINTENANCE_INTERVAL = 300 # Seconds between requeue_stale_tasks/purge_finished_tasks runs of a worker
+STATS_WINDOW = timedelta(hours=1)
+STATS_SAMPLE_SIZE = 1000
+
+
+def _options():
+    return settings.TASK_QUEUE
+
+
+def task(max_attempts=3):
+    """Marks a module-level function as runnable by the task queue."""
+    def decorator(func):
+        func.task_max_attempts = max_attempts
+        func.task_name = f"{func.__module__}.{func.__qualname__}"
+        return func
+    return decorator
+
+
+def enqueue(func, dedupe_key='', delay=0, **kwargs):
+    """
+    Queues func(**kwargs) to run in the background, no sooner than delay
+    seconds from now and after the current transaction commits. kwargs must
+    be JSON serializable.
+
+    If a task with the same non-empty dedupe_key is already queued, nothing
+    is queued and None is returned; otherwise the new Task is returned.
+    """
+    try:
+        with transaction.atomic():
+            queued = Task.objects.create(
+                name=func.task_name,
+                kwargs=kwargs,
+                dedupe_key=dedupe_key,
+                max_attempts=func.task_max_attempts,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError: # Same dedupe_key already queued
+        return None
+
+    if _options()['WORKER'] == 'thread':
+        transaction.on_commit(_runner.wake)
+    return queued
+
+
+def _claim_next_task():
+    """Marks the next due task as running and returns it, or returns None if no task is due."""
+    now = timezone.now()
+    candidates = list(
+        Task.objects.filter(status=Task.QUEUED, run_after__lte=now)
+        .order_by('run_after', 'id').values_list('id', flat=True)[:CLAIM_CANDIDATES]
+    )
+    for task_id in candidates:
+        claimed = Task.objects.filter(pk=task_id, status=Task.QUEUED).update(
+            status=Task.RUNNING, started_at=now, attempts=F('attempts') + 1
+        )
+        if claimed: # Otherwise another worker got it first
+            return Task.objects.get(pk=task_id)
+    return None
+
+
+def _resolve(name):
+    func = import_string(name)
+    if not hasattr(func, 'task_max_attempts'): # Only run functions marked with @task
+        raise ImportError(f"{name} is not a task")
+    return func
+
+
+def run_next_task():
+    """Runs the next due task, if any. Returns whether a task was run."""
+    claimed = _claim_next_task()
+    if claimed is None:
+        return False
+
+    try:
+        _resolve(claimed.name)(**claimed.kwargs)
+    except Exception as e:
+        error = traceback.format_exc()
+        if claimed.attempts < claimed.max_attempts:
+            delay = _options()['RETRY_DELAY'] * 2 ** (claimed.attempts - 1)
+            logger.warning(f"Task {claimed.id} ({claimed.name}) failed, retrying in {delay:.0f}s: {e}")
+            update = {'status': Task.QUEUED, 'run_after': timezone.now() + timedelta(seconds=delay)}
+        else:
+            logger.error(f"Task {claimed.id} ({claimed.name}) failed after {claimed.attempts} attempts: {e}", exc_info=True)
+            update = {'status': Task.FAILED, 'finished_at': timezone.now()}
+        try:
+            with transaction.atomic():
+                Task.objects.filter(pk=claimed.pk).update(last_error=error, **update)
+        except IntegrityError: # Same dedupe_key queued again while this ran
+            _supersede(claimed.pk, error)
+    else:
+        Task.objects.filter(pk=claimed.pk).update(status=Task.DONE, finished_at=timezone.now())
+    return True
+
+
+def run_due_tasks(limit=None):
+    """Runs due tasks until none is left (or limit tasks ran). Returns the number of tasks run."""
+    ran = 0
+    while (limit is None or ran < limit) and run_next_task():
+        ran += 1
+    return ran
+
+
+def _supersede(task_id, error=''):
+    """
+    Finishes a task instead of queueing it again, because a task with the
+    same dedupe_key is already queued and will do the same work.
+    """
+    logger.info(f"Task {task_id} superseded by a queued task with the same dedupe_key")
+    Task.objects.filter(pk=task_id).update(
+        status=Task.DONE, finished_at=timezone.now(),
+        last_error=error + "Superseded by a queued task with the same dedupe_key.",
+    )
+
+
+def requeue_stale_tasks():
+    """
+    Requeues tasks left running for longer than TASK_QUEUE['TIMEOUT'], e.g.
+    by a worker that died. Returns the number of tasks requeued; stale tasks
+    whose dedupe_key is queued again are superseded instead.
+    """
+    cutoff = timezone.now() - timedelta(seconds=_options()['TIMEOUT'])
+    stale = Task.objects.filter(status=Task.RUNNING, started_at__lt=cutoff)
+    requeued = 0
+    for task_id in stale.values_list('id', flat=True):
+        try:
+            with transaction.atomic():
+                requeued += stale.filter(pk=task_id).update(status=Task.QUEUED)
+        except IntegrityError: # One at a time, so a duplicate key only holds back its own task
+            _supersede(task_id)
+    return requeued
+
+
+def purge_finished_tasks():
+    """Deletes tasks that finished more than TASK_QUEUE['RETENTION'] seconds ago."""
+    cutoff = timezone.now() - timedelta(seconds=_options()['RETENTION'])
+    deleted, _ = Task.objects.filter(status__in=[Task.DONE, Task.FAILED], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def maintain_queue():
+    """Requeues stale tasks and purges old finished ones; workers call this every MAINTENANCE_INTERVAL."""
+    requeue_stale_tasks()
+    purge_finished_tasks()
+
+
+def task_stats():
+    """
+    Returns the queue depth and p50/p95 latency (seconds) of tasks finished
+    in the last hour: how long they waited to start once due, and how long
+    their last attempt ran.
+    """
+    now = timezone.now()
+    stats = Task.objects.aggregate(
+        queued=Count('id', filter=Q(status=Task.QUEUED)),
+        due=Count('id', filter=Q(status=Task.QUEUED, run_after__lte=now)),
+        running=Count('id', filter=Q(status=Task.RUNNING)),
+        failed=Count('id', filter=Q(status=Task.FAILED)),
+    )
+    recent = (
+        Task.objects.filter(status=Task.DONE, finished_at__gte=now - STATS_WINDOW)
+        .order_by('-finished_at').values_list('run_after', 'started_at', 'finished_at')[:STATS_SAMPLE_SIZE]
+    )
+    waits, durations = [], []
+    for run_after, started_at, finished_at in recent:
+        waits.append(max((started_at - run_after).total_seconds(), 0.0))
+        durations.append((finished_at - started_at).total_seconds())
+    waits.sort()
+    durations.sort()
+
+    stats['done_last_hour'] = len(durations)
+    for name, values in (('wait', waits), ('duration', durations)):
+        for pct in (50, 95):
+            stats[f'{name}_p{pct}'] = values[int(pct / 100 * (len(values) - 1))] if values else 0.0
+    return stats
+
+
+@register_collector
+def _task_metrics():
+    stats = task_stats()
+    return [
+        ('inkpersona_tasks_queued', 'gauge', "Background tasks waiting to run (including delayed retries).", stats['queued']),
+        ('inkpersona_tasks_due', 'gauge', "Queued background tasks that are due to run.", stats['due']),
+        ('inkpersona_tasks_running', 'gauge', "Background tasks being run.", stats['running']),
+        ('inkpersona_tasks_failed', 'gauge', "Background tasks that failed every attempt (until purged).", stats['failed']),
+        ('inkpersona_task_wait_p50_seconds', 'gauge', "Median wait of tasks finished in the last hour.", stats['wait_p50']),
+        ('inkpersona_task_wait_p95_seconds', 'gauge', "95th percentile wait of tasks finished in the last hour.", stats['wait_p95']),
+        ('inkpersona_task_duration_p50_seconds', 'gauge', "Median run time of tasks finished in the last hour.", stats['duration_p50']),
+        ('inkpersona_task_duration_p95_seconds', 'gauge', "95th percentile run time of tasks finished in the last hour.", stats['duration_p95']),
+    ]
+
+
+class _ThreadRunner:
+    """Runs queued tasks in daemon threads of the current process (TASK_QUEUE['WORKER'] = 'thread')."""
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def wake(self):
+        """Starts the worker threads if needed and has them look for due tasks."""
+        with self._lock:
+            if not self._threads:
+                for i in range(_options()['THREADS']):
+                    thread = threading.Thread(target=self._work, name=f"task-worker-{i}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        self._wakeup.set()
+
+    def _work(self):
+        last_maintenance = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                    maintain_queue()
+                    last_maintenance = time.monotonic()
+                ran = run_next_task()
+            except Exception as e: # Database errors; keep the thread alive
+                logger.error(f"Task worker error: {e}", exc_info=True)
+                ran = False
+            if not ran:
+                # Idle threads shouldn't hold database connections
+                connections.close_all()
+                self._wakeup.wait(_options()['POLL_INTERVAL'])
+                self._wakeup.clear()
+
+
+_runner = _ThreadRunner()
@@ -0,0 +1,45 @@
+from django import template
+from django.utils.html import format_html
+
+from characters.renditions import rendition_url, renditions_are_current, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def character_picture(character, css_class='', sizes='100vw', loading='lazy'):
+    """
+    Renders a character's image as a <picture> offering the WebP and JPEG
+    renditions at every width, so the browser downloads only the size the
+    layout needs. Falls back to the original image until renditions exist.
+    """
+    if not renditions_are_current(character):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}">', character.image.url, character.name, css_class, loading
+        )
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" loading="{}" decoding="async">'
+        '</picture>',
+        srcset(character, 'webp'), sizes,
+        rendition_url(character, 'jpeg', 640), srcset(character, 'jpeg'), sizes,
+        character.image_renditions['width'], character.image_renditions['height'], character.name, css_class, loading,
+    )
+
+
+@register.simple_tag
+def character_background(character, min_width=1280):
+    """
+    CSS declarations setting a character's image as a background at least
+    min_width pixels wide, preferring WebP where image-set() supports it.
+    """
+    jpeg_url = rendition_url(character, 'jpeg', min_width)
+    if not renditions_are_current(character):
+        return format_html("background-image: url('{}');", jpeg_url)
+    webp_url = rendition_url(character, 'webp', min_width)
+    return format_html(
+        "background-image: url('{}'); "
+        "background-image: image-set(url('{}') type('image/webp'), url('{}') type('image/jpeg'));",
+        jpeg_url, webp_url, jpeg_url,
+    )
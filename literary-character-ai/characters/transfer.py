@@ -0,0 +1,219 @@
+"""
+Export and import of conversations as JSON Lines.
+
+An export is one JSON object per line: an "export" header, then every
+conversation, then every message, grouped by conversation and oldest first;
+archived messages (see archive.py) come first, in their own groups.
+Rows are read with iterator() and written as they are read, so exports of
+any size run in constant memory, whether to a file (`manage.py
+export_conversations`) or to the browser (/app/api/export/).
+
+Imports (`manage.py import_conversations`) match users by email (by
+username if they have none) and characters by name and book, and insert in
+batches within one transaction, so an import that fails part way leaves
+nothing behind. Conversations that already exist for the same user and
+character are skipped along with their messages, so an export can be
+imported again without duplicating anything. Rolling summaries aren't exported; they refer
+to message IDs and are rebuilt as the conversations continue.
+"""
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .archive import decode_messages
+from .backends import users_with_email
+from .models import LiteraryCharacter, Conversation, ChatMessage, MessageArchive
+
+FORMAT_VERSION = 1
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 5000
+
+
+def _line(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def export_jsonl(user=None):
+    """
+    Yields the JSONL lines of all conversations, or only those of user.
+    Messages are streamed from the ChatMessage(conversation, timestamp, id) index,
+    archived ones one blob at a time.
+    """
+    conversations = Conversation.objects.order_by('id')
+    archives = MessageArchive.objects.order_by('conversation_id', 'first_timestamp', 'first_message_id')
+    messages = ChatMessage.objects.order_by('conversation_id', 'timestamp', 'id')
+    if user is not None:
+        conversations = conversations.filter(user=user)
+        archives = archives.filter(conversation__user=user)
+        messages = messages.filter(conversation__user=user)
+
+    yield _line({'type': 'export', 'version': FORMAT_VERSION, 'exported_at': timezone.now().isoformat()})
+    conversation_rows = conversations.values_list(
+        'id', 'user__email', 'user__username', 'character__name', 'character__book',
+        'last_updated', 'message_count', 'last_message_preview',
+    )
+    for pk, email, username, name, book, last_updated, message_count, preview in conversation_rows.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield _line({
+            'type': 'conversation', 'id': pk, 'user': {'email': email, 'username': username},
+            'character': {'name': name, 'book': book},
+            'last_updated': last_updated.isoformat(), 'message_count': message_count, 'last_message_preview': preview,
+        })
+    for archive in archives.iterator(chunk_size=1):
+        for message in decode_messages(archive):
+            yield _message_line(message.conversation_id, message.message_text, message.is_user_message, message.timestamp)
+    message_rows = messages.values_list('conversation_id', 'message_text', 'is_user_message', 'timestamp')
+    for row in message_rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield _message_line(*row)
+
+
+def _message_line(conversation_id, text, is_user_message, timestamp):
+    return _line({
+        'type': 'message', 'conversation': conversation_id, 'text': text,
+        'is_user_message': is_user_message, 'timestamp': timestamp.isoformat(),
+    })
+
+
+class _Importer:
+    """Turns JSONL records into batched inserts, keeping only the ID mapping of conversations in memory."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.conversation_ids = {} # Exported ID -> new ID, or None if skipped
+        self.pending_conversations = []
+        self.pending_messages = []
+        self.users, self.characters = {}, {}
+        self.stats = {'conversations': 0, 'messages': 0, 'skipped_conversations': 0, 'skipped_messages': 0}
+
+    def _user_id(self, user):
+        key = (user['email'], user['username'])
+        if key not in self.users:
+            if user['email']:
+                users = users_with_email(user['email'])
+            else:
+                users = get_user_model().objects.filter(username=user['username'])
+            self.users[key] = users.order_by('id').values_list('id', flat=True).first()
+        return self.users[key]
+
+    def _character_id(self, character):
+        key = (character['name'], character['book'])
+        if key not in self.characters:
+            self.characters[key] = (
+                LiteraryCharacter.objects.filter(name=key[0], book=key[1]).order_by('id').values_list('id', flat=True).first()
+            )
+        return self.characters[key]
+
+    def add(self, record):
+        kind = record.get('type')
+        if kind == 'conversation':
+            self.pending_conversations.append(record)
+            if len(self.pending_conversations) >= self.batch_size:
+                self.flush_conversations()
+        elif kind == 'message':
+            if self.pending_conversations:
+                self.flush_conversations()
+            new_id = self.conversation_ids.get(record['conversation'])
+            if new_id is None:
+                self.stats['skipped_messages'] += 1
+                return
+            self.pending_messages.append((
+                new_id, record['text'], record['is_user_message'],
+                connection.ops.adapt_datetimefield_value(parse_datetime(record['timestamp'])),
+            ))
+            if len(self.pending_messages) >= self.batch_size:
+                self.flush_messages()
+        elif kind != 'export':
+            raise ValueError(f"Unknown record type: {kind!r}")
+
+    def flush_conversations(self):
+        records, self.pending_conversations = self.pending_conversations, []
+        resolved = []
+        for record in records:
+            user_id, character_id = self._user_id(record['user']), self._character_id(record['character'])
+            if user_id is None or character_id is None:
+                self.conversation_ids[record['id']] = None
+            else:
+                resolved.append((record, user_id, character_id))
+
+        existing = set()
+        if resolved:
+            existing = set(
+                Conversation.objects.filter(
+                    user_id__in={user_id for _, user_id, _ in resolved},
+                    character_id__in={character_id for _, _, character_id in resolved},
+                ).values_list('user_id', 'character_id')
+            )
+        new = []
+        for record, user_id, character_id in resolved:
+            if (user_id, character_id) in existing:
+                self.conversation_ids[record['id']] = None
+                continue
+            existing.add((user_id, character_id)) # Duplicates within the file are skipped too
+            new.append((record, Conversation(
+                user_id=user_id, character_id=character_id,
+                message_count=record['message_count'], last_message_preview=record['last_message_preview'],
+            )))
+
+        with transaction.atomic():
+            Conversation.objects.bulk_create([conversation for _, conversation in new])
+            # bulk_create sets the auto_now last_updated to now; restore the exported one
+            Conversation.objects.bulk_update([
+                self._with_last_updated(conversation, record) for record, conversation in new
+            ], ['last_updated'])
+        for record, conversation in new:
+            self.conversation_ids[record['id']] = conversation.pk
+        self.stats['conversations'] += len(new)
+        self.stats['skipped_conversations'] += len(records) - len(new)
+
+    @staticmethod
+    def _with_last_updated(conversation, record):
+        conversation.last_updated = parse_datetime(record['last_updated'])
+        return conversation
+
+    def flush_messages(self):
+        rows, self.pending_messages = self.pending_messages, []
+        if not rows:
+            return
+        # Inserted without the ORM: bulk_create would replace the exported
+        # timestamps with the current time (ChatMessage.timestamp is auto_now_add)
+        with transaction.atomic(), connection.cursor() as cursor: # One savepoint per batch, not per row
+            cursor.executemany(
+                f'INSERT INTO {ChatMessage._meta.db_table} (conversation_id, message_text, is_user_message, "timestamp") '
+                f'VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+        self.stats['messages'] += len(rows)
+
+
+def import_jsonl(lines, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Imports the conversations and messages of an export, given as an
+    iterable of lines. Returns counts of what was imported and skipped.
+    Raises ValueError on a malformed line or an unsupported format version,
+    in which case nothing is imported and the fixed file can be imported
+    from the start.
+    """
+    importer = _Importer(batch_size)
+    with transaction.atomic():
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {number} is not valid JSON: {e}") from e
+            if not isinstance(record, dict):
+                raise ValueError(f"Line {number} is not a JSON object")
+            if record.get('type') == 'export' and record.get('version') != FORMAT_VERSION:
+                raise ValueError(f"Unsupported export version {record.get('version')!r} (expected {FORMAT_VERSION})")
+            try:
+                importer.add(record)
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"Line {number} is not a valid {record.get('type')} record: {e!r}") from e
+        importer.flush_conversations()
+        importer.flush_messages()
+    return importer.stats
@@ -0,0 +1,605 @@
+"""
+Admission control for upstream LLM calls.
+
+get_backend() wraps the configured backend in a LimitedBackend, so every
+caller (the chat views and background summaries alike) shares one limiter
+per process, configured by the LLM_UPSTREAM_LIMITS setting:
+
+- at most MAX_CONCURRENCY calls run upstream at once; further calls wait in
+  a FIFO queue of at most MAX_QUEUE calls,
+- calls are admitted at RATE per second with bursts of up to BURST (a token
+  bucket, shared between processes through the SHARED_CACHE cache alias if
+  one is set),
+- rate limits, connection errors and 5xx responses are retried up to
+  MAX_RETRIES times with jittered exponential backoff, never sooner than the
+  upstream's Retry-After,
+- identical concurrent completion requests share a single upstream call.
+
+A call that cannot get an upstream response started within QUEUE_TIMEOUT
+seconds, queueing and retries included, fails with UpstreamBusyError, which
+the views report as 429 like an upstream rate limit. Bursts are thus
+smoothed into queueing delay instead of turning into errors straight away.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+
+from .llm import BaseLLMBackend, LLMConnectionError, LLMError, LLMRateLimitError, get_backend
+from .metrics import record_span, register_collector
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {500, 502, 503, 504}
+QUEUE_WAIT_SAMPLES = 1000 # Recent queue waits kept for percentiles
+
+
+class UpstreamBusyError(LLMRateLimitError):
+    """The limiter could not admit a call: the queue is full or its deadline passed."""
+
+
+# --- Rate Limiting ---
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilling at rate tokens per second up to burst.
+
+    reserve() takes a token if one is available or books the next one to be
+    refilled, and returns how long the caller has to wait before using it.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self, max_wait):
+        """
+        Returns the seconds to wait for the reserved token, or None without
+        reserving anything if the wait would exceed max_wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Tokens go negative as future ones are booked
+            ready_at = self._updated + max(0.0, (1 - self._tokens) / self.rate)
+            wait = max(0.0, ready_at - now)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    async def areserve(self, max_wait):
+        return self.reserve(max_wait)
+
+    def pause(self, seconds):
+        """Admits nothing new for the next seconds (e.g. after an upstream 429)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = max(self._updated, now + seconds)
+
+
+class CacheTokenBucket:
+    """
+    Token bucket approximation shared between processes through a Django
+    cache with atomic incr() (Redis, Memcached or the database cache): at
+    most burst calls are admitted per window of burst / rate seconds.
+    """
+
+    def __init__(self, rate, burst, cache_alias, key_prefix="characters:upstream-bucket"):
+        self.burst = max(1, int(burst))
+        self.window = self.burst / float(rate)
+        self.cache = caches[cache_alias]
+        self.key_prefix = key_prefix
+
+    def reserve(self, max_wait):
+        now = time.time() # Wall clock, so windows line up across processes
+        paused_until = self.cache.get(f"{self.key_prefix}:paused-until") or 0
+        window_index = int(max(now, paused_until) // self.window)
+        while True:
+            wait = max(0.0, window_index * self.window - now)
+            if wait > max_wait:
+                return None
+            key = f"{self.key_prefix}:{window_index}"
+            self.cache.add(key, 0, timeout=int(wait + self.window) + 1)
+            try:
+                admitted = self.cache.incr(key)
+            except ValueError: # Expired between add() and incr()
+                continue
+            if admitted <= self.burst:
+                return wait
+            window_index += 1
+
+    async def areserve(self, max_wait):
+        return await sync_to_async(self.reserve, thread_sensitive=False)(max_wait)
+
+    def pause(self, seconds):
+        paused_until = time.time() + seconds
+        self.cache.set(f"{self.key_prefix}:paused-until", paused_until, timeout=int(seconds) + 1)
+
+
+# --- Concurrency Limiting ---
+
+class _Waiter:
+    """A queued call. Released slots are handed to waiters directly, in FIFO order."""
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionQueue:
+    """
+    Semaphore of max_concurrency slots with a bounded FIFO queue, shared by
+    threads and event loops.
+    """
+
+    def __init__(self, max_concurrency, max_queue):
+        self.available = max_concurrency
+        self.max_queue = max_queue
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def _enter(self, waiter):
+        """Takes a free slot (returning True) or queues the waiter. Call with the lock held."""
+        if self.available > 0 and not self._waiters:
+            self.available -= 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            raise UpstreamBusyError("Too many chat requests are queued for the upstream service.")
+        self._waiters.append(waiter)
+        return False
+
+    def acquire(self, timeout):
+        waiter = _Waiter()
+        with self._lock:
+            if self._enter(waiter):
+                return
+        if waiter.event.wait(max(timeout, 0)):
+            return
+        with self._lock:
+            if waiter.granted: # Released right as the wait timed out
+                return
+            self._waiters.remove(waiter)
+        raise UpstreamBusyError("Timed out waiting for the upstream service.")
+
+    async def aacquire(self, timeout):
+        waiter = _Waiter(asyncio.get_running_loop())
+        with self._lock:
+            if self._enter(waiter):
+                return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max(timeout, 0))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                elif isinstance(e, asyncio.CancelledError):
+                    self._release()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            if not waiter.granted:
+                raise UpstreamBusyError("Timed out waiting for the upstream service.") from None
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            try:
+                waiter.wake()
+                return
+            except RuntimeError: # The waiter's event loop has been closed
+                continue
+        self.available += 1
+
+    def release(self):
+        with self._lock:
+            self._release()
+
+
+# --- Metrics ---
+
+class UpstreamStats:
+    """Counters and recent queue wait times of a LimitedBackend."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.total_wait = 0.0
+        self._recent_waits = deque(maxlen=QUEUE_WAIT_SAMPLES)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.admitted += 1
+            self.total_wait += seconds
+            self._recent_waits.append(seconds)
+        record_span('upstream_queue', seconds)
+
+    def record(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self):
+        """Returns the counters and p50/p95/max queue wait (seconds) of recent calls."""
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            snapshot = {
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'retries': self.retries,
+                'coalesced': self.coalesced,
+                'queue_wait_total': self.total_wait,
+            }
+        for name, pct in (('queue_wait_p50', 50), ('queue_wait_p95', 95)):
+            snapshot[name] = waits[int(pct / 100 * (len(waits) - 1))] if waits else 0.0
+        snapshot['queue_wait_max'] = waits[-1] if waits else 0.0
+        return snapshot
+
+
+# --- Limited Backend ---
+
+class _AdmittedStream:
+    """Token stream that frees its admission slot once closed."""
+
+    def __init__(self, token_stream, release):
+        self._token_stream = token_stream
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._token_stream)
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            try:
+                self._token_stream.close()
+            finally:
+                release()
+
+    # Streams dropped without being closed (e.g. a response that never started) still free their slot
+    __del__ = close
+
+
+class _AdmittedAsyncStream:
+    """Async counterpart of _AdmittedStream."""
+
+    def __init__(self, token_stream, release):
+        self._token_stream = token_stream
+        self._release = release
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._token_stream.__anext__()
+
+    async def aclose(self):
+        release, self._release = self._release, None
+        if release is not None:
+            try:
+                await self._token_stream.aclose()
+            finally:
+                release()
+
+    def __del__(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+def _coalescing_key(messages, temperature, max_tokens):
+    payload = json.dumps([messages, temperature, max_tokens], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _Flight:
+    """An upstream completion shared by identical concurrent calls."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LimitedBackend(BaseLLMBackend):
+    """
+    Wraps a backend with the admission control described in the module
+    docstring. Attributes it does not define are read from the wrapped
+    backend (e.g. FakeBackend.peak_in_flight).
+    """
+
+    def __init__(self, backend, max_concurrency=16, rate=0, burst=10, max_queue=200, queue_timeout=15.0,
+                 max_retries=2, backoff=0.5, max_backoff=10.0, shared_cache=None, coalesce=True):
+        super().__init__(backend.model)
+        self.backend = backend
+        self.queue = AdmissionQueue(max_concurrency, max_queue) if max_concurrency else None
+        if not rate:
+            self.bucket = None
+        elif shared_cache:
+            self.bucket = CacheTokenBucket(rate, burst, shared_cache)
+        else:
+            self.bucket = TokenBucket(rate, burst)
+        self.queue_timeout = float(queue_timeout)
+        self.max_retries = int(max_retries)
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.coalesce = coalesce
+        self.stats = UpstreamStats()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, backend, limits):
+        """Builds the limiter from an LLM_UPSTREAM_LIMITS dict (upper-case keys)."""
+        return cls(backend, **{name.lower(): value for name, value in limits.items()})
+
+    def __getattr__(self, name):
+        if name == 'backend':
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    # --- Admission ---
+
+    def _release(self):
+        if self.queue is not None:
+            self.queue.release()
+
+    def _rejected(self, message):
+        self.stats.record('rejected')
+        logger.warning(f"Upstream call rejected by the limiter: {message}")
+
+    def _admit(self, deadline):
+        """Waits for a concurrency slot and a rate token. The caller must _release() afterwards."""
+        started = time.monotonic()
+        try:
+            if self.queue is not None:
+                self.queue.acquire(deadline - started)
+        except UpstreamBusyError as e:
+            self._rejected(e.message)
+            raise
+        try:
+            if self.bucket is not None:
+                wait = self.bucket.reserve(deadline - time.monotonic())
+                if wait is None:
+                    raise UpstreamBusyError("Timed out waiting for the upstream rate limit.")
+                time.sleep(wait)
+        except UpstreamBusyError as e:
+            self._release()
+            self._rejected(e.message)
+            raise
+        except BaseException:
+            self._release()
+            raise
+        self.stats.record_wait(time.monotonic() - started)
+
+    async def _aadmit(self, deadline):
+        started = time.monotonic()
+        try:
+            if self.queue is not None:
+                await self.queue.aacquire(deadline - started)
+        except UpstreamBusyError as e:
+            self._rejected(e.message)
+            raise
+        try:
+            if self.bucket is not None:
+                wait = await self.bucket.areserve(deadline - time.monotonic())
+                if wait is None:
+                    raise UpstreamBusyError("Timed out waiting for the upstream rate limit.")
+                await asyncio.sleep(wait)
+        except UpstreamBusyError as e:
+            self._release()
+            self._rejected(e.message)
+            raise
+        except BaseException:
+            self._release()
+            raise
+        self.stats.record_wait(time.monotonic() - started)
+
+    # --- Retries ---
+
+    def _retry_delay(self, error, attempt, deadline):
+        """Returns how long to wait before retrying after error, or None to give up."""
+        if isinstance(error, LLMRateLimitError):
+            if error.retry_after and self.bucket is not None:
+                self.bucket.pause(error.retry_after) # Hold back other callers too
+        elif not isinstance(error, LLMConnectionError) and error.status_code not in RETRYABLE_STATUS_CODES:
+            return None
+        if attempt >= self.max_retries:
+            return None
+
+        # Full jitter spreads out the retries of calls that failed together
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after:
+            delay += retry_after
+        if time.monotonic() + delay > deadline:
+            return None
+        return delay
+
+    def _call_with_retries(self, call, deadline):
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except LLMError as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                self.stats.record('retries')
+                logger.info(f"Retrying upstream call in {delay:.2f}s after error (attempt {attempt}): {e}")
+                time.sleep(delay)
+
+    async def _acall_with_retries(self, call, deadline):
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except LLMError as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                self.stats.record('retries')
+                logger.info(f"Retrying upstream call in {delay:.2f}s after error (attempt {attempt}): {e}")
+                await asyncio.sleep(delay)
+
+    # --- Backend Interface ---
+
+    def _complete(self, messages, temperature, max_tokens):
+        deadline = time.monotonic() + self.queue_timeout
+        self._admit(deadline)
+        try:
+            return self._call_with_retries(
+                lambda: self.backend.complete(messages, temperature, max_tokens), deadline
+            )
+        finally:
+            self._release()
+
+    def complete(self, messages, temperature, max_tokens):
+        if not self.coalesce:
+            return self._complete(messages, temperature, max_tokens)
+
+        key = _coalescing_key(messages, temperature, max_tokens)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            self.stats.record('coalesced')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._complete(messages, temperature, max_tokens)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def _acomplete(self, messages, temperature, max_tokens):
+        deadline = time.monotonic() + self.queue_timeout
+        await self._aadmit(deadline)
+        try:
+            return await self._acall_with_retries(
+                lambda: self.backend.acomplete(messages, temperature, max_tokens), deadline
+            )
+        finally:
+            self._release()
+
+    async def acomplete(self, messages, temperature, max_tokens):
+        if not self.coalesce:
+            return await self._acomplete(messages, temperature, max_tokens)
+
+        # The shared call runs as its own task, so it completes for the other
+        # callers even if the one that started it is cancelled
+        loop = asyncio.get_running_loop()
+        key = (loop, _coalescing_key(messages, temperature, max_tokens))
+        with self._flights_lock:
+            task = self._flights.get(key)
+            if task is None:
+                task = self._flights[key] = loop.create_task(self._acomplete(messages, temperature, max_tokens))
+                task.add_done_callback(lambda done: self._end_async_flight(key, done))
+            else:
+                self.stats.record('coalesced')
+        return await asyncio.shield(task)
+
+    def _end_async_flight(self, key, task):
+        with self._flights_lock:
+            if self._flights.get(key) is task:
+                del self._flights[key]
+        if not task.cancelled():
+            task.exception() # Mark as retrieved in case every caller was cancelled
+
+    def stream(self, messages, temperature, max_tokens):
+        # Streams are not coalesced; retries only cover errors before the first token
+        deadline = time.monotonic() + self.queue_timeout
+        self._admit(deadline)
+        try:
+            token_stream = self._call_with_retries(
+                lambda: self.backend.stream(messages, temperature, max_tokens), deadline
+            )
+        except BaseException:
+            self._release()
+            raise
+        return _AdmittedStream(token_stream, self._release)
+
+    async def astream(self, messages, temperature, max_tokens):
+        deadline = time.monotonic() + self.queue_timeout
+        await self._aadmit(deadline)
+        try:
+            token_stream = await self._acall_with_retries(
+                lambda: self.backend.astream(messages, temperature, max_tokens), deadline
+            )
+        except BaseException:
+            self._release()
+            raise
+        return _AdmittedAsyncStream(token_stream, self._release)
+
+
+@register_collector
+def _upstream_metrics():
+    """Exports the limiter stats of the process-wide backend, if it was built and is limited."""
+    # Checked first so a scrape never builds the backend (and imports its SDK) in a process that doesn't chat
+    if not get_backend.cache_info().currsize:
+        return []
+    stats = getattr(get_backend(), 'stats', None)
+    if stats is None:
+        return []
+    snapshot = stats.snapshot()
+    return [
+        ('inkpersona_upstream_admitted_total', 'counter', "Upstream calls admitted by the limiter.", snapshot['admitted']),
+        ('inkpersona_upstream_rejected_total', 'counter', "Upstream calls rejected by the limiter.", snapshot['rejected']),
+        ('inkpersona_upstream_retries_total', 'counter', "Upstream calls retried after an error.", snapshot['retries']),
+        ('inkpersona_upstream_coalesced_total', 'counter', "Calls served by an identical in-flight call.", snapshot['coalesced']),
+        ('inkpersona_upstream_queue_wait_seconds_total', 'counter', "Total time calls waited for admission.", snapshot['queue_wait_total']),
+        ('inkpersona_upstream_queue_wait_p50_seconds', 'gauge', "Median admission wait of recent calls.", snapshot['queue_wait_p50']),
+        ('inkpersona_upstream_queue_wait_p95_seconds', 'gauge', "95th percentile admission wait of recent calls.", snapshot['queue_wait_p95']),
+    ]
@@ -1,7 +1,17 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from . import api
 
+if settings.CHAT_ASYNC_API:
+    # Same URLs and payloads, served by the async views under ASGI
+    from . import async_api
+    chat_view = async_api.achat_with_character
+    chat_stream_view = async_api.achat_with_character_stream
+else:
+    chat_view = api.chat_with_character
+    chat_stream_view = api.chat_with_character_stream
+
 app_name = 'characters'
 
 urlpatterns = [
@@ -9,5 +19,9 @@ urlpatterns = [
     path('<int:character_id>/', views.character_detail, name='character_detail'),
     path('history/', views.conversation_history, name='conversation_history'), 
     path('conversation/<int:conversation_id>/delete/', views.delete_conversation, name='delete_conversation'),
-    path('api/chat/', api.chat_with_character, name='chat_with_character'),
+    path('api/chat/', chat_view, name='chat_with_character'),
+    path('api/chat/stream/', chat_stream_view, name='chat_with_character_stream'),
+    path('api/history/<int:character_id>/', api.chat_history, name='chat_history'),
+    path('api/search/', api.search, name='search'),
+    path('api/export/', api.export_conversations, name='export_conversations'),
 ]
@@ -1,35 +1,51 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LogoutView as BaseLogoutView
+from django.core.paginator import Paginator
 from django.urls import reverse
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.http import require_POST
+from .catalog import catalog_version, character_cards, characters_with_images, random_characters_with_images
 from .models import LiteraryCharacter, Conversation
 from .forms import CustomUserCreationForm
+from .greetings import pooled_greeting
+from .history import history_page
+from .metrics import render_metrics
+# Imported for the metrics collectors they register
+from . import completion_cache, tasks, upstream # noqa: F401
+
+CONVERSATIONS_PER_PAGE = 20
 
 
 def landing_page(request):
     """Displays the landing page with a selection of characters."""
-    characters_with_images = LiteraryCharacter.objects.exclude(image__isnull=True).exclude(image__exact='')
-    return render(request, 'landing_page.html', {'characters': characters_with_images})
+    return render(request, 'landing_page.html', {'characters': characters_with_images()})
 
 def character_list(request):
     """Displays a list of all available characters."""
-    characters = LiteraryCharacter.objects.all()
-    return render(request, 'characters/character_list.html', {'characters': characters})
+    # The queryset is only evaluated when the cached character cards fragment is stale
+    return render(request, 'characters/character_list.html', {
+        'characters': character_cards(),
+        'catalog_version': catalog_version(),
+    })
 
 @login_required
 def character_detail(request, character_id):
     """Displays the chat interface for a specific character, loading history if available."""
     character = get_object_or_404(LiteraryCharacter, pk=character_id)
     message_history = []
+    history_cursor = None
     is_new_conversation = request.GET.get('new') == 'true'
 
     if not is_new_conversation:
         try:
-            # Attempt to load existing conversation history
+            # Attempt to load existing conversation history; only the latest page is
+            # rendered, older pages are fetched from the history API on scroll
             conversation = Conversation.objects.get(user=request.user, character=character)
-            message_history = conversation.messages.all().order_by('timestamp')
+            message_history, history_cursor = history_page(conversation)
         except Conversation.DoesNotExist:
             # No previous conversation exists, history remains empty
             pass
@@ -37,7 +53,10 @@ def character_detail(request, character_id):
     context = {
         'character': character,
         'message_history': message_history,
+        'history_cursor': history_cursor,
         'is_new_conversation': is_new_conversation,
+        # Display-only: the greeting isn't saved to the conversation
+        'greeting': None if message_history else pooled_greeting(character),
     }
     return render(request, 'characters/character_detail.html', context)
 
@@ -57,10 +76,19 @@ def signup(request):
 
 @login_required
 def conversation_history(request):
-    """Displays a list of the user's past conversations."""
-    user_conversations = Conversation.objects.filter(user=request.user).order_by('-last_updated')
+    """Displays a page of the user's past conversations."""
+    # One query per page whatever its length: the character comes from a join and the
+    # message count and preview are denormalized onto the conversation
+    user_conversations = (
+        Conversation.objects.filter(user=request.user)
+        .select_related('character')
+        .only('id', 'last_updated', 'message_count', 'last_message_preview', 'character__id', 'character__name')
+        .order_by('-last_updated', '-id')
+    )
+    page = Paginator(user_conversations, CONVERSATIONS_PER_PAGE).get_page(request.GET.get('page'))
     context = {
-        'conversations': user_conversations,
+        'conversations': page,
+        'page': page,
     }
     return render(request, 'characters/conversation_history.html', context)
 
@@ -73,6 +101,18 @@ def delete_conversation(request, conversation_id):
     conversation.delete()
     return redirect(reverse('characters:conversation_history'))
 
+def metrics(request):
+    """
+    Serves the application metrics in the Prometheus text format, to scrapers
+    that send METRICS_TOKEN. Without a token it is only served with DEBUG on.
+    """
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        raise Http404
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 class CustomLogoutView(BaseLogoutView):
     """Customizes the logout view to display characters on the logged-out page."""
     template_name = 'registration/logged_out.html'
@@ -82,6 +122,6 @@ class CustomLogoutView(BaseLogoutView):
     def get_context_data(self, **kwargs):
         """Adds character data to the context for the logout page slideshow."""
         context = super().get_context_data(**kwargs)
-        # Fetch a few random characters with images for the animation
-        context['characters'] = LiteraryCharacter.objects.filter(image__isnull=False).order_by('?')[:4]
+        # Pick a few random characters with images for the animation
+        context['characters'] = random_characters_with_images(4)
         return context
@@ -1,9 +1,12 @@
 # literary_character_project/settings.py
 
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
 
+from .database import database_config
+
 # Load environment variables from .env file in the project root
 load_dotenv()
 
@@ -33,6 +36,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'characters.staticfiles.StaticFilesMiddleware', # Serves static and media files before any other work
+    'characters.middleware.MetricsMiddleware', # Next, so latency includes the other middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware', # Manages sessions across requests
     'django.middleware.common.CommonMiddleware',
@@ -65,11 +70,11 @@ WSGI_APPLICATION = 'literary_character_project.wsgi.application'
 
 # --- Database ---
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite (db.sqlite3) unless DATABASE_URL points elsewhere, e.g. at PostgreSQL
+# for production. Connection reuse, pooling and SQLite tuning are configured
+# through environment variables described in database.py.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3', # Simple SQLite DB for development
-    }
+    'default': database_config(os.getenv('DATABASE_URL'), BASE_DIR / 'db.sqlite3'),
 }
 
 
@@ -98,6 +103,21 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static'] # Directories to find static files
 STATIC_ROOT = BASE_DIR / 'staticfiles' # Directory where collectstatic gathers files for production
 
+# With DEBUG off, collectstatic writes content-hashed and precompressed copies
+# that {% static %} links to (see characters/staticfiles.py); run it on every
+# deploy. Install the brotli package to get Brotli variants next to gzip.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'characters.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# With DEBUG off, StaticFilesMiddleware serves STATIC_ROOT and MEDIA_ROOT with
+# long-lived cache headers. Turn this off when a web server or CDN serves them.
+SERVE_STATIC_FILES = os.getenv('SERVE_STATIC_FILES', 'True') == 'True'
+
 # Media files (User-uploaded content)
 # https://docs.djangoproject.com/en/5.2/topics/files/
 MEDIA_URL = '/media/'
@@ -110,10 +130,145 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 # --- API Keys ---
-# GROQ_API_KEY is loaded via load_dotenv() and used directly by the groq library instance in api.py
+# GROQ_API_KEY is loaded via load_dotenv() and used directly by the groq library in characters/llm.py
 # OPENAI_API_KEY = os.getenv('OPENAI_API_KEY') # No longer needed
 
 
+# --- Chat Service ---
+# Upstream LLM used by the chat API (see characters/llm.py). Set
+# LLM_BACKEND=characters.llm.FakeBackend to benchmark without network access;
+# its latency, token rate and error rates are set through LLM_BACKEND_OPTIONS,
+# e.g. '{"latency": 0.8, "tokens_per_second": 40, "rate_limit_rate": 0.05}'.
+# For the Groq backend they set the timeouts and the connection pool, e.g.
+# '{"timeout": 30, "connect_timeout": 3, "max_keepalive_connections": 32}'.
+LLM_BACKEND = {
+    'BACKEND': os.getenv('LLM_BACKEND', 'characters.llm.GroqBackend'),
+    'MODEL': os.getenv('GROQ_MODEL', 'llama3-8b-8192'),
+    'OPTIONS': json.loads(os.getenv('LLM_BACKEND_OPTIONS', '{}')),
+}
+
+# Admission control around upstream LLM calls (see characters/upstream.py).
+# Calls beyond LLM_MAX_CONCURRENCY wait in a queue of up to LLM_MAX_QUEUE
+# calls, and are admitted at LLM_RATE_LIMIT calls per second (0 for no limit)
+# with bursts of LLM_RATE_BURST. A call that cannot be started within
+# LLM_QUEUE_TIMEOUT seconds, retries included, fails with a 429. Set
+# LLM_RATE_LIMIT_CACHE to a shared cache alias to apply the rate limit across
+# processes.
+LLM_UPSTREAM_LIMITS = {
+    'MAX_CONCURRENCY': int(os.getenv('LLM_MAX_CONCURRENCY', '16')), # 0 for no limit
+    'RATE': float(os.getenv('LLM_RATE_LIMIT', '0')),
+    'BURST': int(os.getenv('LLM_RATE_BURST', '10')),
+    'MAX_QUEUE': int(os.getenv('LLM_MAX_QUEUE', '200')),
+    'QUEUE_TIMEOUT': float(os.getenv('LLM_QUEUE_TIMEOUT', '15')),
+    'MAX_RETRIES': int(os.getenv('LLM_MAX_RETRIES', '2')),
+    'SHARED_CACHE': os.getenv('LLM_RATE_LIMIT_CACHE') or None,
+}
+
+# Serve the chat API with the async views in characters/async_api.py. Enable this
+# when running the project through asgi.py (e.g. `uvicorn literary_character_project.asgi:application`)
+# so slow upstream calls don't each hold a worker.
+CHAT_ASYNC_API = os.getenv('CHAT_ASYNC_API', 'False') == 'True'
+
+# Context window of GROQ_MODEL in tokens. The prompt (system prompt, summary,
+# history and the user's message) is packed to fit it minus the reply tokens.
+CHAT_CONTEXT_WINDOW = int(os.getenv('CHAT_CONTEXT_WINDOW', '8192'))
+
+# Token budget for the previous turns sent with each chat request. Older turns
+# are folded into a per-conversation rolling summary once at least
+# CHAT_SUMMARY_BATCH_MESSAGES of them have fallen out of the budget.
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '1500'))
+CHAT_SUMMARY_BATCH_MESSAGES = int(os.getenv('CHAT_SUMMARY_BATCH_MESSAGES', '10'))
+
+# `python manage.py archive_messages` moves messages older than
+# CHAT_ARCHIVE_AFTER_DAYS that are already folded into the summary to
+# compressed archive blobs (see characters/archive.py), still shown when
+# scrolling back. `python manage.py purge_messages` deletes messages older than
+# CHAT_RETENTION_DAYS (0 keeps them forever). Run both daily, e.g. from cron.
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', '30'))
+CHAT_RETENTION_DAYS = int(os.getenv('CHAT_RETENTION_DAYS', '0'))
+
+# Completion cache for characters with "cache responses" enabled (see
+# characters/completion_cache.py). Conversations of up to
+# CHAT_COMPLETION_CACHE_TURNS messages are keyed loosely, so repeated openers
+# skip the upstream call; longer ones only match an identical prompt.
+CHAT_COMPLETION_CACHE_ALIAS = 'completions'
+CHAT_COMPLETION_CACHE_TURNS = int(os.getenv('CHAT_COMPLETION_CACHE_TURNS', '3'))
+
+
+# --- Background Tasks ---
+# Work deferred off the request path (conversation summaries) is queued in the
+# Task table, see characters/tasks.py. With TASK_WORKER=thread each web process
+# runs it in THREADS background threads; with TASK_WORKER=external run
+# `python manage.py run_tasks` instead. Failed tasks are retried after
+# RETRY_DELAY seconds, doubling per attempt; tasks running longer than TIMEOUT
+# seconds are assumed lost and requeued; finished tasks are kept for RETENTION seconds.
+TASK_QUEUE = {
+    'WORKER': os.getenv('TASK_WORKER', 'thread'),
+    'THREADS': int(os.getenv('TASK_THREADS', '2')),
+    'POLL_INTERVAL': float(os.getenv('TASK_POLL_INTERVAL', '5')),
+    'RETRY_DELAY': float(os.getenv('TASK_RETRY_DELAY', '10')),
+    'TIMEOUT': int(os.getenv('TASK_TIMEOUT', '600')),
+    'RETENTION': int(os.getenv('TASK_RETENTION', str(60 * 60 * 24))),
+}
+
+
+# --- Metrics ---
+# Per-process request latency, chat phase, token, error, cache and queue
+# metrics are served at /metrics in the Prometheus text format (see
+# characters/metrics.py) to scrapers that send METRICS_TOKEN as
+# "Authorization: Bearer <token>". With no token set the endpoint is public
+# when DEBUG is on and answers 404 when it is off.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+
+# --- Caches ---
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# LocMemCache is per process and evicts the least recently used entries
+# (1/CULL_FREQUENCY of them) once MAX_ENTRIES is reached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'completions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'completions',
+        'TIMEOUT': int(os.getenv('CHAT_COMPLETION_CACHE_TIMEOUT', str(60 * 60 * 24))),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CHAT_COMPLETION_CACHE_MAX_ENTRIES', '5000')),
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+
+# --- Sessions ---
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/
+# SESSION_STORE picks where sessions live:
+#   db         one SELECT on django_session per authenticated request (default)
+#   cached_db  written to the database and the 'sessions' cache, read from the cache
+#   cache      the 'sessions' cache only; sessions are lost when it is cleared or culls them
+# SESSION_CACHE_BACKEND is locmem (per process: only for a single worker, as a
+# logout in one process leaves the session cached in the others), file (shared
+# by the workers of one server; SESSION_CACHE_LOCATION is the directory) or
+# redis (shared by all servers, requires the redis package;
+# SESSION_CACHE_LOCATION is the server URL).
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.getenv('SESSION_STORE', 'db')
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_CACHE_BACKEND = os.getenv('SESSION_CACHE_BACKEND', 'locmem')
+SESSION_CACHE_BACKENDS = { # Name -> (backend, default location)
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'sessions'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache' / 'sessions')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+CACHES[SESSION_CACHE_ALIAS] = {
+    'BACKEND': SESSION_CACHE_BACKENDS[SESSION_CACHE_BACKEND][0],
+    'LOCATION': os.getenv('SESSION_CACHE_LOCATION', SESSION_CACHE_BACKENDS[SESSION_CACHE_BACKEND][1]),
+}
+if SESSION_CACHE_BACKEND != 'redis': # Redis evicts by its own maxmemory policy
+    # Culling drops sessions at random, logging their users out
+    CACHES[SESSION_CACHE_ALIAS]['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '100000'))}
+
+
 # --- Django REST Framework ---
 # https://www.django-rest-framework.org/api-guide/settings/
 REST_FRAMEWORK = {
@@ -134,6 +289,11 @@ AUTHENTICATION_BACKENDS = [
     'characters.backends.EmailBackend', # Use our email backend first
     'django.contrib.auth.backends.ModelBackend', # Keep default backend for admin login etc.
 ]
+# Seconds EmailBackend caches the user loaded on every authenticated request
+# (0 disables the cache). Saving a user drops it from this process's cache;
+# other processes can see the old user for up to this long unless CACHES
+# 'default' is shared between them.
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', '60'))
 
 
 # --- Logging Configuration (Optional but Recommended) ---
@@ -4,7 +4,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
-from characters.views import landing_page, signup, CustomLogoutView
+from characters.views import landing_page, metrics, signup, CustomLogoutView
 from characters.forms import EmailLoginForm
 
 urlpatterns = [
@@ -15,6 +15,7 @@ urlpatterns = [
 
     # Site-wide pages
     path('', landing_page, name='landing_page'),
+    path('metrics', metrics, name='metrics'), # Prometheus scrape endpoint
 
     # Authentication URLs
     path('accounts/signup/', signup, name='signup'), # Custom signup view